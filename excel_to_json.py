@@ -2,20 +2,376 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
+import argparse
+import hashlib
 import json
 import os
-import sys
+import zipfile
+import xml.etree.ElementTree as ET
 
-def excel_to_json(excel_file_path, output_file=None):
+# 讀取引擎: "pandas" 從同一個已打開的ExcelFile逐個解析sheet，
+# "stream" 使用openpyxl唯讀模式逐行讀取，不建立DataFrame
+ENGINES = ("pandas", "stream")
+
+# 輸出格式: "indent" 與舊版相同的縮進JSON，"compact" 無空白的JSON，
+# "jsonl" 每行一條 {"sheet": 名稱, "row": 行數據} 記錄 (JSON Lines)
+OUTPUT_FORMATS = ("indent", "compact", "jsonl")
+
+# 概要中每個sheet保留的示例行數
+SUMMARY_HEAD_ROWS = 3
+
+# 增量轉換清單: 記錄每個sheet的內容哈希及其在輸出文件中的字節範圍
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+
+def _clean_value(value):
+    # 將NaN值替換為None，這樣在JSON中顯示為null
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+def _iter_sheets_pandas(xlsx, sheet_names=None):
+    """從已打開的ExcelFile依次產生 (sheet名稱, 列名, 行迭代器)，不重新打開文件"""
+    for sheet_name in xlsx.sheet_names:
+        if sheet_names is not None and sheet_name not in sheet_names:
+            continue
+        df = xlsx.parse(sheet_name)
+        columns = [str(c) for c in df.columns]
+        rows = (tuple(_clean_value(v) for v in row)
+                for row in df.itertuples(index=False, name=None))
+        yield sheet_name, columns, rows
+
+def _header_names(header, width):
+    # 與pandas一致: 空白標題命名為"Unnamed: i"，重複標題加上".n"後綴
+    names = []
+    seen = {}
+    for i in range(width):
+        value = header[i] if i < len(header) else None
+        name = f"Unnamed: {i}" if value is None or value == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _iter_sheets_stream(excel_file_path, sheet_names=None):
+    """使用openpyxl唯讀模式逐個sheet讀取，每次只在內存中保留一個sheet的行元組"""
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(excel_file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            if sheet_names is not None and worksheet.title not in sheet_names:
+                continue
+            rows = []
+            width = 0
+            last_non_empty = -1
+            for row in worksheet.iter_rows(values_only=True):
+                # 去掉行尾的空單元格 (工作表尺寸可能包含沒有數據的列)
+                end = len(row)
+                while end > 0 and (row[end - 1] is None or row[end - 1] == ""):
+                    end -= 1
+                rows.append(row[:end])
+                if end:
+                    width = max(width, end)
+                    last_non_empty = len(rows) - 1
+            
+            # 去掉表尾的空行
+            rows = rows[:last_non_empty + 1]
+            if not rows:
+                yield worksheet.title, [], iter(())
+                continue
+            
+            columns = _header_names(rows[0], width)
+            data_rows = (tuple(r) + (None,) * (width - len(r)) for r in rows[1:])
+            yield worksheet.title, columns, data_rows
+    finally:
+        workbook.close()
+
+class _RawSheet:
+    """增量轉換中未變化的sheet: 直接複製上次輸出中的字節，不重新讀取Excel"""
+    
+    def __init__(self, name, data, info):
+        self.name = name
+        self.data = data
+        self.info = info
+
+class _SheetWriter:
     """
-    將Excel文件轉換為JSON格式
+    逐個sheet、逐行寫出數據到二進制文件，同時記錄:
+    - summary: 每個sheet的行數、列名和前幾行，作為轉換概要
+    - chunks: 每個sheet在輸出文件中的字節範圍，供增量轉換複製未變化的sheet
+    """
+    
+    def __init__(self, f):
+        self.f = f
+        self.pos = 0
+        self.summary = {}
+        self.chunks = {}
+    
+    def _emit(self, text):
+        if text:
+            data = text.encode('utf-8')
+            self.f.write(data)
+            self.pos += len(data)
+    
+    def write(self, sheets):
+        self._emit(self.begin())
+        for index, sheet in enumerate(sheets):
+            self._emit(self.separator(index))
+            start = self.pos
+            if isinstance(sheet, _RawSheet):
+                sheet_name, info = sheet.name, sheet.info
+                self.f.write(sheet.data)
+                self.pos += len(sheet.data)
+            else:
+                sheet_name, columns, rows = sheet
+                info = {"rows": 0, "columns": list(columns), "head": []}
+                self._emit(self.begin_sheet(sheet_name))
+                for row in rows:
+                    record = dict(zip(columns, row))
+                    if info["rows"] < SUMMARY_HEAD_ROWS:
+                        info["head"].append(record)
+                    self._emit(self.row(record, info["rows"] == 0))
+                    info["rows"] += 1
+                self._emit(self.end_sheet(info["rows"] == 0))
+            self.summary[sheet_name] = info
+            self.chunks[sheet_name] = (start, self.pos)
+        self._emit(self.end(not self.summary))
+        return self.summary
+    
+    def begin(self):
+        return ""
+    
+    def separator(self, index):
+        return ""
+    
+    def begin_sheet(self, sheet_name):
+        return ""
+    
+    def row(self, record, first):
+        raise NotImplementedError
+    
+    def end_sheet(self, empty):
+        return ""
+    
+    def end(self, empty):
+        return ""
+
+class _IndentedJsonWriter(_SheetWriter):
+    """輸出與 json.dump(all_data, indent=4) 完全相同，但不需要先在內存中建立所有數據"""
+    
+    def begin(self):
+        return "{"
+    
+    def separator(self, index):
+        return "\n" if index == 0 else ",\n"
+    
+    def begin_sheet(self, sheet_name):
+        return f"    {json.dumps(sheet_name, ensure_ascii=False)}: ["
+    
+    def row(self, record, first):
+        text = json.dumps(record, ensure_ascii=False, indent=4, default=str)
+        return ("\n        " if first else ",\n        ") + text.replace("\n", "\n        ")
+    
+    def end_sheet(self, empty):
+        return "]" if empty else "\n    ]"
+    
+    def end(self, empty):
+        return "}" if empty else "\n}"
+
+class _CompactJsonWriter(_SheetWriter):
+    """無縮進、無多餘空白的JSON，結構與縮進版相同"""
+    
+    SEPARATORS = (",", ":")
+    
+    def begin(self):
+        return "{"
+    
+    def separator(self, index):
+        return "" if index == 0 else ","
+    
+    def begin_sheet(self, sheet_name):
+        return json.dumps(sheet_name, ensure_ascii=False) + ":["
+    
+    def row(self, record, first):
+        text = json.dumps(record, ensure_ascii=False, separators=self.SEPARATORS, default=str)
+        return text if first else "," + text
+    
+    def end_sheet(self, empty):
+        return "]"
+    
+    def end(self, empty):
+        return "}"
+
+class _JsonLinesWriter(_SheetWriter):
+    """每行一條記錄，空的sheet寫一條row為null的記錄以保留sheet名稱"""
+    
+    SEPARATORS = (",", ":")
+    
+    def begin_sheet(self, sheet_name):
+        self.sheet_key = json.dumps(sheet_name, ensure_ascii=False)
+        return ""
+    
+    def row(self, record, first):
+        row = json.dumps(record, ensure_ascii=False, separators=self.SEPARATORS, default=str)
+        return f'{{"sheet":{self.sheet_key},"row":{row}}}\n'
+    
+    def end_sheet(self, empty):
+        return f'{{"sheet":{self.sheet_key},"row":null}}\n' if empty else ""
+
+_WRITERS = {
+    "indent": _IndentedJsonWriter,
+    "compact": _CompactJsonWriter,
+    "jsonl": _JsonLinesWriter,
+}
+
+_XLSX_NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+_XLSX_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_XLSX_CELL = f"{{{_XLSX_NS['main']}}}c"
+_XLSX_VALUE = f"{{{_XLSX_NS['main']}}}v"
+_XLSX_TEXT = f"{{{_XLSX_NS['main']}}}t"
+# 共享字符串、內嵌字符串和公式字符串結果都視為同一種類型
+_XLSX_STRING_TYPES = ("s", "inlineStr", "str")
+
+def _hash_sheet_xml(sheet_file, shared_strings):
+    """
+    按單元格內容計算sheet哈希: (單元格位置, 類型, 解析後的值)
+    不包含樣式和共享字符串的索引，重新保存工作簿或其他sheet新增字符串都不會改變哈希
+    """
+    digest = hashlib.sha256()
+    for _, cell in ET.iterparse(sheet_file):
+        if cell.tag != _XLSX_CELL:
+            continue
+        cell_type = cell.get("t", "n")
+        if cell_type == "inlineStr":
+            value = "".join(t.text or "" for t in cell.iter(_XLSX_TEXT))
+        else:
+            v = cell.find(_XLSX_VALUE)
+            value = v.text if v is not None and v.text is not None else ""
+            if cell_type == "s" and value:
+                value = shared_strings[int(value)]
+        if cell_type in _XLSX_STRING_TYPES:
+            cell_type = "s"
+        if value != "":
+            digest.update(f"{cell.get('r')}\x1f{cell_type}\x1f{value}\x1e".encode('utf-8'))
+        cell.clear()
+    return digest.hexdigest()
+
+def _xlsx_sheet_hashes(excel_file_path):
+    """
+    直接從.xlsx壓縮包計算每個sheet的內容哈希，只做輕量的XML掃描，不經過pandas/openpyxl
+    
+    返回:
+        dict: sheet名稱 -> 哈希 (按工作簿順序)，不是.xlsx文件時返回None
+    """
+    if not zipfile.is_zipfile(excel_file_path):
+        return None
+    
+    with zipfile.ZipFile(excel_file_path) as z:
+        names = set(z.namelist())
+        
+        # 共享字符串表
+        shared_strings = []
+        if "xl/sharedStrings.xml" in names:
+            root = ET.fromstring(z.read("xl/sharedStrings.xml"))
+            for si in root.findall("main:si", _XLSX_NS):
+                shared_strings.append("".join(t.text or "" for t in si.iter(_XLSX_TEXT)))
+        
+        # sheet名稱 -> XML路徑
+        rels = ET.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+        targets = {}
+        for rel in rels.findall("rel:Relationship", _XLSX_NS):
+            target = rel.get("Target").lstrip("/")
+            if not target.startswith("xl/"):
+                target = "xl/" + target
+            targets[rel.get("Id")] = target
+        
+        workbook = ET.fromstring(z.read("xl/workbook.xml"))
+        hashes = {}
+        for sheet in workbook.findall("main:sheets/main:sheet", _XLSX_NS):
+            with z.open(targets[sheet.get(_XLSX_REL_ID)]) as sheet_file:
+                hashes[sheet.get("name")] = _hash_sheet_xml(sheet_file, shared_strings)
+        return hashes
+
+def _manifest_path(output_file):
+    return output_file + MANIFEST_SUFFIX
+
+def _load_manifest(output_file, engine, output_format):
+    """讀取上次轉換的清單，清單無效或輸出文件已被修改時返回None"""
+    try:
+        with open(_manifest_path(output_file), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        st = os.stat(output_file)
+    except (OSError, ValueError):
+        return None
+    
+    if (manifest.get("version") != MANIFEST_VERSION
+            or manifest.get("engine") != engine
+            or manifest.get("format") != output_format
+            or manifest.get("output_size") != st.st_size
+            or manifest.get("output_mtime_ns") != st.st_mtime_ns):
+        return None
+    return manifest
+
+def _write_manifest(output_file, engine, output_format, hashes, writer):
+    st = os.stat(output_file)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "engine": engine,
+        "format": output_format,
+        "output_size": st.st_size,
+        "output_mtime_ns": st.st_mtime_ns,
+        "sheets": {
+            name: {
+                "hash": hashes[name],
+                "start": writer.chunks[name][0],
+                "end": writer.chunks[name][1],
+                "summary": writer.summary[name]
+            }
+            for name in hashes
+        }
+    }
+    tmp_path = _manifest_path(output_file) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, _manifest_path(output_file))
+
+def _merge_sheets(hashes, manifest, old_output, converted):
+    """
+    按工作簿順序合併: 哈希未變的sheet從舊輸出複製原始字節，
+    其餘sheet取自 converted (只包含變化的sheet，同樣按工作簿順序)
+    """
+    for sheet_name, sheet_hash in hashes.items():
+        previous = manifest["sheets"].get(sheet_name) if manifest else None
+        if previous and previous["hash"] == sheet_hash:
+            old_output.seek(previous["start"])
+            data = old_output.read(previous["end"] - previous["start"])
+            yield _RawSheet(sheet_name, data, previous["summary"])
+        else:
+            yield next(converted)
+
+def convert_excel(excel_file_path, output_file=None, engine="pandas", output_format="indent",
+                  incremental=False):
+    """
+    將Excel文件轉換為JSON，並返回轉換概要
     
     參數:
         excel_file_path (str): Excel文件的路徑
-        output_file (str, optional): 輸出JSON文件的路徑，如果為None則使用與Excel同名的文件
+        output_file (str, optional): 輸出文件的路徑，如果為None則使用與Excel同名的文件
+        engine (str): 讀取引擎，"pandas" 或 "stream" (openpyxl唯讀逐行讀取)
+        output_format (str): 輸出格式，"indent"、"compact" 或 "jsonl"
+        incremental (bool): 增量轉換，只重新轉換內容哈希有變化的sheet，
+            其餘sheet從上次的輸出中複製 (清單保存在 <輸出文件>.manifest.json)
     
     返回:
-        str: 生成的JSON文件路徑
+        dict: {"output_file": 路徑, "sheets": {sheet名稱: {"rows", "columns", "head"}},
+               "converted": 本次重新轉換的sheet名稱列表}，失敗時返回None
     """
     try:
         # 檢查文件是否存在
@@ -23,48 +379,136 @@ def excel_to_json(excel_file_path, output_file=None):
             print(f"錯誤: 找不到文件 {excel_file_path}")
             return None
         
-        # 獲取所有sheet的名稱
-        xlsx = pd.ExcelFile(excel_file_path)
-        sheet_names = xlsx.sheet_names
-        
-        all_data = {}
+        if engine not in ENGINES:
+            print(f"錯誤: 不支持的讀取引擎 {engine}，可用: {', '.join(ENGINES)}")
+            return None
         
-        # 讀取每個sheet的數據
-        for sheet_name in sheet_names:
-            # 讀取Excel文件
-            df = pd.read_excel(excel_file_path, sheet_name=sheet_name)
-            
-            # 將NaN值替換為None，這樣在JSON中顯示為null
-            df = df.where(pd.notnull(df), None)
-            
-            # 將DataFrame轉換為字典列表
-            data_list = df.to_dict('records')
-            
-            # 添加到總數據中
-            all_data[sheet_name] = data_list
+        if output_format not in OUTPUT_FORMATS:
+            print(f"錯誤: 不支持的輸出格式 {output_format}，可用: {', '.join(OUTPUT_FORMATS)}")
+            return None
         
-        # 如果沒有指定輸出文件路徑，使用與Excel同名的路徑，但擴展名為.json
+        # 如果沒有指定輸出文件路徑，使用與Excel同名的路徑，擴展名為.json (JSON Lines為.jsonl)
         if output_file is None:
             base_name = os.path.splitext(excel_file_path)[0]
-            output_file = f"{base_name}.json"
+            extension = "jsonl" if output_format == "jsonl" else "json"
+            output_file = f"{base_name}.{extension}"
         
-        # 將數據寫入JSON文件
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
+        # 增量模式: 比較每個sheet的哈希，找出需要重新轉換的sheet
+        hashes = None
+        manifest = None
+        changed = None
+        if incremental:
+            hashes = _xlsx_sheet_hashes(excel_file_path)
+            if hashes is None:
+                print("增量轉換只支持.xlsx文件，將執行完整轉換")
+            else:
+                manifest = _load_manifest(output_file, engine, output_format)
+                changed = [name for name, h in hashes.items()
+                           if not manifest or manifest["sheets"].get(name, {}).get("hash") != h]
+                if manifest and not changed and list(manifest["sheets"]) == list(hashes):
+                    print(f"所有sheet都沒有變化，保留現有的 {output_file}")
+                    summary = {name: info["summary"] for name, info in manifest["sheets"].items()}
+                    return {"output_file": output_file, "sheets": summary, "converted": []}
+        
+        # 先寫入臨時文件，完成後再替換，避免轉換失敗時留下不完整的JSON
+        tmp_file = f"{output_file}.tmp"
+        old_output = open(output_file, 'rb') if manifest else None
+        try:
+            with open(tmp_file, 'wb') as f:
+                writer = _WRITERS[output_format](f)
+                sheet_filter = set(changed) if manifest else None
+                if engine == "stream":
+                    converted = _iter_sheets_stream(excel_file_path, sheet_filter)
+                    sheets = _merge_sheets(hashes, manifest, old_output, converted) if hashes else converted
+                    sheets_summary = writer.write(sheets)
+                else:
+                    # 只打開一次Excel文件，所有sheet都從這個已打開的工作簿解析
+                    with pd.ExcelFile(excel_file_path) as xlsx:
+                        converted = _iter_sheets_pandas(xlsx, sheet_filter)
+                        sheets = _merge_sheets(hashes, manifest, old_output, converted) if hashes else converted
+                        sheets_summary = writer.write(sheets)
+            if old_output:
+                old_output.close()
+                old_output = None
+            os.replace(tmp_file, output_file)
+        finally:
+            if old_output:
+                old_output.close()
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
         
+        if hashes:
+            _write_manifest(output_file, engine, output_format, hashes, writer)
+        
+        converted_names = changed if manifest else list(sheets_summary)
+        if manifest:
+            print(f"增量轉換完成，重新轉換了 {len(converted_names)}/{len(sheets_summary)} 個sheet: "
+                  f"{', '.join(converted_names)}")
         print(f"轉換成功！已將數據保存到 {output_file}")
-        return output_file
+        return {"output_file": output_file, "sheets": sheets_summary, "converted": converted_names}
     
     except Exception as e:
         print(f"轉換過程中發生錯誤: {str(e)}")
         return None
 
+def excel_to_json(excel_file_path, output_file=None, engine="pandas", output_format="indent",
+                  incremental=False):
+    """
+    將Excel文件轉換為JSON格式
+    
+    參數:
+        excel_file_path (str): Excel文件的路徑
+        output_file (str, optional): 輸出JSON文件的路徑，如果為None則使用與Excel同名的文件
+        engine (str): 讀取引擎，"pandas" 或 "stream" (openpyxl唯讀逐行讀取)
+        output_format (str): 輸出格式，"indent"、"compact" 或 "jsonl"
+        incremental (bool): 只重新轉換內容有變化的sheet
+    
+    返回:
+        str: 生成的JSON文件路徑
+    """
+    result = convert_excel(excel_file_path, output_file, engine=engine, output_format=output_format,
+                           incremental=incremental)
+    return result["output_file"] if result else None
+
+def print_summary(sheets_summary):
+    """顯示轉換概要，數據來自轉換過程本身，不需要重新讀取輸出文件"""
+    # 計算總行數
+    total_rows = sum(info["rows"] for info in sheets_summary.values())
+    
+    print(f"\nJSON數據概要:")
+    print(f"sheets數量: {len(sheets_summary)}")
+    print(f"總行數: {total_rows}")
+    
+    # 顯示每個sheet的前三行數據（如果有）
+    for sheet_name, info in sheets_summary.items():
+        print(f"\nSheet '{sheet_name}' ({info['rows']}行):")
+        
+        if info["rows"]:
+            print(f"  列: {', '.join(info['columns'])}")
+            
+            # 顯示前三行數據
+            for i, row in enumerate(info["head"]):
+                print(f"  行{i+1}: {row}")
+            
+            if info["rows"] > len(info["head"]):
+                print(f"  ... 還有{info['rows'] - len(info['head'])}行")
+
 def main():
-    # 檢查命令行參數
-    if len(sys.argv) < 2:
+    # 解析命令行參數
+    parser = argparse.ArgumentParser(description="將Excel文件轉換為JSON格式")
+    parser.add_argument("excel_file", nargs="?", help="Excel文件路徑，使用auto自動尋找當前目錄中的文件")
+    parser.add_argument("-o", "--output", help="輸出JSON文件路徑 (默認與Excel同名)")
+    parser.add_argument("--engine", choices=ENGINES, default="pandas",
+                        help="讀取引擎: pandas (默認) 或 stream (openpyxl唯讀逐行讀取，內存佔用較低)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="indent",
+                        help="輸出格式: indent (默認，縮進JSON)、compact (緊湊JSON) 或 jsonl (JSON Lines)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量轉換: 只重新轉換內容有變化的sheet，並合併到現有的輸出文件")
+    args = parser.parse_args()
+    
+    excel_file = args.excel_file
+    if not excel_file:
         excel_file = input("請輸入Excel文件路徑: ")
-    else:
-        excel_file = sys.argv[1]
     
     # 尋找當前目錄中的Excel文件
     if excel_file == "auto":
@@ -83,38 +527,11 @@ def main():
             excel_file = excel_files[selection]
     
     # 轉換文件
-    json_file = excel_to_json(excel_file)
+    result = convert_excel(excel_file, args.output, engine=args.engine, output_format=args.format,
+                           incremental=args.incremental)
     
-    if json_file:
-        # 嘗試讀取生成的JSON文件以顯示其內容
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 計算總行數
-            total_rows = sum(len(sheet_data) for sheet_data in data.values())
-            
-            print(f"\nJSON數據概要:")
-            print(f"sheets數量: {len(data)}")
-            print(f"總行數: {total_rows}")
-            
-            # 顯示每個sheet的前三行數據（如果有）
-            for sheet_name, rows in data.items():
-                print(f"\nSheet '{sheet_name}' ({len(rows)}行):")
-                
-                # 獲取列名（假設所有行的列都相同）
-                if rows:
-                    columns = list(rows[0].keys())
-                    print(f"  列: {', '.join(columns)}")
-                    
-                    # 顯示前三行數據
-                    for i, row in enumerate(rows[:3]):
-                        print(f"  行{i+1}: {row}")
-                    
-                    if len(rows) > 3:
-                        print(f"  ... 還有{len(rows)-3}行")
-        except Exception as e:
-            print(f"讀取JSON數據時發生錯誤: {str(e)}")
+    if result:
+        print_summary(result["sheets"])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件驅動的尿布DV1感測器模型
+每個住民一個設備，設備狀態只在事件發生時更新，所有事件放在一個按時間排序的堆 (heapq) 中，
+由調用方按堆頂的時間等待，不需要逐個設備輪詢
+
+事件:
+    report    定時上報: 距離上次上報達到 "diaper DV1 update time" (Gateway配置) 時發送
+    void      排尿: 濕度在幾十秒內上升到峰值，之後按指數衰減到濕尿布的平台值
+    change    濕度變化達到 HUMI_REPORT_DELTA 時立即上報 (上升和衰減過程中的穿越時間都是解析計算的)
+    diaper    護理人員更換尿布並按下按鈕確認: 濕度回到乾燥基線，該條消息 button=1
+    button    住民偶爾按下呼叫按鈕: 立即上報 button=1
+
+每次上報 "mssg idx" 遞增 (0~255循環)，電池按上報次數和時間放電，電量過低時更換電池
+
+    fleet = DiaperFleet(500, update_time=20, seed=1)
+    for device, reason, message in fleet.advance(now):     # now為模擬時間 (秒)
+        publish(message)
+    fleet.next_time()                             # 下一個事件的模擬時間
+"""
+
+import heapq
+import itertools
+import math
+import random
+
+# Gateway配置中 "diaper DV1 update time" 的默認值 (秒)
+DEFAULT_UPDATE_TIME = 20
+# 濕度變化超過這個值 (%RH) 時立即上報
+HUMI_REPORT_DELTA = 5.0
+# 乾燥時的濕度基線和溫度基線範圍
+DRY_HUMI_RANGE = (40.0, 50.0)
+SKIN_TEMP_RANGE = (33.0, 34.5)
+# 濕透時溫度最多升高的值 (°C)
+WET_TEMP_GAIN = 1.5
+# 排尿: 平均間隔範圍 (秒，按住民不同)、濕度上升的時間 (秒)、每次上升的幅度 (%RH)
+VOID_INTERVAL_RANGE = (2.0 * 3600, 4.0 * 3600)
+VOID_RISE_SECONDS = 45.0
+VOID_HUMI_GAIN = (25.0, 40.0)
+MAX_HUMI = 95.0
+# 峰值之後的衰減時間常數 (秒)，衰減到 基線 + WET_PLATEAU × (峰值 - 基線)
+DECAY_TAU = 20 * 60
+WET_PLATEAU = 0.6
+# 第一次變濕之後到護理人員更換尿布的平均時間 (秒)
+CHANGE_DELAY_MEAN = 45 * 60
+# 住民按呼叫按鈕的平均間隔 (秒)
+BUTTON_INTERVAL_MEAN = 12 * 3600
+# 電池: 每條上報和每小時的放電量 (%)，低於 BATTERY_REPLACE_BELOW 時更換電池
+BATTERY_PER_REPORT = 0.002
+BATTERY_PER_HOUR = 0.05
+BATTERY_REPLACE_BELOW = 5.0
+
+# 設備的MAC和名稱從這個序號開始編號
+BASE_DEVICE_INDEX = 0x083693F8
+
+REPORT, VOID, CHANGE, DIAPER, BUTTON = "report", "void", "change", "diaper", "button"
+EVENT_KINDS = (REPORT, VOID, CHANGE, DIAPER, BUTTON)
+
+
+def device_mac(index):
+    """由設備序號生成MAC地址，例如 E0:0E:08:36:93:F8"""
+    return "E0:0E:" + ":".join(f"{(index >> shift) & 0xFF:02X}" for shift in (24, 16, 8, 0))
+
+
+class DiaperDevice:
+    """
+    一個尿布DV1設備的狀態
+
+    濕度是分段的解析函數 (見 humidity())，只在事件發生時改變參數:
+        上升段: 從 start_humi 線性上升到 peak，持續 VOID_RISE_SECONDS
+        衰減段: peak 按 DECAY_TAU 指數衰減到 plateau
+        乾燥:   plateau = peak = 基線
+    """
+
+    __slots__ = ("index", "mac", "name", "gateway_id", "dry_humi", "skin_temp", "void_interval",
+                 "episode_start", "start_humi", "peak", "plateau", "wet",
+                 "reported_humi", "last_report", "button", "mssg_idx", "battery", "due",
+                 "reports")
+
+    def __init__(self, index, gateway_id, rng):
+        self.index = index
+        self.mac = device_mac(BASE_DEVICE_INDEX + index)
+        self.name = "DV1_" + self.mac.replace(":", "")[-6:]
+        self.gateway_id = gateway_id
+        self.dry_humi = rng.uniform(*DRY_HUMI_RANGE)
+        self.skin_temp = rng.uniform(*SKIN_TEMP_RANGE)
+        self.void_interval = rng.uniform(*VOID_INTERVAL_RANGE)
+        self.episode_start = 0.0
+        self.start_humi = self.peak = self.plateau = self.dry_humi
+        self.wet = False
+        self.reported_humi = self.dry_humi
+        self.last_report = None
+        self.button = 0
+        self.mssg_idx = rng.randint(0, 255)
+        self.battery = rng.uniform(40.0, 100.0)
+        # 每種事件當前有效的觸發時間，堆中時間不一致的舊事件在彈出時丟棄
+        self.due = {}
+        self.reports = 0
+
+    def humidity(self, t):
+        """模擬時間t的濕度 (%RH)"""
+        elapsed = t - self.episode_start
+        if elapsed < VOID_RISE_SECONDS:
+            return self.start_humi + (self.peak - self.start_humi) * max(elapsed, 0.0) / VOID_RISE_SECONDS
+        return self.plateau + (self.peak - self.plateau) * math.exp(-(elapsed - VOID_RISE_SECONDS) / DECAY_TAU)
+
+    def temperature(self, humi):
+        wetness = (humi - self.dry_humi) / (MAX_HUMI - self.dry_humi)
+        return self.skin_temp + WET_TEMP_GAIN * min(max(wetness, 0.0), 1.0)
+
+    def start_void(self, t, gain):
+        """開始一次排尿: 從當前濕度上升到新的峰值"""
+        current = self.humidity(t)
+        self.episode_start = t
+        self.start_humi = current
+        self.peak = min(MAX_HUMI, current + gain)
+        self.plateau = self.dry_humi + WET_PLATEAU * (self.peak - self.dry_humi)
+        self.wet = True
+
+    def change_diaper(self, t):
+        """更換尿布: 回到乾燥基線"""
+        self.episode_start = t - VOID_RISE_SECONDS
+        self.start_humi = self.peak = self.plateau = self.dry_humi
+        self.wet = False
+
+    def next_change_time(self, t):
+        """濕度下一次與上次上報值相差 HUMI_REPORT_DELTA 的時間，之後不會再變化時返回None"""
+        rise_end = self.episode_start + VOID_RISE_SECONDS
+        if t < rise_end and self.peak > self.start_humi:
+            target = self.reported_humi + HUMI_REPORT_DELTA
+            if target >= self.peak:
+                # 峰值與上次上報值相差不到一個步長時在峰值處上報
+                return rise_end
+            fraction = (target - self.start_humi) / (self.peak - self.start_humi)
+            return max(t, self.episode_start + fraction * VOID_RISE_SECONDS)
+        target = self.reported_humi - HUMI_REPORT_DELTA
+        if target <= self.plateau or self.peak <= self.plateau:
+            return None
+        return rise_end + DECAY_TAU * math.log((self.peak - self.plateau) / (target - self.plateau))
+
+    def report(self, t):
+        """記錄一次上報 (更新mssg idx、電池、上次上報值)，返回上報時的濕度"""
+        humi = self.humidity(t)
+        if self.last_report is not None:
+            self.battery -= BATTERY_PER_HOUR * (t - self.last_report) / 3600.0
+        self.battery -= BATTERY_PER_REPORT
+        if self.battery < BATTERY_REPLACE_BELOW:
+            self.battery = 100.0
+        self.mssg_idx = (self.mssg_idx + 1) & 0xFF
+        self.reported_humi = humi
+        self.last_report = t
+        self.reports += 1
+        return humi
+
+    def message(self, humi):
+        """建立尿布DV1消息字典 (字段與UWB消息目錄中的diaper DV1一致，serial no由發送端按Gateway改寫)"""
+        return {
+            "content": "diaper DV1",
+            "gateway id": self.gateway_id,
+            "MAC": self.mac,
+            "name": self.name,
+            "fw ver": 1.01,
+            "temp": round(self.temperature(humi), 1),
+            "humi": round(humi, 1),
+            "button": self.button,
+            "mssg idx": self.mssg_idx,
+            "ack": 0,
+            "battery level": int(round(self.battery)),
+            "serial no": self.mssg_idx
+        }
+
+
+class DiaperFleet:
+    """
+    多個尿布設備和它們的事件堆
+
+    參數:
+        count (int): 設備數量
+        update_time (float): 定時上報間隔 (秒)，對應Gateway配置的 "diaper DV1 update time"
+        gateway_id (int): 消息中的gateway id
+        seed (int, optional): 隨機數種子，用於可重現的模擬
+        start (float): 起始的模擬時間 (秒)
+    """
+
+    def __init__(self, count, update_time=DEFAULT_UPDATE_TIME, gateway_id=137205, seed=None, start=0.0):
+        self.rng = random.Random(seed)
+        self.update_time = update_time
+        self.heap = []
+        self._order = itertools.count()
+        self.now = start
+        self.devices = [DiaperDevice(i, gateway_id, self.rng) for i in range(count)]
+        self.counts = dict.fromkeys(EVENT_KINDS, 0)
+        for device in self.devices:
+            # 首次上報隨機分散在一個周期內，避免所有設備同時突發
+            self._schedule(device, REPORT, start + self.rng.uniform(0, update_time))
+            self._schedule(device, VOID, start + self.rng.expovariate(1.0 / device.void_interval))
+            self._schedule(device, BUTTON, start + self.rng.expovariate(1.0 / BUTTON_INTERVAL_MEAN))
+
+    def __len__(self):
+        return len(self.devices)
+
+    def _schedule(self, device, kind, when):
+        if when is None:
+            device.due.pop(kind, None)
+            return
+        device.due[kind] = when
+        heapq.heappush(self.heap, (when, next(self._order), kind, device))
+
+    def next_time(self):
+        """下一個事件的模擬時間 (沒有事件時返回None)"""
+        heap = self.heap
+        # 丟棄已被重新安排的舊事件
+        while heap and heap[0][3].due.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def set_update_time(self, seconds):
+        """Gateway配置的上報間隔改變: 各設備從上次上報起按新間隔重新安排"""
+        if seconds <= 0 or seconds == self.update_time:
+            return False
+        self.update_time = seconds
+        for device in self.devices:
+            base = device.last_report if device.last_report is not None else self.now
+            self._schedule(device, REPORT, max(self.now, base + seconds))
+        return True
+
+    def advance(self, now):
+        """
+        處理所有不晚於now的事件
+
+        返回:
+            list: [(設備, 原因, 消息字典)]，按時間順序，每條都需要發送
+        """
+        reports = []
+        heap = self.heap
+        rng = self.rng
+        while heap and heap[0][0] <= now:
+            when, _, kind, device = heapq.heappop(heap)
+            if device.due.get(kind) != when:
+                continue
+            del device.due[kind]
+            self.now = when
+            self.counts[kind] += 1
+            publish = kind != VOID
+
+            if kind == VOID:
+                device.start_void(when, rng.uniform(*VOID_HUMI_GAIN))
+                self._schedule(device, VOID, when + rng.expovariate(1.0 / device.void_interval))
+                if DIAPER not in device.due:
+                    self._schedule(device, DIAPER, when + rng.expovariate(1.0 / CHANGE_DELAY_MEAN))
+            elif kind == DIAPER:
+                device.change_diaper(when)
+                device.button = 1
+            elif kind == BUTTON:
+                device.button = 1
+                self._schedule(device, BUTTON, when + rng.expovariate(1.0 / BUTTON_INTERVAL_MEAN))
+
+            if publish:
+                reports.append((device, kind, device.message(device.report(when))))
+                device.button = 0
+                self._schedule(device, REPORT, when + self.update_time)
+            self._schedule(device, CHANGE, device.next_change_time(when))
+        if now > self.now:
+            self.now = now
+        return reports
+
+    def wet_count(self):
+        return sum(1 for device in self.devices if device.wet)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+進程內的最小MQTT 3.1.1代理 (只用標準庫)，用於基準測試和本地調試，不需要安裝mosquitto
+
+支持: CONNECT、PUBLISH (QoS 0/1/2)、SUBSCRIBE/UNSUBSCRIBE (+ 和 # 通配符)、retain、PINGREQ、DISCONNECT
+不支持: 用戶認證、遺囑消息、持久會話 (斷開後訂閱即清除)、向訂閱者的QoS 2投遞 (按QoS 1投遞)
+
+在後台線程中運行:
+    broker = EmbeddedBroker(port=0).start()     # port=0 時由系統分配端口，見 broker.port
+    ...
+    broker.stop()
+
+獨立運行:
+    python embedded_broker.py -p 1883
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+# 每個連接的發送緩衝上限 (字節)，訂閱者跟不上時丟棄QoS 0消息並計數，避免內存無限增長
+MAX_WRITE_BUFFER = 8 * 1024 * 1024
+
+# 報文類型
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    """主題是否匹配訂閱過濾器 (支持 + 和 #，$開頭的主題不匹配以通配符開頭的過濾器)"""
+    if topic_filter == topic:
+        return True
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length):
+    out = bytearray()
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _packet(header, body):
+    return bytes((header,)) + _encode_length(len(body)) + body
+
+
+def _string(data, offset):
+    length = int.from_bytes(data[offset:offset + 2], "big")
+    return data[offset + 2:offset + 2 + length].decode("utf-8"), offset + 2 + length
+
+
+class _Session(asyncio.Protocol):
+    """一個客戶端連接: 解析收到的報文並交給代理處理"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.transport = None
+        self.buffer = bytearray()
+        self.client_id = None
+        self.subscriptions = {}
+        self.next_id = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.broker.sessions.add(self)
+        self.broker.counters["connections"] += 1
+
+    def connection_lost(self, exc):
+        self.broker.remove_session(self)
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer += data
+        position = 0
+        size = len(buffer)
+        while size - position >= 2:
+            # 剩餘長度為1~4字節的變長整數
+            length = 0
+            multiplier = 1
+            index = position + 1
+            complete = False
+            while index < size:
+                byte = buffer[index]
+                length += (byte & 0x7F) * multiplier
+                multiplier <<= 7
+                index += 1
+                if not byte & 0x80:
+                    complete = True
+                    break
+            if not complete or index + length > size:
+                break
+            header = buffer[position]
+            body = bytes(buffer[index:index + length])
+            position = index + length
+            try:
+                self.handle(header, body)
+            except (ValueError, IndexError, UnicodeDecodeError):
+                self.transport.close()
+                return
+        if position:
+            del buffer[:position]
+
+    def send(self, data):
+        self.transport.write(data)
+
+    def packet_id(self):
+        self.next_id = self.next_id % 0xFFFF + 1
+        return self.next_id
+
+    def handle(self, header, body):
+        kind = header >> 4
+        if kind == PUBLISH:
+            qos = (header >> 1) & 3
+            topic, offset = _string(body, 0)
+            packet_id = None
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+            self.broker.publish(topic, body[offset:], qos, bool(header & 1))
+            if qos == 1:
+                self.send(b"\x40\x02" + packet_id)
+            elif qos == 2:
+                self.send(b"\x50\x02" + packet_id)
+        elif kind == PUBREL:
+            self.send(b"\x70\x02" + body[:2])
+        elif kind == PUBREC:
+            # 訂閱者確認我們的QoS 2投遞 (不會發生，保留以防客戶端主動升級)
+            self.send(b"\x62\x02" + body[:2])
+        elif kind in (PUBACK, PUBCOMP):
+            pass
+        elif kind == CONNECT:
+            _, offset = _string(body, 0)
+            offset += 4  # 協議級別、連接標誌、keepalive
+            self.client_id, _ = _string(body, offset)
+            self.send(b"\x20\x02\x00\x00")
+        elif kind == SUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            granted = bytearray()
+            filters = []
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                qos = min(body[offset] & 3, 1)
+                offset += 1
+                granted.append(qos)
+                filters.append((topic_filter, qos))
+            self.broker.subscribe(self, filters)
+            self.send(_packet(0x90, packet_id + bytes(granted)))
+            self.broker.send_retained(self, filters)
+        elif kind == UNSUBSCRIBE:
+            offset = 2
+            filters = []
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                filters.append(topic_filter)
+            self.broker.unsubscribe(self, filters)
+            self.send(b"\xb0\x02" + body[:2])
+        elif kind == PINGREQ:
+            self.send(b"\xd0\x00")
+        elif kind == DISCONNECT:
+            self.transport.close()
+
+
+class EmbeddedBroker:
+    """
+    在後台線程的asyncio事件循環中運行的MQTT代理
+
+    參數:
+        host (str): 監聽地址
+        port (int): 監聽端口，0表示由系統分配 (啟動後見 self.port)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.sessions = set()
+        # 訂閱過濾器 -> {會話: QoS}
+        self.subscriptions = {}
+        self.retained = {}
+        # 主題 -> [(會話, QoS)]，訂閱變化時清空
+        self._routes = {}
+        self.counters = {"connections": 0, "received": 0, "delivered": 0, "dropped": 0}
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self._ready = threading.Event()
+
+    # ---------- 路由 (在事件循環線程中調用) ----------
+
+    def subscribe(self, session, filters):
+        for topic_filter, qos in filters:
+            self.subscriptions.setdefault(topic_filter, {})[session] = qos
+            session.subscriptions[topic_filter] = qos
+        self._routes.clear()
+
+    def unsubscribe(self, session, filters):
+        for topic_filter in filters:
+            subscribers = self.subscriptions.get(topic_filter)
+            if subscribers is not None:
+                subscribers.pop(session, None)
+                if not subscribers:
+                    del self.subscriptions[topic_filter]
+            session.subscriptions.pop(topic_filter, None)
+        self._routes.clear()
+
+    def remove_session(self, session):
+        self.sessions.discard(session)
+        self.unsubscribe(session, list(session.subscriptions))
+
+    def _route(self, topic):
+        routes = self._routes.get(topic)
+        if routes is None:
+            targets = {}
+            for topic_filter, subscribers in self.subscriptions.items():
+                if topic_matches(topic_filter, topic):
+                    for session, qos in subscribers.items():
+                        # 一個會話有多個匹配的訂閱時只投遞一次，取最高QoS
+                        targets[session] = max(qos, targets.get(session, 0))
+            routes = self._routes[topic] = list(targets.items())
+        return routes
+
+    def _deliver(self, session, topic_bytes, payload, qos, retain=False):
+        if qos == 0 and session.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.counters["dropped"] += 1
+            return
+        header = 0x30 | (qos << 1) | (1 if retain else 0)
+        if qos:
+            body = topic_bytes + session.packet_id().to_bytes(2, "big") + payload
+        else:
+            body = topic_bytes + payload
+        session.send(_packet(header, body))
+        self.counters["delivered"] += 1
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.counters["received"] += 1
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        routes = self._route(topic)
+        if not routes:
+            return
+        encoded = topic.encode("utf-8")
+        topic_bytes = len(encoded).to_bytes(2, "big") + encoded
+        for session, sub_qos in routes:
+            self._deliver(session, topic_bytes, payload, min(qos, sub_qos, 1))
+
+    def send_retained(self, session, filters):
+        for topic, (payload, qos) in self.retained.items():
+            for topic_filter, sub_qos in filters:
+                if topic_matches(topic_filter, topic):
+                    encoded = topic.encode("utf-8")
+                    self._deliver(session, len(encoded).to_bytes(2, "big") + encoded, payload,
+                                  min(qos, sub_qos, 1), retain=True)
+                    break
+
+    # ---------- 啟動和停止 ----------
+
+    async def serve(self):
+        """在當前事件循環中啟動監聽 (獨立運行或嵌入已有的事件循環時使用)"""
+        self.loop = asyncio.get_running_loop()
+        self.server = await self.loop.create_server(lambda: _Session(self), self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.serve())
+        finally:
+            self._ready.set()
+        loop.run_forever()
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+    def start(self, timeout=5.0):
+        """在後台線程中啟動，返回self"""
+        self.thread = threading.Thread(target=self._run, name="embedded-broker", daemon=True)
+        self.thread.start()
+        if not self._ready.wait(timeout) or self.server is None:
+            raise RuntimeError(f"無法在 {self.host}:{self.port} 啟動MQTT代理")
+        return self
+
+    def _close(self):
+        self.server.close()
+        for session in list(self.sessions):
+            session.transport.close()
+        self.loop.call_soon(self.loop.stop)
+
+    def stop(self, timeout=5.0):
+        if self.loop is not None and self.thread is not None:
+            self.loop.call_soon_threadsafe(self._close)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def stats(self):
+        return dict(self.counters, sessions=len(self.sessions), subscriptions=len(self.subscriptions),
+                    retained=len(self.retained))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="進程內的最小MQTT代理 (測試用)")
+    parser.add_argument("-H", "--host", default="127.0.0.1", help="監聽地址 (0.0.0.0表示所有網卡)")
+    parser.add_argument("-p", "--port", type=int, default=1883, help="監聽端口")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="統計輸出間隔 (秒, 0表示不輸出)")
+    args = parser.parse_args()
+
+    broker = EmbeddedBroker(args.host, args.port).start()
+    print(f"MQTT代理已啟動: {broker.host}:{broker.port}")
+    try:
+        while True:
+            if args.stats_interval > 0:
+                time.sleep(args.stats_interval)
+                s = broker.stats()
+                print(f"[代理] {s['sessions']} 個連接, 收到 {s['received']} 條, 投遞 {s['delivered']} 條, "
+                      f"丟棄 {s['dropped']} 條")
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+        print("MQTT代理已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+樓層平面圖和按作息路線移動的Tag模型
+
+平面圖由區域 (房間、走廊) 和門組成，都用多邊形描述 (單位: 米)，
+每扇門記錄它連接的兩個區域，構成區域之間的鄰接圖。載入時預先計算:
+- 所有區域之間經過哪些門的最短路線
+- 空間網格索引，用於快速判斷一個點位於哪個區域
+
+RoutineModel 讓每個Tag按作息 (例如 卧室 → 浴室 → 餐廳 → 卧室) 沿預先計算的路線行走，
+會真實地穿過區域邊界，用於測試區域/電子圍欄告警
+
+平面圖JSON格式:
+{
+    "zones": [{"id": "room_101", "name": "101房", "kind": "bedroom", "polygon": [[x, y], ...]}, ...],
+    "doors": [{"id": "door_101", "connects": ["room_101", "corridor"], "polygon": [[x, y], ...]}, ...],
+    "routines": {
+        "resident": {"weight": 9, "speed": [0.4, 0.9],
+                     "stops": [{"zone": "home", "dwell": [60, 300]}, {"kind": "bathroom", "dwell": [30, 120]}, ...]}
+    }
+}
+作息站點可以是具體的區域id ("zone")、區域類型 ("kind"，隨機選一個該類型的區域)，
+或 "home" (分配給該Tag的卧室)。房間和走廊應為凸多邊形，這樣直線行走不會穿牆
+"""
+
+import json
+import time
+
+import numpy as np
+
+from mobility import QUALITY_RANGE, TagModel
+
+# 區域內隨機目標點與牆壁保持的距離 (米)
+WALL_MARGIN = 0.4
+# 網格索引的單元大小 (米)
+GRID_CELL_SIZE = 1.0
+
+# 默認平面圖: 30m × 15m 的一層護理樓，北側卧室，南側餐廳和活動區，中間為走廊
+DEFAULT_FLOOR_PLAN = {
+    "zones": [
+        {"id": "corridor", "name": "走廊", "kind": "corridor", "polygon": [[0, 6], [30, 6], [30, 9], [0, 9]]},
+        {"id": "room_101", "name": "101房", "kind": "bedroom", "polygon": [[0, 9], [6, 9], [6, 15], [0, 15]]},
+        {"id": "room_102", "name": "102房", "kind": "bedroom", "polygon": [[6, 9], [12, 9], [12, 15], [6, 15]]},
+        {"id": "bath_north", "name": "北側浴室", "kind": "bathroom",
+         "polygon": [[12, 9], [15, 9], [15, 15], [12, 15]]},
+        {"id": "room_103", "name": "103房", "kind": "bedroom", "polygon": [[15, 9], [21, 9], [21, 15], [15, 15]]},
+        {"id": "room_104", "name": "104房", "kind": "bedroom", "polygon": [[21, 9], [27, 9], [27, 15], [21, 15]]},
+        {"id": "nurse_station", "name": "護理站", "kind": "nurse_station",
+         "polygon": [[27, 9], [30, 9], [30, 15], [27, 15]]},
+        {"id": "dining_hall", "name": "餐廳", "kind": "dining", "polygon": [[0, 0], [12, 0], [12, 6], [0, 6]]},
+        {"id": "lounge", "name": "交誼廳", "kind": "lounge", "polygon": [[12, 0], [21, 0], [21, 6], [12, 6]]},
+        {"id": "bath_south", "name": "南側浴室", "kind": "bathroom",
+         "polygon": [[21, 0], [24, 0], [24, 6], [21, 6]]},
+        {"id": "rehab_room", "name": "復健室", "kind": "activity", "polygon": [[24, 0], [30, 0], [30, 6], [24, 6]]},
+    ],
+    "doors": [
+        {"id": "door_101", "connects": ["room_101", "corridor"], "polygon": [[2.5, 8.8], [3.5, 8.8], [3.5, 9.2], [2.5, 9.2]]},
+        {"id": "door_102", "connects": ["room_102", "corridor"], "polygon": [[8.5, 8.8], [9.5, 8.8], [9.5, 9.2], [8.5, 9.2]]},
+        {"id": "door_bath_n", "connects": ["bath_north", "corridor"],
+         "polygon": [[13, 8.8], [14, 8.8], [14, 9.2], [13, 9.2]]},
+        {"id": "door_103", "connects": ["room_103", "corridor"], "polygon": [[17.5, 8.8], [18.5, 8.8], [18.5, 9.2], [17.5, 9.2]]},
+        {"id": "door_104", "connects": ["room_104", "corridor"], "polygon": [[23.5, 8.8], [24.5, 8.8], [24.5, 9.2], [23.5, 9.2]]},
+        {"id": "door_nurse", "connects": ["nurse_station", "corridor"],
+         "polygon": [[28, 8.8], [29, 8.8], [29, 9.2], [28, 9.2]]},
+        {"id": "door_dining", "connects": ["dining_hall", "corridor"],
+         "polygon": [[5, 5.8], [7, 5.8], [7, 6.2], [5, 6.2]]},
+        {"id": "door_lounge", "connects": ["lounge", "corridor"],
+         "polygon": [[15.5, 5.8], [17.5, 5.8], [17.5, 6.2], [15.5, 6.2]]},
+        {"id": "door_dining_lounge", "connects": ["dining_hall", "lounge"],
+         "polygon": [[11.8, 2], [12.2, 2], [12.2, 3.5], [11.8, 3.5]]},
+        {"id": "door_bath_s", "connects": ["bath_south", "corridor"],
+         "polygon": [[22, 5.8], [23, 5.8], [23, 6.2], [22, 6.2]]},
+        {"id": "door_rehab", "connects": ["rehab_room", "corridor"],
+         "polygon": [[26.5, 5.8], [27.5, 5.8], [27.5, 6.2], [26.5, 6.2]]},
+    ],
+    "routines": {
+        "resident": {
+            "weight": 9,
+            "speed": [0.4, 0.9],
+            "stops": [
+                {"zone": "home", "dwell": [60, 300]},
+                {"kind": "bathroom", "dwell": [30, 120]},
+                {"zone": "home", "dwell": [30, 120]},
+                {"zone": "dining_hall", "dwell": [120, 600]},
+                {"zone": "lounge", "dwell": [60, 300]},
+                {"kind": "bathroom", "dwell": [30, 120]},
+                {"zone": "rehab_room", "dwell": [60, 300]},
+            ]
+        },
+        "staff": {
+            "weight": 1,
+            "speed": [1.0, 1.4],
+            "stops": [
+                {"zone": "nurse_station", "dwell": [30, 180]},
+                {"kind": "bedroom", "dwell": [20, 90]},
+                {"kind": "bedroom", "dwell": [20, 90]},
+                {"zone": "dining_hall", "dwell": [20, 90]},
+                {"kind": "bathroom", "dwell": [10, 60]},
+            ]
+        }
+    }
+}
+
+
+def _points_in_polygon(xs, ys, polygon):
+    """向量化的射線法: 返回每個點是否在多邊形內的布爾數組"""
+    inside = np.zeros(len(xs), dtype=bool)
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        crosses = (y1 > ys) != (y0 > ys)
+        if crosses.any():
+            # 只在會跨越的邊上計算交點，避免除以0
+            xi = x1 + (ys[crosses] - y1) * (x0 - x1) / (y0 - y1)
+            inside[crosses] ^= xs[crosses] < xi
+        x0, y0 = x1, y1
+    return inside
+
+
+def _point_in_polygon(x, y, polygon):
+    inside = False
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        if (y1 > y) != (y0 > y) and x < x1 + (y - y1) * (x0 - x1) / (y0 - y1):
+            inside = not inside
+        x0, y0 = x1, y1
+    return inside
+
+
+def _polygon_centroid(polygon):
+    pts = np.asarray(polygon, dtype=np.float64)
+    x, y = pts[:, 0], pts[:, 1]
+    xn, yn = np.roll(x, -1), np.roll(y, -1)
+    cross = x * yn - xn * y
+    area = cross.sum() / 2
+    if abs(area) < 1e-12:
+        return pts.mean(axis=0)
+    return np.array([((x + xn) * cross).sum(), ((y + yn) * cross).sum()]) / (6 * area)
+
+
+class Zone:
+    """平面圖中的一個區域或一扇門"""
+    __slots__ = ("index", "id", "name", "kind", "polygon", "bbox", "center", "is_door", "connects")
+
+    def __init__(self, index, spec, is_door=False):
+        self.index = index
+        self.id = spec["id"]
+        self.name = spec.get("name", spec["id"])
+        self.kind = "door" if is_door else spec.get("kind", "room")
+        self.polygon = [tuple(map(float, p)) for p in spec["polygon"]]
+        pts = np.asarray(self.polygon)
+        self.bbox = (pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max())
+        self.center = _polygon_centroid(self.polygon)
+        self.is_door = is_door
+        self.connects = tuple(spec.get("connects", ()))
+
+    def contains(self, x, y):
+        return _point_in_polygon(x, y, self.polygon)
+
+    def random_point(self, rng, margin=WALL_MARGIN):
+        """在區域內隨機取一點 (與邊框保持margin距離)，使用外接矩形內的拒絕採樣"""
+        min_x, min_y, max_x, max_y = self.bbox
+        mx = min(margin, (max_x - min_x) / 4)
+        my = min(margin, (max_y - min_y) / 4)
+        for _ in range(32):
+            x = rng.uniform(min_x + mx, max_x - mx)
+            y = rng.uniform(min_y + my, max_y - my)
+            if self.contains(x, y):
+                return np.array([x, y])
+        return self.center.copy()
+
+
+class ZoneGridIndex:
+    """
+    多邊形的均勻網格空間索引
+    每個網格單元記錄與它外接矩形重疊的多邊形 (按傳入順序，即優先級)，
+    定位一個點只需要測試所在單元的少數幾個多邊形，而不是掃描全部多邊形
+
+    參數:
+        areas: 有 bbox、polygon、contains() 的對象列表 (例如 Zone)，重疊時排在前面的優先
+        cell_size (float): 網格單元大小 (米)
+    """
+
+    def __init__(self, areas, cell_size=GRID_CELL_SIZE):
+        self.areas = list(areas)
+        if not self.areas:
+            raise ValueError("空間索引至少需要一個多邊形")
+        boxes = np.array([a.bbox for a in self.areas])
+        self.origin = boxes[:, :2].min(axis=0)
+        self.cell_size = cell_size
+        extent = boxes[:, 2:].max(axis=0) - self.origin
+        self.grid_shape = (int(np.ceil(extent[0] / cell_size)) + 1, int(np.ceil(extent[1] / cell_size)) + 1)
+
+        cells = [[] for _ in range(self.grid_shape[0] * self.grid_shape[1])]
+        for order, area in enumerate(self.areas):
+            x0, y0 = self._cell(area.bbox[0], area.bbox[1])
+            x1, y1 = self._cell(area.bbox[2], area.bbox[3])
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cells[cx * self.grid_shape[1] + cy].append(order)
+
+        # 轉為定長表格 (不足的補-1)，便於向量化查詢
+        width = max(1, max(len(c) for c in cells))
+        self.grid = -np.ones((len(cells), width), dtype=np.int32)
+        for i, members in enumerate(cells):
+            self.grid[i, :len(members)] = members
+
+    def _cell(self, x, y):
+        cx = int((x - self.origin[0]) // self.cell_size)
+        cy = int((y - self.origin[1]) // self.cell_size)
+        return (min(max(cx, 0), self.grid_shape[0] - 1), min(max(cy, 0), self.grid_shape[1] - 1))
+
+    def locate_order(self, x, y):
+        """返回點 (x, y) 所在區域在 areas 中的序號，不在任何區域內時返回-1"""
+        cx, cy = self._cell(x, y)
+        for order in self.grid[cx * self.grid_shape[1] + cy].tolist():
+            if order < 0:
+                break
+            if self.areas[order].contains(x, y):
+                return order
+        return -1
+
+    def locate(self, x, y):
+        """返回點 (x, y) 所在的區域，不在任何區域內時返回None"""
+        order = self.locate_order(x, y)
+        return self.areas[order] if order >= 0 else None
+
+    def locate_many(self, xs, ys):
+        """
+        向量化定位，返回每個點所在區域在 areas 中的序號 (-1表示不在任何區域內)
+        每個網格單元只需要測試與它重疊的少數幾個多邊形
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        cx = np.clip(((xs - self.origin[0]) // self.cell_size).astype(np.int64), 0, self.grid_shape[0] - 1)
+        cy = np.clip(((ys - self.origin[1]) // self.cell_size).astype(np.int64), 0, self.grid_shape[1] - 1)
+        candidates = self.grid[cx * self.grid_shape[1] + cy]
+
+        result = -np.ones(len(xs), dtype=np.int32)
+        for slot in range(candidates.shape[1]):
+            cand = candidates[:, slot]
+            todo = (result < 0) & (cand >= 0)
+            if not todo.any():
+                break
+            for order in np.unique(cand[todo]):
+                idx = np.flatnonzero(todo & (cand == order))
+                inside = _points_in_polygon(xs[idx], ys[idx], self.areas[order].polygon)
+                result[idx[inside]] = order
+        return result
+
+
+class FloorPlan:
+    """
+    已預處理的樓層平面圖
+
+    屬性:
+        zones: 所有房間/走廊 (不含門)
+        doors: 所有門
+        adjacency: 區域id -> [(相鄰區域id, 門), ...]
+        routines: 作息定義 (見模組說明)
+    """
+
+    def __init__(self, spec, cell_size=GRID_CELL_SIZE):
+        self.spec = spec
+        self.zones = [Zone(i, z) for i, z in enumerate(spec["zones"])]
+        self.doors = [Zone(len(self.zones) + i, d, is_door=True) for i, d in enumerate(spec.get("doors", []))]
+        # 門排在前面: 門與兩側區域重疊時，定位結果為門
+        self.areas = self.doors + self.zones
+        self.by_id = {z.id: z for z in self.zones + self.doors}
+        self.by_kind = {}
+        for zone in self.zones:
+            self.by_kind.setdefault(zone.kind, []).append(zone)
+        self.routines = spec.get("routines", {})
+
+        self.adjacency = {zone.id: [] for zone in self.zones}
+        for door in self.doors:
+            a, b = door.connects
+            if a not in self.adjacency or b not in self.adjacency:
+                raise ValueError(f"門 {door.id} 連接了不存在的區域: {door.connects}")
+            self.adjacency[a].append((b, door))
+            self.adjacency[b].append((a, door))
+
+        self._build_routes()
+        self.index = ZoneGridIndex(self.areas, cell_size)
+
+    # ---------- 路線 ----------
+
+    def _build_routes(self):
+        """
+        以門為節點計算全源最短路徑 (Floyd-Warshall，門的數量很少)，
+        再為每對區域選出總距離最短的進出門組合，保存經過的門中心點序列
+        """
+        n = len(self.doors)
+        centers = np.array([d.center for d in self.doors]) if n else np.zeros((0, 2))
+        dist = np.full((n, n), np.inf)
+        nxt = -np.ones((n, n), dtype=np.int64)
+        np.fill_diagonal(dist, 0.0)
+        for i in range(n):
+            nxt[i, i] = i
+
+        # 共用同一個區域的兩扇門之間可以直線行走 (區域為凸多邊形)
+        doors_of = {zone.id: [] for zone in self.zones}
+        for i, door in enumerate(self.doors):
+            for zone_id in door.connects:
+                doors_of[zone_id].append(i)
+        for members in doors_of.values():
+            for i in members:
+                for j in members:
+                    if i != j:
+                        d = float(np.hypot(*(centers[i] - centers[j])))
+                        if d < dist[i, j]:
+                            dist[i, j] = d
+                            nxt[i, j] = j
+
+        for k in range(n):
+            via = dist[:, k:k + 1] + dist[k:k + 1, :]
+            better = via < dist
+            dist = np.where(better, via, dist)
+            nxt = np.where(better, nxt[:, k:k + 1], nxt)
+
+        self.routes = {}
+        for a in self.zones:
+            for b in self.zones:
+                if a is b:
+                    self.routes[(a.id, b.id)] = []
+                    continue
+                best, best_pair = np.inf, None
+                for i in doors_of[a.id]:
+                    for j in doors_of[b.id]:
+                        total = (np.hypot(*(centers[i] - a.center)) + dist[i, j]
+                                 + np.hypot(*(centers[j] - b.center)))
+                        if total < best:
+                            best, best_pair = total, (i, j)
+                if best_pair is None:
+                    continue  # 兩個區域之間沒有通路
+                i, j = best_pair
+                path = [i]
+                while i != j:
+                    i = int(nxt[i, j])
+                    path.append(i)
+                self.routes[(a.id, b.id)] = [centers[k].copy() for k in path]
+
+    def route(self, from_zone, to_zone):
+        """返回從from_zone走到to_zone需要依次經過的門中心點列表，沒有通路時返回None"""
+        return self.routes.get((from_zone, to_zone))
+
+    # ---------- 空間索引 ----------
+
+    def locate(self, x, y):
+        """返回點 (x, y) 所在的區域或門，不在任何區域內時返回None"""
+        return self.index.locate(x, y)
+
+    def locate_many(self, xs, ys):
+        """向量化定位，返回每個點所在區域在 areas 中的序號 (-1表示不在任何區域內)"""
+        return self.index.locate_many(xs, ys)
+
+    def zone_names(self, orders):
+        """把 locate_many 的結果轉為區域名稱列表"""
+        return [self.areas[o].name if o >= 0 else "-" for o in orders]
+
+
+def load_floor_plan(path=None):
+    """
+    載入平面圖JSON，path為None或"default"時使用內置的默認平面圖
+
+    返回:
+        FloorPlan: 已預處理的平面圖
+    """
+    if path is None or path == "default":
+        return FloorPlan(DEFAULT_FLOOR_PLAN)
+    with open(path, 'r', encoding='utf-8') as f:
+        return FloorPlan(json.load(f))
+
+
+class RoutineModel(TagModel):
+    """
+    按作息路線移動的Tag模型
+    所有Tag的位置、目標點、速度和停留時間保存在NumPy數組中，每步批量移動，
+    只有到達路點或結束停留的少數Tag才需要在Python中選擇下一段路線
+
+    參數:
+        plan (FloorPlan): 樓層平面圖
+        count (int): Tag數量
+        routines (list, optional): 每個Tag的作息名稱，None表示按作息權重隨機分配
+        time_scale (float): 模擬時間倍速，例如10表示現實1秒等於模擬10秒
+        seed (int, optional): 隨機數種子
+    """
+
+    def __init__(self, plan, count, routines=None, time_scale=1.0, seed=None):
+        super().__init__()
+        self.plan = plan
+        self.rng = np.random.default_rng(seed)
+        self.time_scale = time_scale
+        self.clock = 0.0
+
+        names = list(plan.routines)
+        if not names:
+            raise ValueError("平面圖中沒有定義作息 (routines)")
+        if routines is None:
+            weights = np.array([plan.routines[n].get("weight", 1) for n in names], dtype=np.float64)
+            routines = [names[i] for i in self.rng.choice(len(names), size=count, p=weights / weights.sum())]
+        self.routine = list(routines)
+
+        # 卧室按順序輪流分配為各Tag的 "home"
+        bedrooms = plan.by_kind.get("bedroom") or plan.zones
+        self.home = [bedrooms[i % len(bedrooms)].id for i in range(count)]
+
+        self.positions = np.zeros((count, 2))
+        self.velocity = np.zeros((count, 2))
+        self.target = np.zeros((count, 2))
+        self.speed = np.zeros(count)
+        self.dwell_until = np.zeros(count)
+        self.dwelling = np.ones(count, dtype=bool)
+        self.quality = self.rng.integers(*QUALITY_RANGE, size=count, dtype=np.int16)
+
+        # 每個Tag的路線狀態 (只在到達路點時讀寫)
+        self.stop_index = [0] * count
+        self.current_zone = [None] * count
+        self.waypoints = [[] for _ in range(count)]
+
+        for i in range(count):
+            spec = plan.routines[self.routine[i]]
+            low, high = spec.get("speed", (0.5, 1.0))
+            self.speed[i] = self.rng.uniform(low, high)
+            # 從作息中的隨機一站開始，避免所有Tag同步
+            stops = spec["stops"]
+            self.stop_index[i] = int(self.rng.integers(len(stops)))
+            zone = self._resolve_stop(i, stops[self.stop_index[i]])
+            self.current_zone[i] = zone.id
+            self.positions[i] = zone.random_point(self.rng)
+            self.dwell_until[i] = self.rng.uniform(0, self._dwell(stops[self.stop_index[i]]))
+
+    def _resolve_stop(self, i, stop):
+        if stop.get("zone") == "home":
+            return self.plan.by_id[self.home[i]]
+        if "zone" in stop:
+            return self.plan.by_id[stop["zone"]]
+        candidates = self.plan.by_kind.get(stop.get("kind"))
+        if not candidates:
+            raise ValueError(f"作息站點找不到對應的區域: {stop}")
+        return candidates[int(self.rng.integers(len(candidates)))]
+
+    def _dwell(self, stop):
+        low, high = stop.get("dwell", (30, 120))
+        return self.rng.uniform(low, high)
+
+    def _start_leg(self, i):
+        """停留結束: 選出作息中的下一站，規劃經過各扇門的路線"""
+        stops = self.plan.routines[self.routine[i]]["stops"]
+        self.stop_index[i] = (self.stop_index[i] + 1) % len(stops)
+        destination = self._resolve_stop(i, stops[self.stop_index[i]])
+
+        doors = self.plan.route(self.current_zone[i], destination.id)
+        if doors is None:
+            # 沒有通路: 留在原地再停留一段時間
+            self.dwell_until[i] = self.clock + self._dwell(stops[self.stop_index[i]])
+            return
+
+        self.current_zone[i] = destination.id
+        self.waypoints[i] = doors + [destination.random_point(self.rng)]
+        self.target[i] = self.waypoints[i].pop(0)
+        self.dwelling[i] = False
+
+    def _arrive(self, i, leftover):
+        """
+        到達當前路點: 用本步剩餘的行走距離沿後續路點繼續前進，
+        走完全部路點後在目的地開始停留
+        """
+        while self.waypoints[i]:
+            self.target[i] = self.waypoints[i].pop(0)
+            delta = self.target[i] - self.positions[i]
+            dist = float(np.hypot(delta[0], delta[1]))
+            if dist > leftover:
+                self.positions[i] += delta * (leftover / dist)
+                return
+            self.positions[i] = self.target[i]
+            leftover -= dist
+        stops = self.plan.routines[self.routine[i]]["stops"]
+        self.dwelling[i] = True
+        self.dwell_until[i] = self.clock + self._dwell(stops[self.stop_index[i]])
+
+    def step(self, t=None, dt=None):
+        """
+        推進所有Tag
+
+        參數:
+            dt (float, optional): 經過的現實時間 (秒)，默認為距離上一步的時間 (第一步為1秒)
+        """
+        now = time.monotonic()
+        if dt is None:
+            dt = 1.0 if self.last_step is None else min(now - self.last_step, 10.0)
+        sim_dt = dt * self.time_scale
+        self.clock += sim_dt
+
+        # 停留結束的Tag出發
+        for i in np.flatnonzero(self.dwelling & (self.dwell_until <= self.clock)):
+            self._start_leg(i)
+
+        moving = ~self.dwelling
+        delta = self.target - self.positions
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        travel = self.speed * sim_dt
+        arrived = moving & (dist <= travel)
+        frac = np.where(arrived, 1.0, np.divide(travel, dist, out=np.ones_like(dist), where=dist > 0))
+        self.velocity[:] = 0.0
+        self.velocity[moving] = delta[moving] * frac[moving, None]
+        self.positions += self.velocity
+
+        leftover = travel - dist
+        for i in np.flatnonzero(arrived):
+            self._arrive(i, leftover[i])
+
+        self.quality = self.rng.integers(*QUALITY_RANGE, size=len(self), dtype=np.int16)
+        self.steps += 1
+        self.last_step = now
+
+    def zones(self):
+        """返回每個Tag當前所在區域在 plan.areas 中的序號 (-1表示不在任何區域內)"""
+        return self.plan.locate_many(self.positions[:, 0], self.positions[:, 1])
+
+    def routine_counts(self):
+        counts = {}
+        for name in self.routine:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量化的300B手環生理模型
+所有設備的生理狀態都保存在NumPy數組中，每次 step() 用一次批量運算推進全部設備，
+同一設備前後兩條消息的數值是連續的，不再每條消息獨立隨機
+
+每個設備的狀態:
+    晝夜節律     心率、血壓、皮膚溫度圍繞個人基線按一天的時間起伏 (下午最高、凌晨最低)
+    相關漂移     一個共同的潛在變量 (AR(1)過程) 同時驅動心率、血壓上升和血氧下降，
+                 再加上各指標自己的小噪聲
+    睡眠時段     每個設備有自己的入睡時間和睡眠時長，睡眠中心率和血壓降低、
+                 累計淺睡/深睡分鐘數和翻身次數，醒來時更新 "sleep time"/"wake time" 等字段
+    步數         清醒時按活動狀態累計步數，每天零點清零
+    活動         清醒時以一定概率開始/結束活動，活動中心率和血壓升高
+    異常發作     以很低的概率出現持續數十分鐘的心動過速/低血氧發作 (用於測試趨勢告警)
+    電池         按放電曲線下降，電量過低時摘下充電 (wear=0)，充滿後重新佩戴
+
+    model = HealthModel(1000, seed=1)
+    model.step()                     # 以當前時間推進一步
+    model.apply(payload, index)      # 把第index個設備的當前狀態寫入300B消息字典
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+
+# 潛在漂移變量的時間常數 (秒) 和它對各指標的影響 (每個標準差)
+DRIFT_TAU = 30 * 60
+DRIFT_GAIN = {"hr": 6.0, "bp syst": 8.0, "bp diast": 5.0, "SpO2": -0.8}
+# 各指標自己的測量噪聲 (標準差)
+NOISE_STD = {"hr": 1.5, "bp syst": 2.0, "bp diast": 1.5, "SpO2": 0.4, "skin temp": 0.05}
+# 晝夜節律振幅 (峰值在 CIRCADIAN_PEAK_HOUR)
+CIRCADIAN_PEAK_HOUR = 16.0
+CIRCADIAN_GAIN = {"hr": 5.0, "bp syst": 6.0, "bp diast": 4.0, "skin temp": 0.3}
+# 睡眠中的變化
+SLEEP_OFFSET = {"hr": -8.0, "bp syst": -10.0, "bp diast": -6.0, "skin temp": 0.4}
+DEEP_SLEEP_RATIO = 0.2
+SLEEP_MOVES_PER_HOUR = 4.0
+# 活動: 每小時開始活動的概率、平均持續時間 (秒)、步頻 (步/秒) 和對心率/血壓的影響
+ACTIVITY_START_PER_HOUR = 0.8
+ACTIVITY_MEAN_DURATION = 15 * 60
+ACTIVITY_STEP_RATE = 1.6
+IDLE_STEP_RATE = 0.02
+ACTIVITY_OFFSET = {"hr": 25.0, "bp syst": 12.0, "bp diast": 5.0}
+# 異常發作: 每小時發作概率、平均持續時間 (秒) 和影響
+EPISODE_PER_HOUR = 0.01
+EPISODE_MEAN_DURATION = 20 * 60
+EPISODE_OFFSET = {"hr": 30.0, "bp syst": 15.0, "bp diast": 8.0, "SpO2": -5.0}
+# 電池: 一次充滿可用的小時數範圍、充電速度 (每小時電量比例)、摘下充電的電量
+BATTERY_HOURS = (72.0, 120.0)
+CHARGE_PER_HOUR = 0.5
+CHARGE_BELOW = 0.05
+# 放電曲線: 剩餘能量比例 -> 顯示電量 (鋰電池在兩端下降較快)
+BATTERY_CURVE = (np.array([0.0, 0.05, 0.15, 0.5, 0.9, 1.0]),
+                 np.array([0.0, 3.0, 12.0, 55.0, 95.0, 100.0]))
+# 一步最多推進的時間 (秒)，兩次step間隔過長時 (例如暫停後) 不讓狀態一次跳變太多
+MAX_STEP_SECONDS = 600.0
+
+# 輸出的取值範圍
+HR_RANGE = (40, 180)
+SPO2_RANGE = (80, 100)
+SYST_RANGE = (80, 200)
+DIAST_RANGE = (45, 120)
+
+
+def _hour_text(hours):
+    """小時數 (可帶小數) 格式化為300B消息的 "H:MM" 形式"""
+    minutes = int(round(hours * 60)) % (24 * 60)
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+class HealthModel:
+    """
+    向量化的300B生理模型
+
+    參數:
+        count (int): 設備數量
+        seed (int, optional): 隨機數種子，用於可重現的模擬
+        t (float, optional): 初始時間 (Unix秒)，默認為當前時間
+    """
+
+    def __init__(self, count, seed=None, t=None):
+        self.count = count
+        self.rng = rng = np.random.default_rng(seed)
+        t = time.time() if t is None else t
+        # 本地時區偏移，用於計算一天中的時間和零點
+        self.utc_offset = datetime.fromtimestamp(t).astimezone().utcoffset().total_seconds()
+
+        # 個人基線
+        self.base = {
+            "hr": rng.normal(72.0, 6.0, count),
+            "SpO2": rng.uniform(95.5, 98.5, count),
+            "bp syst": rng.normal(122.0, 8.0, count),
+            "bp diast": rng.normal(78.0, 5.0, count),
+            "skin temp": rng.uniform(33.3, 34.3, count),
+            "room temp": rng.uniform(22.0, 26.0, count),
+        }
+        self.sleep_start = rng.uniform(21.5, 23.5, count)
+        self.sleep_hours = rng.uniform(6.5, 8.5, count)
+        self.battery_hours = rng.uniform(*BATTERY_HOURS, count)
+
+        # 動態狀態
+        self.drift = rng.standard_normal(count)
+        self.active = np.zeros(count, dtype=bool)
+        self.episode = np.zeros(count, dtype=bool)
+        self.charge = rng.uniform(0.3, 1.0, count)
+        self.charging = np.zeros(count, dtype=bool)
+        self.steps_today = rng.uniform(0, 3000, count)
+        self.asleep = self._asleep(self._hour_of_day(t))
+        self.sleep_minutes = np.zeros(count)
+        self.sleep_moves = np.zeros(count)
+
+        # 上一晚的睡眠摘要 (醒來時更新)
+        total = self.sleep_hours * 60
+        self.deep_minutes = np.round(total * DEEP_SLEEP_RATIO).astype(np.int64)
+        self.light_minutes = np.round(total).astype(np.int64) - self.deep_minutes
+        self.moves = rng.poisson(SLEEP_MOVES_PER_HOUR * self.sleep_hours)
+        self.sleep_text = [_hour_text(h) for h in self.sleep_start]
+        self.wake_text = [_hour_text(h) for h in self.sleep_start + self.sleep_hours]
+
+        self.t = t
+        self.day = self._day(t)
+        self.steps = 0
+        self.last_step = None
+        self._snapshot = None
+        self._snapshot_step = -1
+        self._vitals()
+
+    def __len__(self):
+        return self.count
+
+    def _hour_of_day(self, t):
+        return ((t + self.utc_offset) / 3600.0) % 24.0
+
+    def _day(self, t):
+        return int((t + self.utc_offset) // 86400)
+
+    def _asleep(self, hour):
+        # 睡眠時段可以跨過零點
+        return (hour - self.sleep_start) % 24.0 < self.sleep_hours
+
+    def _events(self, state, start_per_hour, mean_duration, dt, allowed):
+        """兩狀態馬爾可夫過程: 以每小時的概率開始，以平均持續時間結束"""
+        draw = self.rng.random(self.count)
+        start = ~state & allowed & (draw < start_per_hour * dt / 3600.0)
+        stop = state & ((draw < dt / mean_duration) | ~allowed)
+        return (state | start) & ~stop
+
+    def step(self, t=None):
+        """
+        推進所有設備一步
+
+        參數:
+            t (float, optional): 模擬時間 (Unix秒)，默認為當前時間
+        """
+        t = time.time() if t is None else t
+        dt = min(max(t - self.t, 0.0), MAX_STEP_SECONDS)
+        self.t = t
+        rng = self.rng
+        hour = self._hour_of_day(t)
+
+        # 零點清零步數
+        day = self._day(t)
+        if day != self.day:
+            self.steps_today[:] = 0
+            self.day = day
+
+        # 睡眠: 入睡時清零累計，醒來時把本次睡眠寫入摘要
+        asleep = self._asleep(hour)
+        woke = self.asleep & ~asleep
+        fell_asleep = asleep & ~self.asleep
+        if woke.any():
+            minutes = self.sleep_minutes[woke]
+            self.deep_minutes[woke] = np.round(minutes * DEEP_SLEEP_RATIO)
+            self.light_minutes[woke] = np.round(minutes) - self.deep_minutes[woke]
+            self.moves[woke] = self.sleep_moves[woke]
+        self.sleep_minutes[fell_asleep] = 0
+        self.sleep_moves[fell_asleep] = 0
+        self.asleep = asleep
+        self.sleep_minutes[asleep] += dt / 60.0
+        if dt:
+            self.sleep_moves[asleep] += rng.poisson(SLEEP_MOVES_PER_HOUR * dt / 3600.0, int(asleep.sum()))
+
+        # 相關漂移: 離散化的Ornstein-Uhlenbeck過程，保持平穩分佈為標準正態
+        decay = np.exp(-dt / DRIFT_TAU)
+        self.drift = self.drift * decay + np.sqrt(1.0 - decay * decay) * rng.standard_normal(self.count)
+
+        # 活動和異常發作
+        awake = ~asleep & ~self.charging
+        self.active = self._events(self.active, ACTIVITY_START_PER_HOUR, ACTIVITY_MEAN_DURATION, dt, awake)
+        self.episode = self._events(self.episode, EPISODE_PER_HOUR, EPISODE_MEAN_DURATION, dt,
+                                    np.ones(self.count, dtype=bool))
+        step_rate = np.where(self.active, ACTIVITY_STEP_RATE, IDLE_STEP_RATE) * awake
+        self.steps_today += rng.poisson(step_rate * dt)
+
+        # 電池: 佩戴時放電，電量過低時摘下充電，充滿後重新佩戴
+        self.charge -= np.where(self.charging, -CHARGE_PER_HOUR, 1.0 / self.battery_hours) * dt / 3600.0
+        np.clip(self.charge, 0.0, 1.0, out=self.charge)
+        self.charging = (self.charging & (self.charge < 1.0)) | (self.charge <= CHARGE_BELOW)
+
+        self._vitals(hour)
+        self.steps += 1
+        self.last_step = time.monotonic()
+
+    def step_if_due(self, interval, now=None):
+        """距離上一步已超過interval秒時才推進，供多個消息源共享同一個模型時使用"""
+        now = time.monotonic() if now is None else now
+        if self.last_step is None or now - self.last_step >= interval:
+            self.step()
+            return True
+        return False
+
+    def _vitals(self, hour=None):
+        """由當前狀態計算各項指標"""
+        hour = self._hour_of_day(self.t) if hour is None else hour
+        circadian = np.cos(2 * np.pi * (hour - CIRCADIAN_PEAK_HOUR) / 24.0)
+        rng = self.rng
+        values = {}
+        for field in ("hr", "bp syst", "bp diast", "SpO2", "skin temp"):
+            value = self.base[field].copy()
+            if field in CIRCADIAN_GAIN:
+                value += CIRCADIAN_GAIN[field] * circadian
+            if field in DRIFT_GAIN:
+                value += DRIFT_GAIN[field] * self.drift
+            if field in SLEEP_OFFSET:
+                value += SLEEP_OFFSET[field] * self.asleep
+            if field in ACTIVITY_OFFSET:
+                value += ACTIVITY_OFFSET[field] * self.active
+            if field in EPISODE_OFFSET:
+                value += EPISODE_OFFSET[field] * self.episode
+            value += NOISE_STD[field] * rng.standard_normal(self.count)
+            values[field] = value
+        # 室溫: 個人基線加上一天中的小幅變化
+        values["room temp"] = self.base["room temp"] + 1.0 * circadian
+        self.values = values
+
+    @property
+    def battery_level(self):
+        return np.interp(self.charge, *BATTERY_CURVE)
+
+    def arrays(self):
+        """返回當前狀態的各字段數組 (已取整並限制在合理範圍)"""
+        values = self.values
+        return {
+            "hr": np.clip(np.rint(values["hr"]), *HR_RANGE).astype(np.int64),
+            "SpO2": np.clip(np.rint(values["SpO2"]), *SPO2_RANGE).astype(np.int64),
+            "bp syst": np.clip(np.rint(values["bp syst"]), *SYST_RANGE).astype(np.int64),
+            "bp diast": np.clip(np.rint(values["bp diast"]), *DIAST_RANGE).astype(np.int64),
+            "skin temp": np.round(values["skin temp"], 1),
+            "room temp": np.round(values["room temp"], 1),
+            "steps": self.steps_today.astype(np.int64),
+            "light sleep (min)": self.light_minutes,
+            "deep sleep (min)": self.deep_minutes,
+            "move": self.moves.astype(np.int64),
+            "wear": (~self.charging).astype(np.int64),
+            "battery level": np.rint(self.battery_level).astype(np.int64),
+        }
+
+    def snapshot(self):
+        """
+        返回當前狀態的 {字段: Python列表}
+        每一步只轉換一次，逐條構建消息時不需要反覆讀取NumPy標量
+        """
+        if self._snapshot_step != self.steps:
+            snapshot = {field: values.tolist() for field, values in self.arrays().items()}
+            snapshot["sleep time"] = self.sleep_text
+            snapshot["wake time"] = self.wake_text
+            self._snapshot = snapshot
+            self._snapshot_step = self.steps
+        return self._snapshot
+
+    def apply(self, payload, index):
+        """把第index個設備的當前狀態寫入300B消息字典 (只更新消息中已有的字段)，返回payload"""
+        for field, values in self.snapshot().items():
+            if field in payload:
+                payload[field] = values[index]
+        return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="300B生理模型: 輸出一個設備一天的模擬數據，或測量批量推進速度")
+    parser.add_argument("-n", "--devices", type=int, default=1000, help="設備數量")
+    parser.add_argument("--seed", type=int, default=None, help="隨機數種子")
+    parser.add_argument("--interval", type=float, default=60.0, help="模擬的步長 (秒)")
+    parser.add_argument("--hours", type=float, default=24.0, help="模擬的時長 (小時)")
+    parser.add_argument("--show", type=int, default=-1, help="每小時打印第幾個設備的數據 (-1表示不打印)")
+    args = parser.parse_args()
+
+    start = time.time()
+    model = HealthModel(args.devices, seed=args.seed, t=start)
+    ticks = int(args.hours * 3600 / args.interval)
+    per_hour = max(1, int(3600 / args.interval))
+    began = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        model.step(start + tick * args.interval)
+        if args.show >= 0 and tick % per_hour == 0:
+            row = {field: values[args.show] for field, values in model.snapshot().items()}
+            print(datetime.fromtimestamp(model.t).strftime("%m-%d %H:%M"), row)
+    elapsed = time.perf_counter() - began
+    print(f"{args.devices} 個設備 × {ticks} 步, 用時 {elapsed:.2f} 秒 "
+          f"({args.devices * ticks / max(elapsed, 1e-9):,.0f} 設備步/秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端延遲探針
+發送端在每條JSON消息中加入 "probe" 字段:
+
+    "probe": {"src": 發送端ID, "seq": 序號, "t": 發送時間 (納秒), "clk": "mono" 或 "wall"}
+
+接收端按主題統計延遲直方圖 (p50/p95/p99/max)，並按 (src, 主題) 的序號檢測丟失、重複和亂序
+
+時鐘: 默認使用單調時鐘 (time.monotonic_ns)，同一台機器上的進程之間可以直接比較，
+不受系統時間調整影響；發送端和接收端在不同機器上時使用 "wall" (time.time_ns，需要NTP同步)
+
+獨立運行時作為只統計延遲的接收器:
+    python latency_probe.py -b localhost -t "+/#" --interval 5
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+
+# 直方圖精度: 每個2的冪區間分為 2^(SUB_BUCKET_BITS-1) 個子桶，相對誤差 < 1/2^(SUB_BUCKET_BITS-1)
+SUB_BUCKET_BITS = 8
+# 可記錄的最大延遲 (微秒, 約12天)，更大的值記入最後一個桶
+MAX_TRACKABLE_US = 1 << 40
+# 序號檢測的窗口: 落後超過此數量的缺失序號不再等待亂序到達，直接計為丟失
+SEQUENCE_WINDOW = 4096
+
+CLOCKS = ("mono", "wall")
+_CLOCK_FUNCTIONS = {"mono": time.monotonic_ns, "wall": time.time_ns}
+
+
+class ProbeStamper:
+    """
+    發送端: 在已序列化的JSON對象末尾插入probe字段 (不重新序列化，發送前最後一步蓋時間戳)
+
+    參數:
+        source (str, optional): 發送端ID，默認由主機名和進程號生成
+        clock (str): "mono" 或 "wall"
+    """
+
+    def __init__(self, source=None, clock="mono"):
+        if clock not in CLOCKS:
+            raise ValueError(f"未知的時鐘: {clock}")
+        self.source = source or f"{socket.gethostname()}-{os.getpid()}"
+        self.clock = clock
+        self._now = _CLOCK_FUNCTIONS[clock]
+        self._sequences = {}
+        self._lock = threading.Lock()
+
+    def stamp(self, topic, payload):
+        """
+        返回加入probe字段的負載 (str或bytes，與輸入相同)，不是JSON對象的負載原樣返回
+        序號按主題分別遞增
+        """
+        is_bytes = isinstance(payload, bytes)
+        text = payload.decode("utf-8") if is_bytes else payload
+        body = text.rstrip()
+        if not body.endswith("}"):
+            return payload
+        head = body[:-1].rstrip()
+        with self._lock:
+            seq = self._sequences.get(topic, 0)
+            self._sequences[topic] = seq + 1
+        separator = "" if head.endswith("{") else ", "
+        stamped = (f'{head}{separator}"probe": {{"src": "{self.source}", "seq": {seq}, '
+                   f'"t": {self._now()}, "clk": "{self.clock}"}}}}')
+        return stamped.encode("utf-8") if is_bytes else stamped
+
+
+class LatencyHistogram:
+    """
+    HDR風格的對數-線性直方圖 (微秒)，記錄是O(1)的整數運算，內存大小固定
+    """
+
+    def __init__(self):
+        half = 1 << (SUB_BUCKET_BITS - 1)
+        self.counts = [0] * ((MAX_TRACKABLE_US.bit_length() - SUB_BUCKET_BITS + 2) * half)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def _index(value):
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @staticmethod
+    def _value_at(index):
+        # 桶的代表值 (桶的中點)
+        if index < (1 << SUB_BUCKET_BITS):
+            return index
+        shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+        mantissa = index - (shift << (SUB_BUCKET_BITS - 1))
+        return (mantissa << shift) + ((1 << shift) >> 1)
+
+    def record(self, micros):
+        value = min(max(int(micros), 0), MAX_TRACKABLE_US - 1)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, fraction):
+        """返回百分位數 (微秒)，fraction為0~1"""
+        if not self.count:
+            return 0
+        target = max(1, int(fraction * self.count + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= target:
+                    return min(self._value_at(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "min": self.min or 0,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max
+        }
+
+
+class SequenceTracker:
+    """
+    一個 (src, 主題) 序列的丟失/重複/亂序檢測
+    缺失的序號在窗口內等待亂序到達，超出窗口後計為丟失
+    """
+    __slots__ = ("highest", "missing", "received", "duplicates", "reordered", "expired")
+
+    def __init__(self):
+        self.highest = None
+        self.missing = set()
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.expired = 0
+
+    def observe(self, seq):
+        self.received += 1
+        if self.highest is None:
+            self.highest = seq
+            return
+        if seq == self.highest + 1:
+            self.highest = seq
+        elif seq > self.highest:
+            # 只保留窗口內的缺失序號，更早的直接計為丟失
+            first = max(self.highest + 1, seq - SEQUENCE_WINDOW)
+            self.expired += first - (self.highest + 1)
+            self.missing.update(range(first, seq))
+            self.highest = seq
+        elif seq in self.missing:
+            self.missing.discard(seq)
+            self.reordered += 1
+        else:
+            self.duplicates += 1
+            return
+        if self.missing and len(self.missing) > SEQUENCE_WINDOW:
+            limit = self.highest - SEQUENCE_WINDOW
+            old = [s for s in self.missing if s < limit]
+            self.missing.difference_update(old)
+            self.expired += len(old)
+
+    @property
+    def lost(self):
+        return len(self.missing) + self.expired
+
+
+class LatencyTracker:
+    """
+    接收端: 按主題的延遲直方圖和按 (src, 主題) 的序號檢測 (線程安全)
+
+    record(topic, probe, received_at) 中 received_at 為接收時的 time.time()，
+    單調時鐘的探針按啟動時測得的時鐘差換算
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.sequences = {}
+        self.window = {}
+        self.invalid = 0
+        # time.time_ns() -> time.monotonic_ns() 的差值
+        self._wall_to_mono = time.monotonic_ns() - time.time_ns()
+
+    def record(self, topic, probe, received_at=None):
+        """
+        記錄一條帶probe字段的消息，probe不是有效的探針時返回False
+        """
+        try:
+            source = probe["src"]
+            seq = int(probe["seq"])
+            sent_ns = int(probe["t"])
+            clock = probe.get("clk", "mono")
+        except (TypeError, KeyError, ValueError, AttributeError):
+            self.invalid += 1
+            return False
+
+        received_ns = time.time_ns() if received_at is None else int(received_at * 1e9)
+        if clock == "mono":
+            received_ns += self._wall_to_mono
+        micros = (received_ns - sent_ns) / 1000
+
+        with self.lock:
+            histogram = self.histograms.get(topic)
+            if histogram is None:
+                histogram = self.histograms[topic] = LatencyHistogram()
+            histogram.record(micros)
+            window = self.window.get(topic)
+            if window is None:
+                window = self.window[topic] = LatencyHistogram()
+            window.record(micros)
+            tracker = self.sequences.get((source, topic))
+            if tracker is None:
+                tracker = self.sequences[(source, topic)] = SequenceTracker()
+            tracker.observe(seq)
+        return True
+
+    def _sequence_totals(self, topic):
+        totals = {"sources": 0, "lost": 0, "duplicates": 0, "reordered": 0}
+        for (source, seq_topic), tracker in self.sequences.items():
+            if seq_topic == topic:
+                totals["sources"] += 1
+                totals["lost"] += tracker.lost
+                totals["duplicates"] += tracker.duplicates
+                totals["reordered"] += tracker.reordered
+        return totals
+
+    def summary(self):
+        """返回 {主題: 延遲統計 + 丟失/重複/亂序}，累計自啟動以來"""
+        with self.lock:
+            return {topic: dict(histogram.summary(), **self._sequence_totals(topic))
+                    for topic, histogram in self.histograms.items()}
+
+    def report_lines(self, window=False):
+        """
+        格式化延遲報告，每個主題一行
+        window=True 時延遲只統計上次報告以來的消息 (丟失等仍為累計)，並開始新的窗口
+        """
+        with self.lock:
+            if window:
+                histograms, self.window = self.window, {}
+            else:
+                histograms = dict(self.histograms)
+            lines = []
+            for topic in sorted(histograms):
+                s = histograms[topic].summary()
+                seq = self._sequence_totals(topic)
+                lines.append(f"[延遲] {topic}: {s['count']} 條, p50 {s['p50'] / 1000:.2f}ms "
+                             f"p95 {s['p95'] / 1000:.2f}ms p99 {s['p99'] / 1000:.2f}ms "
+                             f"max {s['max'] / 1000:.2f}ms, 丟失 {seq['lost']}, 重複 {seq['duplicates']}, "
+                             f"亂序 {seq['reordered']} ({seq['sources']} 個發送端)")
+            if self.invalid:
+                lines.append(f"[延遲] 無效的探針: {self.invalid}")
+            return lines
+
+
+def probe_of(data):
+    """從已解析的消息 (字典或payload_decoders的記錄) 中取出probe字段"""
+    if data is None or not hasattr(data, "get"):
+        return None
+    return data.get("probe")
+
+
+def main():
+    import json
+    import paho.mqtt.client as mqtt
+
+    parser = argparse.ArgumentParser(description="只統計延遲探針的MQTT接收器")
+    parser.add_argument("-b", "--broker", default="localhost", help="MQTT伺服器地址")
+    parser.add_argument("-p", "--port", type=int, default=1883, help="MQTT伺服器端口")
+    parser.add_argument("-t", "--topic", action="append", help="訂閱的主題 (可多次使用，默認 #)")
+    parser.add_argument("--interval", type=float, default=5.0, help="報告間隔 (秒)")
+    parser.add_argument("--duration", type=float, default=0, help="運行時長 (秒, 0表示直到Ctrl+C)")
+    args = parser.parse_args()
+
+    tracker = LatencyTracker()
+    counts = {"messages": 0, "without_probe": 0}
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            for topic in args.topic or ["#"]:
+                client.subscribe(topic, qos=1)
+                print(f"已訂閱主題: {topic}")
+        else:
+            print(f"連接失敗，返回碼: {rc}")
+
+    def on_message(client, userdata, msg):
+        received_at = time.time()
+        counts["messages"] += 1
+        try:
+            probe = probe_of(json.loads(msg.payload))
+        except ValueError:
+            probe = None
+        if probe is None:
+            counts["without_probe"] += 1
+        else:
+            tracker.record(msg.topic, probe, received_at)
+
+    client = mqtt.Client(client_id=f"latency-probe-{os.getpid()}")
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    deadline = time.monotonic() + args.duration if args.duration > 0 else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(args.interval)
+            for line in tracker.report_lines(window=True):
+                print(line)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+    print(f"\n共接收 {counts['messages']} 條消息, 其中 {counts['without_probe']} 條沒有探針")
+    for line in tracker.report_lines():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
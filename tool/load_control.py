@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+負載生成的速率控制工具
+- TokenBucket: 令牌桶限速，按目標速率發放令牌，只在令牌不足時才休眠所欠的時間
+- RateReporter: 定期輸出發送速率摘要，代替逐條消息打印
+"""
+
+import time
+
+
+class TokenBucket:
+    """
+    令牌桶限速器
+
+    參數:
+        rate (float): 每秒發放的令牌數 (目標消息速率)，<=0 表示不限速
+        burst (float, optional): 桶容量，允許短時間突發的消息數，默認為0.1秒的令牌量
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate * 0.1)
+        # 從空桶開始，避免啟動瞬間的突發使實際速率高於目標
+        self.tokens = 0.0
+        self.last = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def try_acquire(self, n=1):
+        """不阻塞地嘗試取得n個令牌，成功返回True"""
+        if self.rate <= 0:
+            return True
+        self._refill(time.monotonic())
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def delay(self, n=1):
+        """返回取得n個令牌還需要等待的秒數 (不消耗令牌)"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        return max(0.0, (n - self.tokens) / self.rate)
+
+    def acquire(self, n=1):
+        """阻塞直到取得n個令牌"""
+        if self.rate <= 0:
+            return
+        while True:
+            self._refill(time.monotonic())
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            time.sleep((n - self.tokens) / self.rate)
+
+
+class RateReporter:
+    """
+    發送速率統計，每 interval 秒輸出一行摘要
+
+    參數:
+        target_rate (float): 目標速率 (msg/s)，<=0 表示不限速
+        interval (float): 摘要輸出間隔 (秒)
+        label (str): 摘要行的前綴
+        output (callable): 輸出函數，默認為print
+    """
+
+    def __init__(self, target_rate=0, interval=1.0, label="負載測試", output=print):
+        self.target_rate = target_rate
+        self.interval = interval
+        self.label = label
+        self.output = output
+        self.sent = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self._window_start = self.start
+        self._window_sent = 0
+        self._next_report = self.start + interval
+
+    def record(self, ok=True, n=1):
+        """記錄n條消息的發送結果，到達輸出間隔時打印摘要"""
+        if ok:
+            self.sent += n
+            self._window_sent += n
+        else:
+            self.failed += n
+
+        now = time.monotonic()
+        if now >= self._next_report:
+            self.report(now)
+
+    def report(self, now=None):
+        now = time.monotonic() if now is None else now
+        window = now - self._window_start
+        current = self._window_sent / window if window > 0 else 0.0
+        target = f"{self.target_rate:.0f}" if self.target_rate > 0 else "不限"
+        self.output(f"[{self.label}] 已發送 {self.sent} 條, 當前速率 {current:.0f} msg/s "
+                    f"(目標 {target}), 失敗 {self.failed}")
+        self._window_start = now
+        self._window_sent = 0
+        self._next_report = now + self.interval
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def achieved_rate(self):
+        elapsed = self.elapsed()
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """返回整體統計字典"""
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "elapsed": self.elapsed(),
+            "target_rate": self.target_rate,
+            "achieved_rate": self.achieved_rate()
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        self.output(f"\n===== {self.label}結果 =====")
+        self.output(f"持續時間: {s['elapsed']:.2f} 秒")
+        self.output(f"成功發送: {s['sent']} 條, 失敗: {s['failed']} 條")
+        if self.target_rate > 0:
+            ratio = s["achieved_rate"] / self.target_rate * 100
+            self.output(f"實際速率: {s['achieved_rate']:.1f} msg/s / 目標 {self.target_rate:.0f} msg/s ({ratio:.1f}%)")
+        else:
+            self.output(f"實際速率: {s['achieved_rate']:.1f} msg/s (不限速)")
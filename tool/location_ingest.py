@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gateway端的位置數據處理
+解析 GW*_Loca 主題的 location 消息 (字典或類型化記錄)，保存每個Tag的最新位置，
+並通過空間索引把每個定位點對應到電子圍欄 (區域多邊形)，
+只有Tag所在區域發生變化時才產生進入/離開事件
+
+電子圍欄配置JSON可以是:
+    {"geofences": [{"id": "bath_1", "name": "浴室", "polygon": [[x, y], ...]}, ...]}
+或 floor_plan.py 的平面圖格式 (使用其中的 zones，不含門)
+"""
+
+import json
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from floor_plan import GRID_CELL_SIZE, Zone, ZoneGridIndex, load_floor_plan
+from payload_decoders import PayloadRecord
+
+# zone 為 floor_plan.Zone，kind 為 "enter" 或 "exit"
+ZoneEvent = namedtuple("ZoneEvent", ["kind", "tag", "zone", "time", "x", "y"])
+
+# 尚未收到過定位的Tag / 不在任何圍欄內
+ZONE_UNKNOWN = -2
+ZONE_OUTSIDE = -1
+
+
+def load_geofences(path=None):
+    """
+    載入電子圍欄，path為None或"default"時使用默認平面圖的房間和走廊
+
+    返回:
+        list: floor_plan.Zone 列表，重疊時排在前面的優先
+    """
+    if path is None or path == "default":
+        return load_floor_plan().zones
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if "geofences" in spec:
+        return [Zone(i, dict({"kind": "geofence"}, **fence)) for i, fence in enumerate(spec["geofences"])]
+    return load_floor_plan(path).zones
+
+
+class TagPositionStore:
+    """
+    每個Tag最新位置的緊湊存儲
+    Tag id 映射到槽位，數值保存在按需擴容的NumPy數組中，不為每個Tag保存消息字典
+    """
+
+    def __init__(self, capacity=1024):
+        self.slots = {}
+        self.tags = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = len(self.tags)
+
+        def grow(array, fill, dtype):
+            new = np.full(capacity, fill, dtype=dtype)
+            if array is not None:
+                new[:old] = array[:old]
+            return new
+
+        self.x = grow(getattr(self, "x", None), np.nan, np.float64)
+        self.y = grow(getattr(self, "y", None), np.nan, np.float64)
+        self.z = grow(getattr(self, "z", None), np.nan, np.float64)
+        self.quality = grow(getattr(self, "quality", None), 0, np.int16)
+        self.seen = grow(getattr(self, "seen", None), 0.0, np.float64)
+        self.zone = grow(getattr(self, "zone", None), ZONE_UNKNOWN, np.int32)
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.tags)
+
+    def slot(self, tag):
+        """返回Tag的槽位，第一次出現時分配"""
+        slot = self.slots.get(tag)
+        if slot is None:
+            slot = len(self.tags)
+            if slot >= self.capacity:
+                self._allocate(self.capacity * 2)
+            self.slots[tag] = slot
+            self.tags.append(tag)
+        return slot
+
+    def get(self, tag):
+        """返回Tag的最新位置字典，沒有記錄時返回None"""
+        slot = self.slots.get(tag)
+        if slot is None:
+            return None
+        return {
+            "x": float(self.x[slot]),
+            "y": float(self.y[slot]),
+            "z": float(self.z[slot]),
+            "quality": int(self.quality[slot]),
+            "time": float(self.seen[slot]),
+            "zone": int(self.zone[slot])
+        }
+
+
+class LocationIngest:
+    """
+    位置數據處理階段
+
+    參數:
+        geofences: 電子圍欄多邊形列表 (見 load_geofences)
+        cell_size (float): 空間索引的網格大小 (米)
+        on_event (callable, optional): 每個 ZoneEvent 產生時調用
+    """
+
+    def __init__(self, geofences, cell_size=GRID_CELL_SIZE, on_event=None):
+        self.index = ZoneGridIndex(geofences, cell_size)
+        self.fences = self.index.areas
+        self.store = TagPositionStore()
+        self.on_event = on_event
+        self.messages = 0
+        self.ignored = 0
+        self.events = 0
+
+    @staticmethod
+    def _parse(message):
+        """從location消息 (字典或payload_decoders的記錄) 中取出 (tag, x, y, z, quality)，格式不符時返回None"""
+        if isinstance(message, PayloadRecord):
+            if message.content != "location" or message.id is None:
+                return None
+            position = message.position
+            try:
+                return (message.id, float(position.x), float(position.y),
+                        float(position.z or 0.0), int(position.quality or 0))
+            except (AttributeError, TypeError, ValueError):
+                return None
+        if not isinstance(message, dict) or message.get("content") != "location":
+            return None
+        position = message.get("position")
+        tag = message.get("id")
+        if not isinstance(position, dict) or tag is None:
+            return None
+        try:
+            return (tag, float(position["x"]), float(position["y"]),
+                    float(position.get("z") or 0.0), int(position.get("quality") or 0))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _transition(self, slot, zone, now, x, y):
+        store = self.store
+        previous = int(store.zone[slot])
+        store.zone[slot] = zone
+        if previous == zone:
+            return []
+
+        events = []
+        tag = store.tags[slot]
+        if previous >= 0:
+            events.append(ZoneEvent("exit", tag, self.fences[previous], now, x, y))
+        if zone >= 0:
+            events.append(ZoneEvent("enter", tag, self.fences[zone], now, x, y))
+        self.events += len(events)
+        if self.on_event:
+            for event in events:
+                self.on_event(event)
+        return events
+
+    def ingest(self, message, received_at=None):
+        """
+        處理一條已解析的消息字典，返回產生的 ZoneEvent 列表
+        非location消息會被忽略並返回空列表
+        """
+        fix = self._parse(message)
+        if fix is None:
+            self.ignored += 1
+            return []
+        self.messages += 1
+        now = time.time() if received_at is None else received_at
+
+        tag, x, y, z, quality = fix
+        store = self.store
+        slot = store.slot(tag)
+        store.x[slot] = x
+        store.y[slot] = y
+        store.z[slot] = z
+        store.quality[slot] = quality
+        store.seen[slot] = now
+
+        return self._transition(slot, self.index.locate_order(x, y), now, x, y)
+
+    def ingest_many(self, messages, received_at=None):
+        """
+        批量處理多條消息 (例如從接收隊列一次取出的一批)，定位使用向量化查詢
+        同一個Tag在一批中出現多次時按順序逐條比較，事件不會遺漏
+        """
+        fixes = [fix for fix in map(self._parse, messages) if fix is not None]
+        self.ignored += len(messages) - len(fixes)
+        if not fixes:
+            return []
+        self.messages += len(fixes)
+        now = time.time() if received_at is None else received_at
+
+        xs = np.fromiter((f[1] for f in fixes), dtype=np.float64, count=len(fixes))
+        ys = np.fromiter((f[2] for f in fixes), dtype=np.float64, count=len(fixes))
+        zones = self.index.locate_many(xs, ys).tolist()
+
+        store = self.store
+        events = []
+        for (tag, x, y, z, quality), zone in zip(fixes, zones):
+            slot = store.slot(tag)
+            store.x[slot] = x
+            store.y[slot] = y
+            store.z[slot] = z
+            store.quality[slot] = quality
+            store.seen[slot] = now
+            events.extend(self._transition(slot, zone, now, x, y))
+        return events
+
+    def occupancy(self):
+        """返回 {圍欄名稱: 目前在其中的Tag數}，不含不在任何圍欄內的Tag"""
+        counts = np.bincount(self.store.zone[:len(self.store)].clip(min=-1) + 1, minlength=len(self.fences) + 1)
+        return {fence.name: int(counts[i + 1]) for i, fence in enumerate(self.fences) if counts[i + 1]}
+
+    def summary(self):
+        return {
+            "messages": self.messages,
+            "ignored": self.ignored,
+            "tags": len(self.store),
+            "events": self.events
+        }
+
+
+def format_event(event):
+    """格式化一條圍欄事件用於顯示"""
+    action = "進入" if event.kind == "enter" else "離開"
+    return f"[圍欄] Tag {event.tag} {action} {event.zone.name} (X={event.x:.2f}, Y={event.y:.2f})"
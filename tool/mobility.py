@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量化的Tag移動模型
+所有Tag的位置、速度和移動模式參數都保存在NumPy數組中，
+每次 step() 用一次批量運算推進全部Tag，不需要逐個用戶的Python循環
+
+移動模式 (按Tag由配置分配，不再按用戶ID寫死):
+    vertical     上下移動 (Y軸正弦波動，X軸極小抖動)
+    horizontal   左右移動 (X軸正弦波動，Y軸極小抖動)
+    diagonal     斜向移動
+    static       幾乎不動
+    circular     圓形移動
+    random_walk  隨機遊走
+"""
+
+import time
+
+import numpy as np
+
+# 每種模式的參數: (X軸週期振幅, Y軸週期振幅, X軸隨機抖動, Y軸隨機抖動)
+# X軸週期分量使用cos，Y軸使用sin，與原來的逐用戶實現一致
+PATTERN_PARAMS = {
+    "vertical": (0.0, 0.05, 0.005, 0.0),
+    "horizontal": (0.05, 0.0, 0.0, 0.005),
+    "diagonal": (0.03, 0.03, 0.0, 0.0),
+    "static": (0.0, 0.0, 0.002, 0.002),
+    "circular": (0.04, 0.04, 0.0, 0.0),
+    "random_walk": (0.0, 0.0, 0.02, 0.02),
+}
+PATTERNS = tuple(PATTERN_PARAMS)
+PATTERN_CODES = {name: code for code, name in enumerate(PATTERNS)}
+_PARAM_TABLE = np.array([PATTERN_PARAMS[name] for name in PATTERNS], dtype=np.float64)
+
+# 未指定配置時的默認分配: 前五個Tag沿用原來E001~E005的模式，其餘隨機遊走
+LEGACY_PATTERNS = ("vertical", "horizontal", "diagonal", "static", "circular")
+DEFAULT_PATTERN = "random_walk"
+
+# 信號質量的隨機範圍 [low, high)
+QUALITY_RANGE = (75, 99)
+
+
+def parse_pattern_weights(text):
+    """
+    解析命令行的模式權重，例如 "random_walk=6,circular=2,static=2"
+    返回 {模式: 權重}
+    """
+    weights = {}
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PATTERN_PARAMS:
+            raise ValueError(f"未知的移動模式: {name} (可用: {', '.join(PATTERNS)})")
+        weights[name] = float(weight) if weight else 1.0
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("移動模式權重必須至少有一個大於0")
+    return weights
+
+
+def assign_patterns(count, weights=None, rng=None):
+    """
+    為count個Tag分配移動模式，返回模式代碼數組 (int8)
+
+    參數:
+        weights (dict, optional): {模式: 權重}，按權重隨機分配；
+            None 表示前五個Tag使用LEGACY_PATTERNS，其餘使用DEFAULT_PATTERN
+    """
+    if weights is None:
+        codes = np.full(count, PATTERN_CODES[DEFAULT_PATTERN], dtype=np.int8)
+        legacy = [PATTERN_CODES[name] for name in LEGACY_PATTERNS[:count]]
+        codes[:len(legacy)] = legacy
+        return codes
+
+    rng = rng if rng is not None else np.random.default_rng()
+    names = list(weights)
+    p = np.array([weights[name] for name in names], dtype=np.float64)
+    choices = rng.choice(len(names), size=count, p=p / p.sum())
+    return np.array([PATTERN_CODES[name] for name in names], dtype=np.int8)[choices]
+
+
+class TagModel:
+    """
+    Tag移動模型的共用介面，子類需要維護 positions (N, 2)、quality (N,)，
+    並在 step() 中遞增 steps、更新 last_step
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.last_step = None
+        self._snapshot = None
+        self._snapshot_step = -1
+
+    def __len__(self):
+        return len(self.positions)
+
+    def step(self, t=None):
+        raise NotImplementedError
+
+    def step_if_due(self, interval, now=None):
+        """距離上一步已超過interval秒時才推進，供多個設備共享同一個模型時使用"""
+        now = time.monotonic() if now is None else now
+        if self.last_step is None or now - self.last_step >= interval:
+            self.step()
+            return True
+        return False
+
+    def snapshot(self):
+        """
+        返回當前狀態的Python列表 (x列表, y列表, 質量列表)，位置保留6位小數
+        每一步只轉換一次，逐條構建消息時不需要反覆讀取NumPy標量
+        """
+        if self._snapshot_step != self.steps:
+            rounded = np.round(self.positions, 6)
+            self._snapshot = (rounded[:, 0].tolist(), rounded[:, 1].tolist(), self.quality.tolist())
+            self._snapshot_step = self.steps
+        return self._snapshot
+
+
+class MobilityModel(TagModel):
+    """
+    向量化的移動模型
+
+    參數:
+        positions: 初始位置，形狀為 (N, 2) 的數組或 [(x, y), ...]
+        patterns: 模式代碼數組 (見 assign_patterns) 或模式名稱列表
+        bounds (tuple): (min_x, max_x, min_y, max_y) 移動範圍
+        quality: 初始信號質量，None表示隨機生成
+        seed (int, optional): 隨機數種子，用於可重現的模擬
+    """
+
+    def __init__(self, positions, patterns, bounds, quality=None, seed=None):
+        super().__init__()
+        self.rng = np.random.default_rng(seed)
+        self.positions = np.array(positions, dtype=np.float64).reshape(-1, 2)
+        count = len(self.positions)
+
+        patterns = np.asarray(patterns)
+        if patterns.dtype.kind in "US":
+            patterns = np.array([PATTERN_CODES[name] for name in patterns], dtype=np.int8)
+        if len(patterns) != count:
+            raise ValueError(f"移動模式數量 ({len(patterns)}) 與Tag數量 ({count}) 不一致")
+        self.patterns = patterns.astype(np.int8)
+
+        # 每個Tag的模式參數，分配模式後一次性查表，step() 中不再分支
+        params = _PARAM_TABLE[self.patterns]
+        self.amplitude = params[:, :2].copy()
+        self.jitter = params[:, 2:].copy()
+
+        self.lower = np.array([bounds[0], bounds[2]], dtype=np.float64)
+        self.upper = np.array([bounds[1], bounds[3]], dtype=np.float64)
+        np.clip(self.positions, self.lower, self.upper, out=self.positions)
+
+        self.velocity = np.zeros_like(self.positions)
+        if quality is None:
+            self.quality = self.rng.integers(*QUALITY_RANGE, size=count, dtype=np.int16)
+        else:
+            self.quality = np.array(quality, dtype=np.int16)
+
+    def step(self, t=None):
+        """
+        推進所有Tag一步
+
+        參數:
+            t (float, optional): 用於週期運動的時間 (秒)，默認為當前時間
+        """
+        t = time.time() if t is None else t
+        # 時間循環在0到2π之間，週期分量 (cos, sin) 對所有Tag相同
+        phase = t % (2 * np.pi)
+        wave = np.array([np.cos(phase), np.sin(phase)])
+
+        noise = self.rng.uniform(-1.0, 1.0, size=self.positions.shape)
+        np.multiply(self.amplitude, wave, out=self.velocity)
+        self.velocity += noise * self.jitter
+
+        self.positions += self.velocity
+        np.clip(self.positions, self.lower, self.upper, out=self.positions)
+        self.quality = self.rng.integers(*QUALITY_RANGE, size=len(self), dtype=np.int16)
+
+        self.steps += 1
+        self.last_step = time.monotonic()
+
+    def pattern_counts(self):
+        """返回 {模式名稱: Tag數量}"""
+        counts = np.bincount(self.patterns, minlength=len(PATTERNS))
+        return {name: int(counts[code]) for code, name in enumerate(PATTERNS) if counts[code]}
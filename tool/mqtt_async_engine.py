@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio MQTT發送引擎
+所有模擬設備共用一個事件循環和一個MQTT連接:
+- MQTT客戶端的socket讀寫由事件循環驅動 (不使用 loop_start() 的背景線程)
+- 每個設備模型是一個按自己間隔運行的定時任務，發送不會阻塞其他設備
+- Ctrl+C 或到達運行時長時取消所有任務並斷開連接
+
+設備模型需要提供:
+    interval        發送間隔 (秒)
+    name            顯示名稱
+    tick()          返回本次要發送的消息列表 [(主題, 消息字典或字符串), ...]
+                    也可以返回 (主題, 消息, qos, retain)
+"""
+
+import asyncio
+import json
+import random
+import signal
+import time
+
+import paho.mqtt.client as mqtt
+
+from load_control import RateReporter
+
+
+class DeviceModel:
+    """設備模型基類，子類實現 tick()"""
+
+    interval = 1.0
+    name = "device"
+    qos = 0
+    retain = False
+
+    def tick(self):
+        raise NotImplementedError
+
+
+class _AsyncioSocketBridge:
+    """把paho客戶端的socket事件接到asyncio事件循環上 (參考paho的loop_asyncio示例)"""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc_task = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc_task = self.loop.create_task(self._misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc_task:
+            self.misc_task.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # 處理keepalive和重發，相當於 loop() 中的定時部分
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+class AsyncMqttEngine:
+    """
+    共用的asyncio發送引擎
+
+    參數:
+        broker (str): MQTT伺服器地址
+        port (int): MQTT伺服器端口
+        client_id (str): MQTT客戶端ID
+        report_interval (float): 速率摘要的輸出間隔 (秒)，<=0 表示不輸出
+        label (str): 摘要行的前綴
+    """
+
+    def __init__(self, broker, port, client_id, keepalive=60, report_interval=5.0, label="模擬器", probe=None):
+        self.broker = broker
+        self.port = port
+        self.keepalive = keepalive
+        self.client = mqtt.Client(client_id=client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.devices = []
+        # 延遲探針 (latency_probe.ProbeStamper)，設置時每條消息發送前蓋上時間戳和序號
+        self.probe = probe
+        self.reporter = RateReporter(interval=report_interval if report_interval > 0 else float("inf"),
+                                     label=label)
+        self._connected = None
+        self._disconnected = None
+        self._stop = None
+        self._tasks = []
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if self._connected is not None and not self._connected.done():
+            self._connected.set_result(rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self._disconnected is not None and not self._disconnected.done():
+            self._disconnected.set_result(rc)
+        if rc != 0:
+            print(f"與MQTT伺服器的連接中斷，返回碼: {rc}")
+
+    def add_device(self, device):
+        self.devices.append(device)
+        return device
+
+    def add_devices(self, devices):
+        for device in devices:
+            self.add_device(device)
+
+    async def connect(self, timeout=10.0):
+        loop = asyncio.get_running_loop()
+        _AsyncioSocketBridge(loop, self.client)
+        self._connected = loop.create_future()
+        self.client.connect(self.broker, self.port, self.keepalive)
+        rc = await asyncio.wait_for(self._connected, timeout)
+        if rc != 0:
+            raise ConnectionError(f"MQTT伺服器拒絕連接，返回碼: {rc}")
+        print(f"已連接到MQTT代理 {self.broker}:{self.port}")
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """不阻塞地發送一條消息 (只放入發送隊列，由事件循環寫出)，返回是否成功"""
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload)
+        if self.probe:
+            payload = self.probe.stamp(topic, payload)
+        try:
+            ok = self.client.publish(topic, payload, qos=qos, retain=retain).rc == mqtt.MQTT_ERR_SUCCESS
+        except Exception:
+            ok = False
+        self.reporter.record(ok)
+        return ok
+
+    def _publish_all(self, device, messages):
+        for message in messages or ():
+            if len(message) == 2:
+                topic, payload = message
+                qos, retain = device.qos, device.retain
+            else:
+                topic, payload, qos, retain = message
+            self.publish(topic, payload, qos, retain)
+
+    async def _run_device(self, device, start):
+        # 按固定節拍運行: 第k次在 start + k*interval，耗時不會累積成漂移
+        interval = device.interval
+        next_tick = start
+        while True:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                self._publish_all(device, device.tick())
+            except Exception as e:
+                print(f"設備 {device.name} 生成消息時出錯: {e}")
+            next_tick += interval
+            # 落後超過一個周期時跳過錯過的節拍，而不是連續補發
+            now = time.monotonic()
+            if next_tick < now - interval:
+                next_tick = now
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def run(self, duration=0, spread=True):
+        """
+        運行所有設備直到 stop()、Ctrl+C 或到達運行時長
+
+        參數:
+            duration (float): 運行時長 (秒)，0表示一直運行
+            spread (bool): 是否把各設備的首次發送隨機分散在一個周期內，避免同時突發
+        """
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows的事件循環不支持信號處理，由KeyboardInterrupt結束
+
+        if not self.client.is_connected():
+            await self.connect()
+
+        start = time.monotonic()
+        self._tasks = [
+            loop.create_task(self._run_device(
+                device, start + (random.uniform(0, device.interval) if spread else 0)))
+            for device in self.devices
+        ]
+        print(f"引擎已啟動: {len(self.devices)} 個設備")
+
+        try:
+            if duration > 0:
+                await asyncio.wait_for(self._stop.wait(), duration)
+            else:
+                await self._stop.wait()
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            try:
+                loop.remove_signal_handler(signal.SIGINT)
+            except (NotImplementedError, RuntimeError):
+                pass
+            await self.shutdown()
+        return self.reporter.summary()
+
+    async def shutdown(self):
+        """取消所有設備任務，等待發送隊列寫出後斷開連接"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # 讓事件循環有機會把已排隊的消息寫出
+        deadline = time.monotonic() + 2.0
+        while self.client.want_write() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        self._disconnected = asyncio.get_running_loop().create_future()
+        self.client.disconnect()
+        try:
+            await asyncio.wait_for(self._disconnected, 1.0)
+        except asyncio.TimeoutError:
+            pass
+        self.reporter.print_summary()
+
+
+def run_engine(engine, duration=0):
+    """同步入口: 在新的事件循環中運行引擎，返回統計字典"""
+    try:
+        return asyncio.run(engine.run(duration))
+    except KeyboardInterrupt:
+        print("\n用戶中止")
+        return engine.reporter.summary()
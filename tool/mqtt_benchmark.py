@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python工具的基準測試: 發送、模擬器、接收回調和Excel轉換的吞吐量 (msg/s) 和延遲
+
+默認在進程內啟動 embedded_broker 作為本地代理，不依賴外部伺服器，結果寫入JSON文件，
+可與另一次提交的結果比較:
+
+    python mqtt_benchmark.py -o before.json
+    (修改代碼)
+    python mqtt_benchmark.py -o after.json --compare before.json
+
+指標命名: *_per_s 越大越好；*_ms、*_us、seconds 越小越好；max_* 受偶發停頓影響太大，
+和其他指標一樣只作參考，不參與比較
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+from embedded_broker import EmbeddedBroker
+from latency_probe import LatencyHistogram, LatencyTracker, ProbeStamper, probe_of
+from uwb_catalog import load_catalog
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOL_DIR)
+DEFAULT_JSON_FILE = os.path.join(REPO_DIR, "UWB_JSON_20250225.json")
+DEFAULT_EXCEL_FILE = os.path.join(REPO_DIR, "UWB_JSON_20250225.xlsx")
+
+# 比較時超過此比例變差的指標計為退化
+DEFAULT_THRESHOLD = 0.10
+# 等待訂閱者收完消息的最長時間 (秒)
+DELIVERY_TIMEOUT = 10.0
+
+# 已註冊的基準測試: 名稱 -> 函數 (BenchContext) -> 指標字典
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """註冊一個基準測試"""
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class BenchContext:
+    """
+    基準測試的共用設置
+
+    參數:
+        host, port: MQTT代理地址
+        scale (float): 規模係數 (消息數、用戶數和時長按比例縮放)，--quick 時為0.2
+        json_file (str): 消息目錄
+    """
+
+    def __init__(self, host, port, scale=1.0, json_file=DEFAULT_JSON_FILE, excel_file=DEFAULT_EXCEL_FILE):
+        self.host = host
+        self.port = port
+        self.scale = scale
+        self.json_file = json_file
+        self.excel_file = excel_file
+        self._catalog = None
+
+    def count(self, n):
+        return max(1, int(n * self.scale))
+
+    def seconds(self, s):
+        return max(0.5, s * self.scale)
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            self._catalog = load_catalog(self.json_file)
+        return self._catalog
+
+    def client(self, name):
+        client = mqtt.Client(client_id=f"bench-{name}-{os.getpid()}")
+        client.connect(self.host, self.port, 60)
+        return client
+
+    def sample_messages(self):
+        """返回接收測試用的 [(主題, 負載bytes)]: 目錄中location/300B/尿布/heartbeat的GW主題消息"""
+        from mqtt_sender import _fleet_template, resolve_topic
+        samples = []
+        for content in ("location", "300B", "diaper DV1", "heartbeat"):
+            entry = _fleet_template(self.catalog, content)
+            if entry is not None:
+                samples.append((resolve_topic(entry.topic), json.dumps(entry.payload).encode("utf-8")))
+        return samples
+
+
+class CountingSubscriber:
+    """訂閱所有主題並計數，用於確認消息確實經過代理送達 (不計保留消息)"""
+
+    def __init__(self, ctx, topic="#"):
+        self.received = 0
+        self.retained = 0
+        self.target = None
+        self.done = threading.Event()
+        self.client = ctx.client("sub")
+        self.client.on_message = self._on_message
+        subscribed = threading.Event()
+        self.client.on_subscribe = lambda *args: subscribed.set()
+        self.client.subscribe(topic, qos=0)
+        self.client.loop_start()
+        subscribed.wait(5.0)
+
+    def _on_message(self, client, userdata, msg):
+        # 訂閱時收到的保留消息是之前的基準測試留下的 (模擬器以retain=True發送)，不計入本次送達
+        if msg.retain:
+            self.retained += 1
+            return
+        self.received += 1
+        if self.target is not None and self.received >= self.target:
+            self.done.set()
+
+    def wait_for(self, count, timeout=DELIVERY_TIMEOUT):
+        self.target = count
+        if self.received < count:
+            self.done.wait(timeout)
+        return self.received
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被測工具的控制台輸出 (輸出本身也是被測路徑的一部分，寫入空設備)"""
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _delivery(subscriber, sent):
+    received = subscriber.wait_for(sent)
+    return {"delivered": received, "delivery_ratio": received / sent if sent else 0.0}
+
+
+# ---------- 發送 ----------
+
+def _bench_load_test(ctx, dynamic):
+    import mqtt_sender
+    messages = mqtt_sender.extract_messages_by_type(ctx.catalog, "From Gateway")
+    total = ctx.count(100000)
+    subscriber = CountingSubscriber(ctx)
+    client = ctx.client("sender")
+    try:
+        with quiet():
+            result = mqtt_sender.run_load_test(client, messages, rate=0, max_messages=total, dynamic=dynamic,
+                                               report_interval=3600)
+    finally:
+        client.disconnect()
+    metrics = {"messages": result["sent"], "seconds": result["elapsed"], "publish_per_s": result["achieved_rate"]}
+    metrics.update(_delivery(subscriber, result["sent"]))
+    subscriber.close()
+    return metrics
+
+
+@benchmark("sender.load_test_dynamic")
+def bench_sender_dynamic(ctx):
+    """mqtt_sender.run_load_test 不限速，每條消息更新動態字段並序列化"""
+    return _bench_load_test(ctx, dynamic=True)
+
+
+@benchmark("sender.load_test_static")
+def bench_sender_static(ctx):
+    """mqtt_sender.run_load_test 不限速，預先序列化的消息"""
+    return _bench_load_test(ctx, dynamic=False)
+
+
+@benchmark("sender.fleet")
+def bench_sender_fleet(ctx):
+    """mqtt_sender.run_fleet_simulation: 20個Gateway × 每個50個Tag，不限速"""
+    import mqtt_sender
+    subscriber = CountingSubscriber(ctx)
+    client = ctx.client("fleet")
+    try:
+        with quiet():
+            result = mqtt_sender.run_fleet_simulation(client, ctx.catalog, 20, 50, rate=0,
+                                                      duration=ctx.seconds(3.0), report_interval=3600)
+    finally:
+        client.disconnect()
+    metrics = {"messages": result["sent"], "seconds": result["elapsed"], "publish_per_s": result["achieved_rate"]}
+    metrics.update(_delivery(subscriber, result["sent"]))
+    subscriber.close()
+    return metrics
+
+
+@benchmark("sender.e2e_latency")
+def bench_e2e_latency(ctx):
+    """固定速率 (2000 msg/s) 發送帶探針的消息，經代理到訂閱者的端到端延遲"""
+    from load_control import TokenBucket
+    samples = ctx.sample_messages()
+    stamper = ProbeStamper("bench")
+    tracker = LatencyTracker()
+
+    def on_message(client, userdata, msg):
+        received_at = time.time()
+        tracker.record(msg.topic, probe_of(json.loads(msg.payload)), received_at)
+
+    subscriber = CountingSubscriber(ctx)
+    subscriber.client.on_message = on_message
+    client = ctx.client("latency")
+    client.loop_start()
+    bucket = TokenBucket(2000)
+    total = ctx.count(20000)
+    payloads = [(topic, payload.decode("utf-8")) for topic, payload in samples]
+    for i in range(total):
+        bucket.acquire()
+        topic, payload = payloads[i % len(payloads)]
+        client.publish(topic, stamper.stamp(topic, payload))
+    deadline = time.monotonic() + DELIVERY_TIMEOUT
+    while time.monotonic() < deadline and sum(h.count for h in list(tracker.histograms.values())) < total:
+        time.sleep(0.05)
+    client.loop_stop()
+    client.disconnect()
+    subscriber.close()
+
+    histogram = LatencyHistogram()
+    for h in tracker.histograms.values():
+        histogram.merge(h)
+    s = histogram.summary()
+    lost = sum(t.lost for t in tracker.sequences.values())
+    return {"messages": total, "received": s["count"], "lost": lost,
+            "p50_ms": s["p50"] / 1000, "p95_ms": s["p95"] / 1000, "p99_ms": s["p99"] / 1000,
+            "max_ms": s["max"] / 1000}
+
+
+# ---------- 模擬器 (asyncio引擎) ----------
+
+def _load_simulator(name):
+    if name == "mqtt_heart_rate_simulator":
+        tools_dir = os.path.join(REPO_DIR, "tools")
+        if tools_dir not in sys.path:
+            sys.path.insert(0, tools_dir)
+    return importlib.import_module(name)
+
+
+def _bench_simulator(ctx, module_name, users, interval, **kwargs):
+    module = _load_simulator(module_name)
+    module.MQTT_BROKER, module.MQTT_PORT = ctx.host, ctx.port
+    users = ctx.count(users)
+    subscriber = CountingSubscriber(ctx)
+    with quiet():
+        result = module.run_async_simulation(module.make_users(users), interval=interval,
+                                             duration=ctx.seconds(5.0), **kwargs)
+    target = users / interval
+    metrics = {"users": users, "seconds": result["elapsed"], "publish_per_s": result["achieved_rate"],
+               "target_per_s": target, "target_ratio": result["achieved_rate"] / target}
+    metrics.update(_delivery(subscriber, result["sent"]))
+    subscriber.close()
+    return metrics
+
+
+@benchmark("simulator.location")
+def bench_location_simulator(ctx):
+    """位置模擬器 asyncio引擎: 2000個用戶，每0.2秒一次 (目標10000 msg/s)"""
+    return _bench_simulator(ctx, "mqtt_location_simulator", 2000, 0.2)
+
+
+@benchmark("simulator.temperature")
+def bench_temperature_simulator(ctx):
+    """體溫模擬器 asyncio引擎: 2000個用戶，每0.2秒一次"""
+    return _bench_simulator(ctx, "mqtt_temperature_simulator", 2000, 0.2)
+
+
+@benchmark("simulator.heart_rate")
+def bench_heart_rate_simulator(ctx):
+    """心率模擬器 asyncio引擎: 2000個用戶，每0.2秒一次 (QoS 1)"""
+    return _bench_simulator(ctx, "mqtt_heart_rate_simulator", 2000, 0.2)
+
+
+# ---------- 接收回調 ----------
+
+def _bench_on_message(ctx, on_message, total=50000):
+    """直接調用接收器的 on_message，返回吞吐量和單條處理時間的分布"""
+    samples = ctx.sample_messages()
+    messages = []
+    for topic, payload in samples:
+        msg = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        msg.payload = payload
+        messages.append(msg)
+    total = ctx.count(total)
+    histogram = LatencyHistogram()
+    clock = time.perf_counter_ns
+    with quiet():
+        started = time.perf_counter()
+        for i in range(total):
+            msg = messages[i % len(messages)]
+            t0 = clock()
+            on_message(None, None, msg)
+            histogram.record(clock() - t0)
+        elapsed = time.perf_counter() - started
+    # 直方圖記錄的是納秒
+    s = histogram.summary()
+    return {"messages": total, "seconds": elapsed, "messages_per_s": total / elapsed,
+            "p50_us": s["p50"] / 1000, "p99_us": s["p99"] / 1000, "max_us": s["max"] / 1000}
+
+
+@contextlib.contextmanager
+def _python_receiver(fast):
+    import mqtt_receiver_python as receiver
+    from payload_decoders import load_registry
+    saved = (receiver.fast_mode, receiver.summary, receiver.registry, receiver.receive_queue)
+    receiver.fast_mode = fast
+    receiver.summary = receiver.ReceiveSummary(3600) if fast else None
+    receiver.registry = load_registry()
+    receiver.receive_queue = None
+    try:
+        yield receiver
+    finally:
+        receiver.fast_mode, receiver.summary, receiver.registry, receiver.receive_queue = saved
+
+
+@benchmark("receiver.python")
+def bench_receiver_python(ctx):
+    """mqtt_receiver_python.on_message 逐條格式化輸出"""
+    with _python_receiver(fast=False) as receiver:
+        return _bench_on_message(ctx, receiver.on_message, 20000)
+
+
+@benchmark("receiver.python_fast")
+def bench_receiver_python_fast(ctx):
+    """mqtt_receiver_python.on_message 高吞吐模式 (--fast)"""
+    with _python_receiver(fast=True) as receiver:
+        return _bench_on_message(ctx, receiver.on_message)
+
+
+@benchmark("receiver.python_store")
+def bench_receiver_python_store(ctx):
+    """mqtt_receiver_python.on_message 高吞吐模式並寫入SQLite時間序列存儲 (--fast --store)"""
+    from telemetry_store import TelemetryStore
+    with tempfile.TemporaryDirectory() as directory, _python_receiver(fast=True) as receiver:
+        store = TelemetryStore(os.path.join(directory, "bench.db"))
+        receiver.telemetry_store = store
+        try:
+            metrics = _bench_on_message(ctx, receiver.on_message)
+            started = time.perf_counter()
+            store.flush()
+            metrics["final_flush_ms"] = (time.perf_counter() - started) * 1000
+        finally:
+            receiver.telemetry_store = None
+            store.close()
+        return metrics
+
+
+@benchmark("receiver.simple")
+def bench_receiver_simple(ctx):
+    """mqtt_simple_receiver.on_message"""
+    import mqtt_simple_receiver
+    return _bench_on_message(ctx, mqtt_simple_receiver.on_message, 20000)
+
+
+@benchmark("receiver.hivemq")
+def bench_receiver_hivemq(ctx):
+    """mqtt_hivemq_test.on_message"""
+    import mqtt_hivemq_test
+    return _bench_on_message(ctx, mqtt_hivemq_test.on_message, 20000)
+
+
+# ---------- Excel轉換 ----------
+
+def _bench_excel(ctx, engine, output_format):
+    from excel_to_json import convert_excel
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "bench." + ("jsonl" if output_format == "jsonl" else "json"))
+        with quiet():
+            # 先轉換一次，不計入首次導入pandas/openpyxl的時間
+            convert_excel(ctx.excel_file, output, engine=engine, output_format=output_format)
+            started = time.perf_counter()
+            result = convert_excel(ctx.excel_file, output, engine=engine, output_format=output_format)
+            elapsed = time.perf_counter() - started
+        if result is None:
+            raise RuntimeError(f"轉換失敗: {ctx.excel_file}")
+        rows = sum(sheet["rows"] for sheet in result["sheets"].values())
+        return {"sheets": len(result["sheets"]), "rows": rows, "seconds": elapsed,
+                "rows_per_s": rows / elapsed if elapsed > 0 else 0.0,
+                "output_bytes": os.path.getsize(output)}
+
+
+@benchmark("excel_to_json.pandas_indent")
+def bench_excel_pandas(ctx):
+    """excel_to_json pandas引擎，縮進JSON (默認設置)"""
+    return _bench_excel(ctx, "pandas", "indent")
+
+
+@benchmark("excel_to_json.stream_compact")
+def bench_excel_stream(ctx):
+    """excel_to_json openpyxl逐行讀取，緊湊JSON"""
+    return _bench_excel(ctx, "stream", "compact")
+
+
+@benchmark("excel_to_json.stream_jsonl")
+def bench_excel_jsonl(ctx):
+    """excel_to_json openpyxl逐行讀取，JSON Lines"""
+    return _bench_excel(ctx, "stream", "jsonl")
+
+
+# ---------- 運行和比較 ----------
+
+def _median_metrics(runs):
+    """多次運行的每個數值指標取中位數"""
+    merged = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if isinstance(run.get(key), (int, float))]
+        merged[key] = statistics.median(values) if len(values) == len(runs) else runs[0][key]
+    return merged
+
+
+def git_revision():
+    """返回 (提交ID, 工作區是否有未提交的修改)，不是git倉庫時返回 (None, None)"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TOOL_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=TOOL_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_benchmarks(ctx, names, repeat=1, output=print):
+    """
+    依次運行基準測試，每個運行 repeat 次取中位數
+
+    返回:
+        dict: {名稱: 指標字典}，失敗的測試為 {"error": 錯誤信息}
+    """
+    results = {}
+    for name in names:
+        runs = []
+        try:
+            for _ in range(repeat):
+                runs.append(BENCHMARKS[name](ctx))
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            output(f"{name:<32} 失敗: {results[name]['error']}")
+            continue
+        results[name] = _median_metrics(runs)
+        output(f"{name:<32} {format_metrics(results[name])}")
+    return results
+
+
+def format_metrics(metrics):
+    parts = []
+    for key, value in metrics.items():
+        if isinstance(value, float):
+            parts.append(f"{key}={value:.4g}")
+        else:
+            parts.append(f"{key}={value}")
+    return ", ".join(parts)
+
+
+def metric_direction(key):
+    """1: 越大越好，-1: 越小越好，0: 不比較"""
+    if key.startswith("max_"):
+        return 0
+    if key.endswith("_per_s"):
+        return 1
+    if key.endswith(("_ms", "_us")) or key == "seconds":
+        return -1
+    return 0
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    比較兩次結果中的同名測試
+
+    返回:
+        list: [(測試, 指標, 舊值, 新值, 變化比例, 是否退化)]，變化比例為正表示變好
+    """
+    rows = []
+    for name, metrics in current.items():
+        old = baseline.get(name)
+        if not old or "error" in old or "error" in metrics:
+            continue
+        for key, value in metrics.items():
+            direction = metric_direction(key)
+            before = old.get(key)
+            if not direction or not isinstance(before, (int, float)) or not before:
+                continue
+            change = (value - before) / before * direction
+            rows.append((name, key, before, value, change, change < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="發送、模擬器、接收和Excel轉換的基準測試")
+    parser.add_argument("-o", "--output", help="結果JSON文件 (默認: benchmark_<提交ID>.json)")
+    parser.add_argument("--compare", help="與之前的結果JSON比較，有退化時返回碼為1")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="比較時計為退化的變差比例 (默認: 0.10)")
+    parser.add_argument("-k", "--only", action="append",
+                        help="只運行匹配的測試 (可使用通配符，例如 'receiver.*'，可多次使用)")
+    parser.add_argument("--list", action="store_true", help="列出所有測試後退出")
+    parser.add_argument("--repeat", type=int, default=3, help="每個測試的運行次數，取中位數")
+    parser.add_argument("--quick", action="store_true", help="縮小規模 (約1/5) 快速運行")
+    parser.add_argument("-b", "--broker", help="使用外部MQTT代理 (默認在進程內啟動 embedded_broker)")
+    parser.add_argument("-p", "--port", type=int, default=1883, help="外部MQTT代理的端口")
+    parser.add_argument("--json-file", default=DEFAULT_JSON_FILE, help="消息目錄JSON")
+    parser.add_argument("--excel-file", default=DEFAULT_EXCEL_FILE, help="Excel轉換測試的輸入文件")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, function in BENCHMARKS.items():
+            print(f"{name:<32} {function.__doc__.strip()}")
+        return 0
+
+    names = [name for name in BENCHMARKS
+             if not args.only or any(fnmatch.fnmatch(name, pattern) for pattern in args.only)]
+    if not names:
+        print("沒有匹配的測試 (使用 --list 查看)")
+        return 1
+
+    broker = None
+    if args.broker:
+        host, port = args.broker, args.port
+    else:
+        broker = EmbeddedBroker().start()
+        host, port = broker.host, broker.port
+    ctx = BenchContext(host, port, scale=0.2 if args.quick else 1.0, json_file=args.json_file,
+                       excel_file=args.excel_file)
+
+    commit, dirty = git_revision()
+    print(f"基準測試: {len(names)} 個, 代理 {host}:{port}{' (進程內)' if broker else ''}, "
+          f"每個運行 {args.repeat} 次, 提交 {commit or '未知'}{' (有未提交的修改)' if dirty else ''}")
+    try:
+        results = run_benchmarks(ctx, names, repeat=max(1, args.repeat))
+    finally:
+        if broker:
+            broker.stop()
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "paho_mqtt": getattr(mqtt, "__version__", None) or _paho_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "broker": "embedded" if broker else f"{host}:{port}",
+            "scale": ctx.scale,
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    output = args.output or f"benchmark_{commit or 'unknown'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"結果已保存到 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("scale") != ctx.scale:
+            print("警告: 兩次結果的規模 (--quick) 不同，比較結果僅供參考")
+        rows = compare_results(baseline["results"], results, args.threshold)
+        print(f"\n與 {args.compare} (提交 {baseline['meta'].get('commit') or '未知'}) 比較:")
+        for name, key, before, after, change, regressed in rows:
+            mark = "退化" if regressed else ("改善" if change > args.threshold else "")
+            print(f"  {name:<32} {key:<16} {before:>12.4g} -> {after:<12.4g} {change:+7.1%} {mark}")
+        regressions = sum(1 for row in rows if row[5])
+        print(f"共 {regressions} 個指標退化超過 {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+def _paho_version():
+    try:
+        from importlib.metadata import version
+        return version("paho-mqtt")
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MQTT流量的記錄和重放
+記錄文件 (.mqcap) 是只追加的二進制日誌，每條消息保存
+(接收時間, 主題, QoS, retain, 原始負載)；主題第一次出現時寫入一條主題定義，之後只保存編號
+
+    文件頭:   MQCAP1\\n
+    主題定義: 'T' <u32 編號> <u16 長度> <UTF-8主題>
+    消息:     'M' <f64 接收時間> <u32 主題編號> <u8 QoS|retain<<2> <u32 長度> <負載>
+
+旁邊的索引文件 (.mqcap.idx) 每隔 INDEX_EVERY 條消息記錄一次 (時間, 文件偏移, 序號)，
+並重複保存主題定義，按時間範圍讀取時先二分查找索引再從對應偏移開始讀。
+索引只是加速用的，缺失或落後於日誌時讀取器會從日誌本身補全
+
+用法:
+    python mqtt_capture.py record capture.mqcap -t "GW+_Loca" -t "GW+_Health" --duration 3600
+    python mqtt_capture.py info capture.mqcap
+    python mqtt_capture.py replay capture.mqcap --speed 60       (60倍速，1小時約1分鐘)
+    python mqtt_capture.py replay capture.mqcap --speed 0        (最快速度，不保持間隔)
+"""
+
+import argparse
+import bisect
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+MAGIC = b"MQCAP1\n"
+INDEX_MAGIC = b"MQIDX1\n"
+
+_TOPIC = struct.Struct("<cIH")
+_MESSAGE = struct.Struct("<cdIBI")
+_INDEX_ENTRY = struct.Struct("<cdQQ")
+_INDEX_TOPIC = struct.Struct("<cIH")
+
+# 每隔多少條消息寫一個索引點
+INDEX_EVERY = 1000
+# 寫入緩衝大小 (字節)
+WRITE_BUFFER = 1 << 20
+
+
+def index_path_for(path):
+    return path + ".idx"
+
+
+class CaptureWriter:
+    """
+    只追加的記錄寫入器 (線程安全)
+
+    參數:
+        path (str): 記錄文件路徑，已存在時拒絕覆蓋
+        index_every (int): 索引點間隔 (消息數)
+    """
+
+    def __init__(self, path, index_every=INDEX_EVERY):
+        if os.path.exists(path):
+            raise FileExistsError(f"記錄文件已存在: {path}")
+        self.path = path
+        self.index_every = index_every
+        self.lock = threading.Lock()
+        self.file = open(path, "wb", buffering=WRITE_BUFFER)
+        self.index = open(index_path_for(path), "wb", buffering=1 << 16)
+        self.file.write(MAGIC)
+        self.index.write(INDEX_MAGIC)
+        self.offset = len(MAGIC)
+        self.topics = {}
+        self.count = 0
+        self.bytes = 0
+        self.first_ts = None
+        self.last_ts = None
+
+    def _topic_id(self, topic):
+        topic_id = self.topics.get(topic)
+        if topic_id is None:
+            topic_id = self.topics[topic] = len(self.topics)
+            encoded = topic.encode("utf-8")
+            record = _TOPIC.pack(b"T", topic_id, len(encoded)) + encoded
+            self.file.write(record)
+            self.offset += len(record)
+            self.index.write(_INDEX_TOPIC.pack(b"T", topic_id, len(encoded)) + encoded)
+        return topic_id
+
+    def write(self, recv_ts, topic, qos, retain, payload):
+        with self.lock:
+            topic_id = self._topic_id(topic)
+            if self.count % self.index_every == 0:
+                self.index.write(_INDEX_ENTRY.pack(b"I", recv_ts, self.offset, self.count))
+            header = _MESSAGE.pack(b"M", recv_ts, topic_id, (qos & 3) | (4 if retain else 0), len(payload))
+            self.file.write(header)
+            self.file.write(payload)
+            self.offset += len(header) + len(payload)
+            self.count += 1
+            self.bytes += len(payload)
+            if self.first_ts is None:
+                self.first_ts = recv_ts
+            self.last_ts = recv_ts
+
+    def on_message(self, inner=None):
+        """
+        返回記錄消息的paho on_message回調，記錄後再調用 inner (例如接收隊列的 on_message)
+        在網絡線程中只做打包和緩衝寫入，保留原始的QoS和retain標記
+        """
+        write = self.write
+
+        def callback(client, userdata, msg):
+            write(time.time(), msg.topic, msg.qos, msg.retain, msg.payload)
+            if inner is not None:
+                inner(client, userdata, msg)
+        return callback
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.index.close()
+
+
+class CaptureReader:
+    """
+    記錄文件讀取器
+
+        for recv_ts, topic, qos, retain, payload in CaptureReader(path).read(start, end):
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.topics = {}
+        self.index_ts = []
+        self.index_offsets = []
+        self.index_counts = []
+        self._load_index()
+
+    def _load_index(self):
+        path = index_path_for(self.path)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(INDEX_MAGIC):
+            return
+        position = len(INDEX_MAGIC)
+        while position < len(data):
+            kind = data[position:position + 1]
+            if kind == b"I" and position + _INDEX_ENTRY.size <= len(data):
+                _, ts, offset, count = _INDEX_ENTRY.unpack_from(data, position)
+                self.index_ts.append(ts)
+                self.index_offsets.append(offset)
+                self.index_counts.append(count)
+                position += _INDEX_ENTRY.size
+            elif kind == b"T" and position + _INDEX_TOPIC.size <= len(data):
+                _, topic_id, length = _INDEX_TOPIC.unpack_from(data, position)
+                start = position + _INDEX_TOPIC.size
+                if start + length > len(data):
+                    break
+                self.topics[topic_id] = data[start:start + length].decode("utf-8")
+                position = start + length
+            else:
+                # 寫入中斷留下的不完整記錄
+                break
+
+    def _start_offset(self, start):
+        """找到不晚於start的最後一個索引點"""
+        if start is None or not self.index_ts:
+            return len(MAGIC)
+        i = bisect.bisect_right(self.index_ts, start) - 1
+        return self.index_offsets[i] if i >= 0 else len(MAGIC)
+
+    def read(self, start=None, end=None):
+        """
+        按順序讀取 [start, end) 時間範圍內的消息
+
+        返回:
+            generator: (recv_ts, topic, qos, retain, payload)
+        """
+        topics = dict(self.topics)
+        with open(self.path, "rb", buffering=WRITE_BUFFER) as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是MQTT記錄文件: {self.path}")
+            f.seek(self._start_offset(start))
+            read = f.read
+            while True:
+                kind = read(1)
+                if kind == b"M":
+                    header = read(_MESSAGE.size - 1)
+                    if len(header) < _MESSAGE.size - 1:
+                        break
+                    _, ts, topic_id, flags, length = _MESSAGE.unpack(kind + header)
+                    payload = read(length)
+                    if len(payload) < length:
+                        break
+                    if start is not None and ts < start:
+                        continue
+                    if end is not None and ts >= end:
+                        break
+                    yield ts, topics.get(topic_id, f"topic#{topic_id}"), flags & 3, bool(flags & 4), payload
+                elif kind == b"T":
+                    header = read(_TOPIC.size - 1)
+                    if len(header) < _TOPIC.size - 1:
+                        break
+                    _, topic_id, length = _TOPIC.unpack(kind + header)
+                    topics[topic_id] = read(length).decode("utf-8")
+                else:
+                    # 文件結束或寫入中斷
+                    break
+
+    def __iter__(self):
+        return self.read()
+
+    def info(self):
+        """統計記錄文件: 消息數、時間範圍、各主題消息數 (需要完整讀取一遍)"""
+        count = 0
+        size = 0
+        first = last = None
+        per_topic = {}
+        for ts, topic, _, _, payload in self.read():
+            count += 1
+            size += len(payload)
+            if first is None:
+                first = ts
+            last = ts
+            per_topic[topic] = per_topic.get(topic, 0) + 1
+        return {
+            "messages": count,
+            "payload_bytes": size,
+            "file_bytes": os.path.getsize(self.path),
+            "first": first,
+            "last": last,
+            "topics": per_topic,
+            "index_points": len(self.index_ts)
+        }
+
+
+def record(path, broker, port, topics, duration=0, client_id=None):
+    """訂閱主題並把收到的消息寫入記錄文件，直到Ctrl+C或到達duration秒"""
+    import paho.mqtt.client as mqtt
+
+    writer = CaptureWriter(path)
+    client = mqtt.Client(client_id=client_id or f"mqtt-capture-{os.getpid()}")
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            for topic in topics:
+                client.subscribe(topic, qos=1)
+                print(f"已訂閱主題: {topic}")
+        else:
+            print(f"連接失敗，返回碼: {rc}")
+
+    client.on_connect = on_connect
+    client.on_message = writer.on_message()
+    client.connect(broker, port, 60)
+    client.loop_start()
+    print(f"正在記錄到 {path} (按Ctrl+C停止)")
+
+    deadline = time.monotonic() + duration if duration > 0 else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(1)
+            writer.flush()
+    except KeyboardInterrupt:
+        print("\n停止記錄")
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        writer.close()
+    print(f"已記錄 {writer.count} 條消息, {writer.bytes} 字節負載, {len(writer.topics)} 個主題")
+
+
+def _format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if ts is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT流量記錄和重放")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_record = sub.add_parser("record", help="訂閱並記錄MQTT流量")
+    p_record.add_argument("path", help="記錄文件路徑 (.mqcap)")
+    p_record.add_argument("-b", "--broker", default="localhost", help="MQTT伺服器地址")
+    p_record.add_argument("-p", "--port", type=int, default=1883, help="MQTT伺服器端口")
+    p_record.add_argument("-t", "--topic", action="append", help="要記錄的主題 (可多次使用，默認 #)")
+    p_record.add_argument("--duration", type=float, default=0, help="記錄時長 (秒, 0表示直到Ctrl+C)")
+
+    p_info = sub.add_parser("info", help="顯示記錄文件的統計")
+    p_info.add_argument("path", help="記錄文件路徑")
+
+    p_replay = sub.add_parser("replay", help="按原始間隔重放記錄文件 (使用 mqtt_sender 發送)")
+    p_replay.add_argument("path", help="記錄文件路徑")
+    p_replay.add_argument("-b", "--broker", default="localhost", help="MQTT伺服器地址")
+    p_replay.add_argument("-p", "--port", type=int, default=1883, help="MQTT伺服器端口")
+    p_replay.add_argument("--speed", type=float, default=1.0,
+                          help="重放倍速 (1為原速，60表示1小時的數據1分鐘發完，0表示最快速度)")
+    p_replay.add_argument("--start", help="只重放此時間之後的消息 (Unix時間戳或 YYYY-mm-dd HH:MM[:SS])")
+    p_replay.add_argument("--end", help="只重放此時間之前的消息")
+    p_replay.add_argument("--qos", type=int, choices=(0, 1, 2), help="覆蓋記錄中的QoS")
+    p_replay.add_argument("--no-retain", action="store_true", help="不保留記錄中的retain標記")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.path, args.broker, args.port, args.topic or ["#"], args.duration)
+    elif args.command == "info":
+        info = CaptureReader(args.path).info()
+        span = (info["last"] - info["first"]) if info["messages"] else 0.0
+        print(f"消息數: {info['messages']}  負載: {info['payload_bytes']} 字節  文件: {info['file_bytes']} 字節")
+        print(f"時間範圍: {_format_ts(info['first'])} ~ {_format_ts(info['last'])} ({span:.1f} 秒)")
+        print(f"索引點: {info['index_points']}")
+        for topic, count in sorted(info["topics"].items(), key=lambda item: -item[1]):
+            print(f"  {topic}: {count}")
+    else:
+        import mqtt_sender
+        from telemetry_store import parse_time
+
+        mqtt_sender.MQTT_BROKER = args.broker
+        mqtt_sender.MQTT_PORT = args.port
+        client = mqtt_sender.connect_mqtt()
+        if not client:
+            sys.exit(1)
+        try:
+            mqtt_sender.replay_capture(client, args.path, speed=args.speed, start=parse_time(args.start),
+                                       end=parse_time(args.end), qos=args.qos, keep_retain=not args.no_retain)
+        finally:
+            client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
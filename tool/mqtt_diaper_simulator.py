@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MQTT尿布DV1模擬器
+每個住民一個尿布感測器 (見 diaper_model.py)，設備只在濕度變化、按鈕、更換尿布
+或到達 "diaper DV1 update time" 時上報；主循環按事件堆的下一個時間等待，不輪詢設備
+
+上報間隔跟隨Gateway配置: 收到 UWB_Gateway 的 "diaper DV1 update time"
+或 {Gateway}_Dwlink 的 "set diaper DV1 update time" 時立即按新間隔重新安排
+
+    python mqtt_diaper_simulator.py --devices 500 --time-scale 60
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from diaper_model import DEFAULT_UPDATE_TIME, DiaperFleet
+from latency_probe import CLOCKS, ProbeStamper
+from load_control import RateReporter
+
+# MQTT設置
+MQTT_BROKER = "localhost"
+MQTT_PORT = 1883
+MQTT_CLIENT_ID = f"diaper_simulator_{random.randint(1000, 9999)}"
+GATEWAY_PREFIX = "GW17F5"
+GATEWAY_ID = 137205
+# Gateway配置 (含 "diaper DV1 update time") 的主題
+TOPIC_GATEWAY_CONFIG = "UWB_Gateway"
+
+
+class DiaperSimulator:
+    """
+    把尿布設備的事件堆接到MQTT: 到期的事件發送消息，沒有事件時睡到下一個事件
+
+    參數:
+        fleet (DiaperFleet): 設備和事件
+        client: 已連接的paho客戶端
+        prefix (str): Gateway主題前綴，消息發送到 {prefix}_Health
+        time_scale (float): 模擬時間倍速 (例如60表示一分鐘模擬一小時)
+        qos (int): 發送的QoS
+        probe (ProbeStamper, optional): 延遲探針
+        verbose (bool): 是否打印每條非定時上報
+    """
+
+    def __init__(self, fleet, client, prefix=GATEWAY_PREFIX, time_scale=1.0, qos=0, probe=None, verbose=False):
+        self.fleet = fleet
+        self.client = client
+        self.prefix = prefix
+        self.topic = f"{prefix}_Health"
+        self.time_scale = time_scale
+        self.qos = qos
+        self.probe = probe
+        self.verbose = verbose
+        self.serial = random.randint(0, 65535)
+        self.reporter = RateReporter(interval=5.0, label="尿布模擬")
+        # Gateway配置由MQTT網絡線程收到，交給主循環處理，同時喚醒等待
+        self.wakeup = threading.Condition()
+        self.pending_update_time = None
+        self.running = True
+        self._start = None
+
+    def sim_time(self):
+        return (time.monotonic() - self._start) * self.time_scale
+
+    def on_config(self, client, userdata, msg):
+        """處理Gateway配置和下行設置中的 diaper DV1 update time"""
+        try:
+            data = json.loads(msg.payload)
+        except (ValueError, UnicodeDecodeError):
+            return
+        if not isinstance(data, dict):
+            return
+        seconds = None
+        if data.get("content") == "gateway topic" and data.get("name") == self.prefix:
+            seconds = data.get("diaper DV1 update time")
+        elif data.get("content") == "set diaper DV1 update time":
+            seconds = data.get("time(sec)")
+        if isinstance(seconds, (int, float)) and seconds > 0:
+            with self.wakeup:
+                self.pending_update_time = seconds
+                self.wakeup.notify()
+
+    def stop(self):
+        with self.wakeup:
+            self.running = False
+            self.wakeup.notify()
+
+    def publish(self, message):
+        # serial no = 0 ~ 65535，按Gateway循環遞增
+        self.serial = (self.serial + 1) & 0xFFFF
+        message["serial no"] = self.serial
+        payload = json.dumps(message)
+        if self.probe:
+            payload = self.probe.stamp(self.topic, payload)
+        result = self.client.publish(self.topic, payload, qos=self.qos)
+        self.reporter.record(result.rc == mqtt.MQTT_ERR_SUCCESS)
+
+    def run(self, duration=0):
+        """運行直到 stop()、Ctrl+C 或到達運行時長 (秒, 實際時間)"""
+        fleet = self.fleet
+        self._start = time.monotonic()
+        deadline = self._start + duration if duration > 0 else None
+        while True:
+            with self.wakeup:
+                if not self.running:
+                    break
+                update_time, self.pending_update_time = self.pending_update_time, None
+            if update_time is not None and fleet.set_update_time(update_time):
+                print(f"上報間隔已改為 {update_time} 秒 (來自Gateway配置)")
+
+            for device, reason, message in fleet.advance(self.sim_time()):
+                self.publish(message)
+                if self.verbose and reason != "report":
+                    print(f"{device.name}: {reason}, 濕度 {message['humi']}%, 溫度 {message['temp']}°C, "
+                          f"按鈕 {message['button']}")
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            next_time = fleet.next_time()
+            timeout = None if next_time is None else max(0.0, (next_time - self.sim_time()) / self.time_scale)
+            if deadline is not None:
+                timeout = deadline - now if timeout is None else min(timeout, deadline - now)
+            with self.wakeup:
+                if self.running and self.pending_update_time is None:
+                    self.wakeup.wait(timeout)
+        return self.reporter.summary()
+
+    def print_summary(self):
+        self.reporter.print_summary()
+        counts = self.fleet.counts
+        print(f"定時上報: {counts['report']} 條, 濕度變化: {counts['change']} 條, "
+              f"更換尿布: {counts['diaper']} 次, 呼叫按鈕: {counts['button']} 次, 排尿: {counts['void']} 次")
+        print(f"模擬時間: {self.fleet.now / 3600:.2f} 小時, 當前濕尿布: {self.fleet.wet_count()}/{len(self.fleet)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MQTT尿布DV1模擬器 (事件驅動)")
+    parser.add_argument("-b", "--broker", default=MQTT_BROKER, help="MQTT伺服器地址")
+    parser.add_argument("-p", "--port", type=int, default=MQTT_PORT, help="MQTT伺服器端口")
+    parser.add_argument("--devices", type=int, default=10, help="模擬的尿布設備數量 (每個住民一個)")
+    parser.add_argument("--gateway", default=GATEWAY_PREFIX, help="Gateway主題前綴，消息發送到 {gateway}_Health")
+    parser.add_argument("--gateway-id", type=int, default=GATEWAY_ID, help="消息中的gateway id")
+    parser.add_argument("--update-time", type=float, default=DEFAULT_UPDATE_TIME,
+                        help="初始的定時上報間隔 (秒)，收到Gateway配置後以配置為準")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="模擬時間倍速 (例如60表示一分鐘模擬一小時，上報間隔同樣縮短)")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=0, help="發送的QoS")
+    parser.add_argument("--seed", type=int, default=None, help="隨機數種子 (可重現的模擬)")
+    parser.add_argument("--probe", nargs="?", const="mono", choices=CLOCKS, default=None,
+                        help="在每條消息中加入延遲探針 (發送時間和序號)，"
+                             "可指定時鐘: mono (同一台機器, 默認) 或 wall (跨機器, 需要NTP)")
+    parser.add_argument("--duration", type=float, default=0, help="運行時長 (秒, 0表示直到Ctrl+C)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印濕度變化、按鈕和更換尿布的上報")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.time_scale <= 0:
+        print("--time-scale 必須大於0")
+        return
+
+    fleet = DiaperFleet(args.devices, update_time=args.update_time, gateway_id=args.gateway_id, seed=args.seed)
+    client = mqtt.Client(client_id=MQTT_CLIENT_ID)
+    simulator = DiaperSimulator(fleet, client, args.gateway, args.time_scale, args.qos,
+                                ProbeStamper(MQTT_CLIENT_ID, args.probe) if args.probe else None, args.verbose)
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            # 重新連接後也要重新訂閱Gateway配置
+            client.subscribe([(TOPIC_GATEWAY_CONFIG, 0), (f"{args.gateway}_Dwlink", 0)])
+        else:
+            print(f"連接失敗，返回碼: {rc}")
+
+    client.on_connect = on_connect
+    client.on_message = simulator.on_config
+    try:
+        client.connect(args.broker, args.port, 60)
+    except Exception as e:
+        print(f"無法連接到MQTT代理 {args.broker}:{args.port}: {e}")
+        return
+    client.loop_start()
+    print(f"已連接到MQTT代理 {args.broker}:{args.port}")
+    print(f"開始尿布模擬器 - {args.devices}個設備, 上報間隔 {fleet.update_time} 秒, 時間倍速 {args.time_scale}")
+    print("按Ctrl+C停止")
+
+    try:
+        simulator.run(args.duration)
+    except KeyboardInterrupt:
+        print("\n用戶中止")
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        simulator.print_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,11 @@ import uuid
 import json
 import argparse
 import threading
+from collections import deque
 from datetime import datetime
 
+from receive_queue import ReceiveQueue
+
 # 預設連接參數
 DEFAULT_BROKER = "067ec32ef1344d3bb20c4e53abdde99a.s1.eu.hivemq.cloud"
 DEFAULT_PORT = 8884
@@ -34,8 +37,11 @@ stats = {
 }
 
 # 最近收到的消息
-recent_messages = []
 MAX_RECENT_MESSAGES = 10
+recent_messages = deque(maxlen=MAX_RECENT_MESSAGES)
+
+# 接收隊列 (--workers > 0 時使用)
+receive_queue = None
 
 # 當連接成功時的回調
 def on_connect(client, userdata, flags, rc):
@@ -88,50 +94,58 @@ def on_disconnect(client, userdata, rc):
             print(f"重新連接失敗: {str(e)}")
             stats["connection_errors"].append((datetime.now(), str(e)))
 
-# 當收到消息時的回調
-def on_message(client, userdata, msg):
-    stats["messages_received"] += 1
-    stats["last_message_time"] = datetime.now()
-    stats["topics_with_messages"].add(msg.topic)
-    
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+def format_message(topic, payload, received_at, qos=None):
+    """解碼並格式化消息內容，可在接收隊列的工作線程中執行"""
+    timestamp = datetime.fromtimestamp(received_at).strftime("%H:%M:%S.%f")[:-3]
     
     try:
-        payload = msg.payload.decode("utf-8")
+        payload = payload.decode("utf-8")
         try:
             json_payload = json.loads(payload)
             payload = json.dumps(json_payload, indent=2, ensure_ascii=False)
             is_json = True
-        except:
+        except ValueError:
             is_json = False
-    except:
-        payload = str(msg.payload)
+    except UnicodeDecodeError:
+        payload = str(payload)
         is_json = False
     
-    message_info = {
+    return {
         "timestamp": timestamp,
-        "topic": msg.topic,
+        "topic": topic,
         "payload": payload,
-        "is_json": is_json
+        "is_json": is_json,
+        "qos": qos
     }
+
+def show_message(message_info):
+    """更新統計並輸出消息 (串行執行)"""
+    stats["messages_received"] += 1
+    stats["last_message_time"] = datetime.now()
+    stats["topics_with_messages"].add(message_info["topic"])
     
-    # 添加到最近消息
+    # 添加到最近消息 (deque自動丟棄最舊的消息)
     recent_messages.append(message_info)
-    if len(recent_messages) > MAX_RECENT_MESSAGES:
-        recent_messages.pop(0)
     
     # 輸出消息信息
-    print(f"\n[{timestamp}] 收到消息 #{stats['messages_received']}:")
-    print(f"主題: {msg.topic}")
-    print(f"QoS: {msg.qos}")
-    print(f"是JSON: {is_json}")
+    payload = message_info["payload"]
+    lines = [f"\n[{message_info['timestamp']}] 收到消息 #{stats['messages_received']}:",
+             f"主題: {message_info['topic']}"]
+    if message_info["qos"] is not None:
+        lines.append(f"QoS: {message_info['qos']}")
+    lines.append(f"是JSON: {message_info['is_json']}")
     
     # 限制輸出長度
     max_payload_display = 500
     if len(payload) > max_payload_display:
-        print(f"內容 (部分): {payload[:max_payload_display]}...")
+        lines.append(f"內容 (部分): {payload[:max_payload_display]}...")
     else:
-        print(f"內容: {payload}")
+        lines.append(f"內容: {payload}")
+    print("\n".join(lines))
+
+# 當收到消息時的回調 (不使用接收隊列時)
+def on_message(client, userdata, msg):
+    show_message(format_message(msg.topic, msg.payload, time.time(), msg.qos))
 
 # 當發布消息時的回調
 def on_publish(client, userdata, mid):
@@ -158,6 +172,8 @@ def display_stats():
                 last_msg_time = (datetime.now() - stats["last_message_time"]).total_seconds()
                 print(f"最後消息接收: {last_msg_time:.1f} 秒前")
             print(f"重新連接次數: {stats['reconnects']}")
+            if receive_queue:
+                print(receive_queue.format_stats())
             print("-----------------")
 
 # 測試發布消息
@@ -202,6 +218,10 @@ if __name__ == "__main__":
                       help='使用MQTT over WebSocket連接')
     parser.add_argument('--publish', action='store_true',
                       help='每30秒發布一次測試消息')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='接收隊列的工作線程數，on_message只入隊 (0表示在網絡線程中直接處理)')
+    parser.add_argument('--queue-size', type=int, default=10000,
+                      help='接收隊列容量，滿時丟棄新消息並計數')
     
     args = parser.parse_args()
 
@@ -217,7 +237,12 @@ if __name__ == "__main__":
     # 設置回調函數
     client.on_connect = on_connect
     client.on_disconnect = on_disconnect
-    client.on_message = on_message
+    if args.workers > 0:
+        receive_queue = ReceiveQueue(format_message, show_message, workers=args.workers,
+                                     maxsize=args.queue_size, with_qos=True).start()
+        client.on_message = receive_queue.on_message
+    else:
+        client.on_message = on_message
     client.on_publish = on_publish
     if args.verbose:
         client.on_log = on_log
@@ -284,6 +309,8 @@ if __name__ == "__main__":
             connected_duration = (datetime.now() - stats["connect_time"]).total_seconds()
             print(f"最後連接持續: {connected_duration:.1f} 秒")
         print(f"接收消息數: {stats['messages_received']}")
+        if receive_queue:
+            print(receive_queue.format_stats())
         print(f"重新連接次數: {stats['reconnects']}")
         print(f"已收到消息的主題: {', '.join(stats['topics_with_messages']) if stats['topics_with_messages'] else '無'}")
         
@@ -294,7 +321,7 @@ if __name__ == "__main__":
         
         if recent_messages:
             print("\n最近收到的消息:")
-            for i, msg in enumerate(recent_messages[-5:], 1):  # 只顯示最後5條
+            for i, msg in enumerate(list(recent_messages)[-5:], 1):  # 只顯示最後5條
                 print(f"  {i}. {msg['timestamp']} 主題:{msg['topic']}")
         
         print("==========================")
@@ -309,4 +336,6 @@ if __name__ == "__main__":
         print("正在斷開MQTT連接...")
         client.disconnect()
         client.loop_stop()
+        if receive_queue:
+            receive_queue.stop()
         print("測試完成")
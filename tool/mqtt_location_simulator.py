@@ -6,9 +6,15 @@ import json
 import time
 import random
 import threading
-import math
+import argparse
 from datetime import datetime
 
+from mqtt_shard import run_sharded
+from mqtt_async_engine import AsyncMqttEngine, DeviceModel, run_engine
+from mobility import MobilityModel, assign_patterns, parse_pattern_weights
+from floor_plan import RoutineModel, load_floor_plan
+from latency_probe import CLOCKS, ProbeStamper
+
 # MQTT設置
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
@@ -29,11 +35,12 @@ MIN_X = 0.1
 MAX_X = 2.5
 MIN_Y = 0.1
 MAX_Y = 2.5
-MOVE_STEP = 0.02  # 每次移動的最大距離
+MOVE_STEP = 0.02  # 每次移動的最大距離 (隨機遊走模式，見 mobility.PATTERN_PARAMS)
 
 # 全局變量
 running = True
 client = None
+mobility = None  # USERS的移動模型，第一次移動時建立
 
 def setup_mqtt():
     """設置MQTT客戶端"""
@@ -43,78 +50,77 @@ def setup_mqtt():
     client.loop_start()
     print(f"已連接到MQTT代理 {MQTT_BROKER}:{MQTT_PORT}")
 
-def move_users():
-    """移動所有用戶位置，每個用戶有特定的移動模式"""
-    # 獲取基於時間的周期性因子，用於產生圓形和波浪運動
-    time_factor = time.time() % (2 * 3.14159)  # 時間循環在0到2π之間
-    sin_factor = math.sin(time_factor)
-    cos_factor = math.cos(time_factor)
+def make_users(count):
+    """返回count個用戶: 前幾個為USERS中的固定用戶，其餘自動生成 (用於大規模模擬)"""
+    users = [dict(u, position=dict(u["position"])) for u in USERS[:count]]
+    for n in range(len(users) + 1, count + 1):
+        users.append({
+            "id": f"E{n:03d}",
+            "name": f"模擬用戶{n}",
+            "position": {
+                "x": random.uniform(MIN_X, MAX_X),
+                "y": random.uniform(MIN_Y, MAX_Y),
+                "quality": random.randint(75, 98)
+            },
+            "gateway_id": 137205
+        })
+    return users
+
+def attach_mobility(users, pattern_weights=None, seed=None, floor_plan=None, time_scale=1.0):
+    """
+    為用戶列表建立向量化移動模型，並在每個用戶上記錄其在模型中的索引 (tag_index)
     
-    for user in USERS:
-        user_id = user["id"]
-        
-        if user_id == "E001":  # 張三 - 只上下移動
-            # 保持X軸幾乎不變，Y軸做正弦波動
-            move_x = random.uniform(-0.005, 0.005)  # 極小隨機偏移
-            move_y = 0.05 * sin_factor  # 有規律的上下移動
-        
-        elif user_id == "E002":  # 李四 - 只左右移動
-            # 保持Y軸幾乎不變，X軸做正弦波動
-            move_x = 0.05 * cos_factor  # 有規律的左右移動
-            move_y = random.uniform(-0.005, 0.005)  # 極小隨機偏移
-        
-        elif user_id == "E003":  # 王五 - 斜向移動
-            # X和Y軸同時變化，形成斜向運動
-            move_x = 0.03 * cos_factor
-            move_y = 0.03 * sin_factor
-        
-        elif user_id == "E004":  # 趙六 - 幾乎不動
-            # 極小的隨機移動
-            move_x = random.uniform(-0.002, 0.002)
-            move_y = random.uniform(-0.002, 0.002)
-        
-        elif user_id == "E005":  # 錢七 - 圓形移動
-            # 使用正弦和餘弦函數產生圓形軌跡
-            move_x = 0.04 * cos_factor
-            move_y = 0.04 * sin_factor
-        
-        else:  # 其他用戶 - 隨機移動
-            move_x = random.uniform(-MOVE_STEP, MOVE_STEP)
-            move_y = random.uniform(-MOVE_STEP, MOVE_STEP)
-        
-        # 計算新位置
-        new_x = user["position"]["x"] + move_x
-        new_y = user["position"]["y"] + move_y
-        
-        # 確保在範圍內
-        new_x = max(MIN_X, min(MAX_X, new_x))
-        new_y = max(MIN_Y, min(MAX_Y, new_y))
-        
-        # 更新位置
-        user["position"]["x"] = new_x
-        user["position"]["y"] = new_y
-        
-        # 隨機改變信號質量
-        user["position"]["quality"] = random.randint(75, 98)
+    參數:
+        pattern_weights (dict, optional): {移動模式: 權重}，None表示前五個用戶沿用
+            原來的上下/左右/斜向/不動/圓形模式，其餘隨機遊走
+        floor_plan (str, optional): 平面圖JSON路徑或"default"，指定時用戶按作息
+            在房間之間沿路線行走 (floor_plan.RoutineModel)，不再限制在固定的移動範圍內
+        time_scale (float): 按作息移動時的模擬時間倍速
+    """
+    if floor_plan:
+        model = RoutineModel(load_floor_plan(floor_plan), len(users), time_scale=time_scale, seed=seed)
+    else:
+        positions = [(u["position"]["x"], u["position"]["y"]) for u in users]
+        quality = [u["position"]["quality"] for u in users]
+        model = MobilityModel(positions, assign_patterns(len(users), pattern_weights),
+                              (MIN_X, MAX_X, MIN_Y, MAX_Y), quality=quality, seed=seed)
+    for index, user in enumerate(users):
+        user["tag_index"] = index
+    return model
 
-def send_user_location(user):
-    """為單個用戶發送位置數據"""
-    data = {
+def _default_mobility():
+    global mobility
+    if mobility is None:
+        mobility = attach_mobility(USERS)
+    return mobility
+
+def move_users(model=None):
+    """一次批量推進所有用戶的位置 (默認為USERS的移動模型)"""
+    (model if model is not None else _default_mobility()).step()
+
+def build_location_data(user, model=None):
+    """為單個用戶建立位置消息，位置和信號質量取自移動模型"""
+    xs, ys, quality = (model if model is not None else _default_mobility()).snapshot()
+    index = user["tag_index"]
+    return {
         "content": "location",
         "gateway id": user["gateway_id"],
         "node": "TAG",
         "id": user["id"],
         "name": user["name"],
         "position": {
-            "x": round(user["position"]["x"], 6),
-            "y": round(user["position"]["y"], 6),
+            "x": xs[index],
+            "y": ys[index],
             "z": round(random.uniform(0, 1.0), 6),
-            "quality": user["position"]["quality"]
+            "quality": quality[index]
         },
         "time": datetime.now().strftime("%Y-%j %H:%M:%S.%f")[:-4],
         "serial no": random.randint(0, 65535)
     }
-    
+
+def send_user_location(user):
+    """為單個用戶發送位置數據"""
+    data = build_location_data(user)
     message = json.dumps(data)
     topic = TOPIC_LOCATION
     client.publish(topic, message, qos=1, retain=True)
@@ -145,9 +151,14 @@ def simulation_loop():
             all_data = send_all_locations()
             
             # 輸出簡潔的當前位置信息
-            for data in all_data:
+            zones = None
+            if isinstance(mobility, RoutineModel):
+                zones = mobility.plan.zone_names(mobility.zones())
+            for index, data in enumerate(all_data):
                 print(f"用戶: {data['name']} (ID: {data['id']})")
                 print(f"位置: X={data['position']['x']}, Y={data['position']['y']}, 質量={data['position']['quality']}")
+                if zones:
+                    print(f"區域: {zones[index]}")
                 print("----------------------------")
             
             # 等待一段時間再移動
@@ -165,13 +176,102 @@ def simulation_loop():
         client.disconnect()
         print("模擬結束。")
 
-if __name__ == "__main__":
-    print("開始位置模擬器 - 同時模擬5個用戶緩慢移動")
-    print("按Ctrl+C停止")
-    print("---------------------------------")
+def location_shard_worker(ctx, users, options):
+    """分片工作進程: 每秒移動並發送本分片所有用戶的位置，用戶之間不停頓"""
+    interval = options.get("interval", 1.0)
+    model = attach_mobility(users, options.get("patterns"), floor_plan=options.get("floor_plan"),
+                            time_scale=options.get("time_scale", 1.0))
+    next_tick = time.monotonic()
+    while not ctx.stopped():
+        move_users(model)
+        for user in users:
+            ctx.publish(TOPIC_LOCATION, json.dumps(build_location_data(user, model)), qos=1, retain=True)
+        next_tick += interval
+        if ctx.sleep(next_tick - time.monotonic()):
+            break
+
+class LocationDevice(DeviceModel):
+    """asyncio引擎中的一個定位Tag: 每個周期移動一次並發送位置"""
+    qos = 1
+    retain = True
     
-    # 設置MQTT
-    setup_mqtt()
+    def __init__(self, user, model, interval=1.0):
+        self.user = user
+        self.model = model
+        self.name = user["name"]
+        self.interval = interval
     
-    # 開始模擬
-    simulation_loop()
+    def tick(self):
+        # 所有設備共享同一個移動模型，每個周期由最先到期的設備批量推進一次
+        self.model.step_if_due(self.interval)
+        return [(TOPIC_LOCATION, build_location_data(self.user, self.model))]
+
+def run_async_simulation(users, interval=1.0, duration=0, pattern_weights=None, floor_plan=None, time_scale=1.0,
+                         probe=None):
+    """以asyncio引擎運行: 所有用戶共用一個連接，各自按間隔發送，周期不隨用戶數增長 (probe為探針時鐘或None)"""
+    model = attach_mobility(users, pattern_weights, floor_plan=floor_plan, time_scale=time_scale)
+    engine = AsyncMqttEngine(MQTT_BROKER, MQTT_PORT, MQTT_CLIENT_ID, label="位置模擬",
+                             probe=ProbeStamper(MQTT_CLIENT_ID, probe) if probe else None)
+    engine.add_devices(LocationDevice(user, model, interval) for user in users)
+    return run_engine(engine, duration)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MQTT位置模擬器")
+    parser.add_argument("-b", "--broker", default=MQTT_BROKER, help="MQTT伺服器地址")
+    parser.add_argument("-p", "--port", type=int, default=MQTT_PORT, help="MQTT伺服器端口")
+    parser.add_argument("--users", type=int, default=len(USERS), help="模擬的用戶數量")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="分片工作進程數，每個進程有自己的MQTT連接 (0表示單進程模式)")
+    parser.add_argument("--engine", choices=("loop", "async"), default="loop",
+                        help="單進程模式的發送方式: loop為原來的逐個用戶循環，async為共用的asyncio引擎")
+    parser.add_argument("--interval", type=float, default=1.0, help="分片/async模式下每個用戶的發送間隔 (秒)")
+    parser.add_argument("--patterns", type=parse_pattern_weights, default=None,
+                        help="移動模式的分配權重，例如 random_walk=6,circular=2,static=2 "
+                             "(默認前五個用戶沿用固定模式，其餘隨機遊走)")
+    parser.add_argument("--floor-plan", default=None,
+                        help="平面圖JSON路徑，或 default 使用內置的護理樓平面圖；"
+                             "指定後用戶按作息在房間之間行走，代替 --patterns")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="按作息移動時的模擬時間倍速 (例如10表示停留和行走快10倍)")
+    parser.add_argument("--probe", nargs="?", const="mono", choices=CLOCKS, default=None,
+                        help="分片/async模式下在每條消息中加入延遲探針 (發送時間和序號)，"
+                             "可指定時鐘: mono (同一台機器, 默認) 或 wall (跨機器, 需要NTP)")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="分片/async模式的運行時長 (秒, 0表示直到Ctrl+C)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    MQTT_BROKER = args.broker
+    MQTT_PORT = args.port
+    
+    if args.shards > 0:
+        print(f"開始位置模擬器 - {args.users}個用戶, {args.shards}個分片進程")
+        options = {
+            "broker": args.broker,
+            "port": args.port,
+            "client_id_prefix": MQTT_CLIENT_ID,
+            "interval": args.interval,
+            "patterns": args.patterns,
+            "floor_plan": args.floor_plan,
+            "time_scale": args.time_scale,
+            "probe": args.probe
+        }
+        run_sharded(location_shard_worker, make_users(args.users), args.shards, options,
+                    duration=args.duration)
+    elif args.engine == "async":
+        print(f"開始位置模擬器 - {args.users}個用戶, asyncio引擎")
+        run_async_simulation(make_users(args.users), args.interval, args.duration, args.patterns,
+                             args.floor_plan, args.time_scale, args.probe)
+    else:
+        USERS = make_users(args.users)
+        mobility = attach_mobility(USERS, args.patterns, floor_plan=args.floor_plan, time_scale=args.time_scale)
+        print(f"開始位置模擬器 - 同時模擬{len(USERS)}個用戶緩慢移動")
+        print("按Ctrl+C停止")
+        print("---------------------------------")
+        
+        # 設置MQTT
+        setup_mqtt()
+        
+        # 開始模擬
+        simulation_loop()
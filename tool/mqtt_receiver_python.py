@@ -6,8 +6,17 @@ import json
 import time
 import sys
 import argparse
+import threading
+from collections import deque
 from datetime import datetime
 
+from location_ingest import LocationIngest, load_geofences, format_event
+from receive_queue import ReceiveQueue, WORKER_MODES
+from telemetry_store import TelemetryStore
+from mqtt_capture import CaptureWriter
+from latency_probe import LatencyTracker, probe_of
+from payload_decoders import DEFAULT_SPEC_PATH, PayloadRecord, as_dict, content_of, load_registry
+
 # 默認MQTT連接參數
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
@@ -17,9 +26,37 @@ MQTT_CLIENT_ID = "mqtt-receiver-python"
 # 接收到的消息計數
 message_count = 0
 
-# 存儲最近接收的消息
-recent_messages = []
+# 存儲最近接收的消息 (接收時間, 主題, 原始負載, 解析結果)，只在需要顯示時才格式化
+# 規格中已知content的消息解析為類型化記錄 (見 payload_decoders)，不保存通用字典
 MAX_RECENT_MESSAGES = 10
+recent_messages = deque(maxlen=MAX_RECENT_MESSAGES)
+
+# 高吞吐模式: 不逐條輸出，由主線程定期輸出摘要 (見 ReceiveSummary)
+fast_mode = False
+summary = None
+# 每次摘要最多顯示的圍欄事件數
+MAX_EVENTS_PER_REPORT = 20
+
+# 接收隊列 (--workers > 0 時使用): on_message只入隊，解析和輸出在工作者中進行
+receive_queue = None
+
+# 消息解碼分派表 (content -> 類型化記錄)，由UWB規格文件生成
+registry = None
+
+# 時間序列存儲 (指定 --store 時啟用)，location/300B/尿布/體溫消息按批寫入SQLite
+telemetry_store = None
+
+# 列式數據捕獲 (指定 --capture-dir 時啟用，需要pyarrow)，每種content每小時一個Parquet文件
+parquet_capture = None
+
+# 原始流量記錄 (指定 --record 時啟用)，可用 mqtt_capture.py replay 重放
+capture_writer = None
+
+# 端到端延遲統計 (指定 --latency 時啟用)，統計發送端以 --probe 加入的探針
+latency_tracker = None
+
+# 位置數據處理 (指定 --geofence 時啟用)，只在Tag進出電子圍欄時輸出事件
+location_ingest = None
 
 # 當連接到MQTT代理成功時的回調函數
 def on_connect(client, userdata, flags, rc):
@@ -50,77 +87,183 @@ def on_connect(client, userdata, flags, rc):
         # 5: 未授權
         # 6-255: 目前未使用
 
-# 當接收到消息時的回調函數
-def on_message(client, userdata, msg):
-    global message_count, recent_messages
+class ReceiveSummary:
+    """
+    高吞吐模式的接收統計: 網絡線程只做計數，主線程每隔 interval 秒輸出一行摘要，
+    避免逐條格式化和輸出使接收器跟不上伺服器
+    """
     
-    # 獲取當前時間戳
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.events = []
+        self.dropped_events = 0
+        self.window_total = 0
+        self.window_start = time.monotonic()
+        self.next_report = self.window_start + interval
     
-    # 增加消息計數
-    message_count += 1
+    def record(self, data):
+        if isinstance(data, (PayloadRecord, dict)):
+            content = content_of(data) or "未知內容"
+        else:
+            content = "非JSON"
+        with self.lock:
+            self.counts[content] = self.counts.get(content, 0) + 1
+            self.window_total += 1
     
-    # 嘗試解析JSON
-    try:
-        payload = msg.payload.decode("utf-8")
-        json_data = json.loads(payload)
-        parsed = True
-    except:
-        json_data = None
-        parsed = False
-    
-    # 記錄消息
-    message_info = {
-        "timestamp": timestamp,
-        "topic": msg.topic,
-        "payload": payload if not parsed else json.dumps(json_data, indent=2, ensure_ascii=False),
-        "parsed": parsed
-    }
-    
-    # 添加到最近消息列表
-    recent_messages.append(message_info)
-    if len(recent_messages) > MAX_RECENT_MESSAGES:
-        recent_messages.pop(0)
-    
-    # 輸出消息摘要
-    print(f"\n[{timestamp}] 收到消息 #{message_count}:")
-    print(f"主題: {msg.topic}")
+    def record_events(self, events):
+        with self.lock:
+            room = MAX_EVENTS_PER_REPORT - len(self.events)
+            self.events.extend(events[:max(room, 0)])
+            self.dropped_events += max(len(events) - max(room, 0), 0)
+    
+    def maybe_report(self):
+        now = time.monotonic()
+        if now < self.next_report:
+            return
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            events, self.events = self.events, []
+            dropped, self.dropped_events = self.dropped_events, 0
+            total, self.window_total = self.window_total, 0
+        
+        elapsed = now - self.window_start
+        rate = total / elapsed if elapsed > 0 else 0.0
+        detail = ", ".join(f"{content} {count}" for content, count in
+                           sorted(counts.items(), key=lambda item: -item[1]))
+        lines = [f"[接收] 共 {message_count} 條, 當前 {rate:.0f} msg/s" + (f" ({detail})" if detail else "")]
+        if receive_queue:
+            lines.append(receive_queue.format_stats())
+        if latency_tracker:
+            lines.extend(latency_tracker.report_lines(window=True))
+        lines.extend(format_event(event) for event in events)
+        if dropped:
+            lines.append(f"[圍欄] ... 另有 {dropped} 個事件未顯示")
+        print("\n".join(lines))
+        self.window_start = now
+        self.next_report = now + self.interval
+
+def format_message_info(info):
+    """按需格式化一條已保存的消息 (只有顯示時才做縮進序列化)"""
+    received_at, topic, payload, data = info
+    timestamp = datetime.fromtimestamp(received_at).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    if data is not None:
+        body = json.dumps(as_dict(data), indent=2, ensure_ascii=False)
+    else:
+        body = payload.decode("utf-8", errors="replace")
+    return f"[{timestamp}] 主題: {topic}\n{body}"
+
+def _location_lines(record):
+    pos = record.get("position")
+    lines = []
+    if isinstance(pos, (PayloadRecord, dict)):
+        lines.append(f"位置: X={pos.get('x')}, Y={pos.get('y')}, Z={pos.get('z')}, 品質={pos.get('quality')}")
+    if location_ingest:
+        lines.extend(format_event(event) for event in location_ingest.ingest(record))
+    return lines
+
+def _health_lines(record):
+    return [
+        f"心率: {record.get('hr', '未知')} bpm",
+        f"血氧: {record.get('SpO2', '未知')}%",
+        f"血壓: {record.get('bp syst', '未知')}/{record.get('bp diast', '未知')} mmHg",
+        f"體溫: {record.get('skin temp', '未知')}°C"
+    ]
+
+def _diaper_lines(record):
+    return [
+        f"溫度: {record.get('temp', '未知')}°C",
+        f"濕度: {record.get('humi', '未知')}%",
+        f"按鈕狀態: {record.get('button', '未知')}"
+    ]
+
+# 按content顯示關鍵信息的分派表
+DETAIL_FORMATTERS = {
+    "location": _location_lines,
+    "300B": _health_lines,
+    "diaper DV1": _diaper_lines
+}
+
+def print_message(timestamp, topic, payload, data):
+    """逐條輸出模式: 整條消息組成一次輸出"""
+    lines = [f"\n[{timestamp}] 收到消息 #{message_count}:", f"主題: {topic}"]
     
     # 根據是否成功解析JSON顯示不同的信息
-    if parsed:
+    if isinstance(data, (PayloadRecord, dict)):
         # 提取關鍵信息用於簡明顯示
-        content = json_data.get("content", "未知內容")
-        node_type = json_data.get("node", "未知節點")
-        node_id = json_data.get("id", "未知ID")
-        
-        print(f"內容類型: {content}")
-        print(f"節點類型: {node_type}")
-        print(f"節點ID: {node_id}")
-        
-        # 如果是位置數據，顯示位置信息
-        if content == "location" and "position" in json_data:
-            pos = json_data["position"]
-            print(f"位置: X={pos.get('x')}, Y={pos.get('y')}, Z={pos.get('z')}, 品質={pos.get('quality')}")
+        content = content_of(data) or "未知內容"
+        lines.append(f"內容類型: {content}")
+        lines.append(f"節點類型: {data.get('node', '未知節點')}")
+        lines.append(f"節點ID: {data.get('id', '未知ID')}")
         
-        # 如果是健康數據，顯示關鍵健康指標
-        elif content == "300B":
-            print(f"心率: {json_data.get('hr', '未知')} bpm")
-            print(f"血氧: {json_data.get('SpO2', '未知')}%")
-            print(f"血壓: {json_data.get('bp syst', '未知')}/{json_data.get('bp diast', '未知')} mmHg")
-            print(f"體溫: {json_data.get('skin temp', '未知')}°C")
+        formatter = DETAIL_FORMATTERS.get(content)
+        if formatter is None and "diaper" in content:
+            # 規格之外的尿布型號同樣顯示溫度和濕度
+            formatter = _diaper_lines
+        if formatter:
+            lines.extend(formatter(data))
         
-        # 如果是尿布數據，顯示關鍵指標
-        elif "diaper" in content:
-            print(f"溫度: {json_data.get('temp', '未知')}°C")
-            print(f"濕度: {json_data.get('humi', '未知')}%")
-            print(f"按鈕狀態: {json_data.get('button', '未知')}")
-        
-        print(f"完整數據: \n{json.dumps(json_data, indent=2, ensure_ascii=False)}")
+        lines.append(f"完整數據: \n{json.dumps(as_dict(data), indent=2, ensure_ascii=False)}")
+    elif data is not None:
+        lines.append(f"完整數據: \n{json.dumps(data, indent=2, ensure_ascii=False)}")
     else:
         # 非JSON數據，直接顯示原始負載
-        print(f"原始數據: {payload}")
+        lines.append(f"原始數據: {payload.decode('utf-8', errors='replace')}")
+    
+    lines.append("-" * 80)
+    print("\n".join(lines))
+
+def init_decoder(spec_path):
+    """工作進程的初始化: 按主進程的 --spec 建立解碼表 (spawn/forkserver啟動時不繼承全局變量)"""
+    global registry
+    registry = load_registry(spec_path)
+
+def decode_message(topic, payload, received_at):
+    """
+    解析消息 (只解析一次，json.loads可以直接處理UTF-8字節)，返回 (接收時間, 主題, 原始負載, 解析結果)
+    已知content的消息按主題和content查表解碼為類型化記錄
+    """
+    try:
+        json_data = json.loads(payload)
+    except ValueError:
+        return (received_at, topic, payload, None)
+    return (received_at, topic, payload, (registry or load_registry()).decode(topic, json_data))
+
+def handle_decoded(info):
+    """處理已解析的消息: 保存、統計、電子圍欄和輸出 (串行執行)"""
+    global message_count
+    
+    # 增加消息計數
+    message_count += 1
+    
+    # 添加到最近消息列表 (deque自動丟棄最舊的消息)
+    recent_messages.append(info)
+    received_at, topic, payload, json_data = info
+    
+    if telemetry_store:
+        telemetry_store.add(json_data, received_at)
+    if parquet_capture:
+        parquet_capture.add(json_data, received_at, topic)
+    if latency_tracker:
+        probe = probe_of(json_data)
+        if probe is not None:
+            latency_tracker.record(topic, probe, received_at)
+    
+    if fast_mode:
+        summary.record(json_data)
+        if location_ingest and content_of(json_data) == "location":
+            events = location_ingest.ingest(json_data, received_at)
+            if events:
+                summary.record_events(events)
+        return
     
-    print("-" * 80)
+    timestamp = datetime.fromtimestamp(received_at).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    print_message(timestamp, topic, payload, json_data)
+
+# 當接收到消息時的回調函數 (不使用接收隊列時，在網絡線程中直接處理)
+def on_message(client, userdata, msg):
+    handle_decoded(decode_message(msg.topic, msg.payload, time.time()))
 
 # 顯示使用幫助
 def print_help():
@@ -134,13 +277,26 @@ MQTT接收器 (Python版本)
     -b, --broker ADDRESS    設置MQTT伺服器地址 (默認: localhost)
     -p, --port PORT         設置MQTT伺服器端口 (默認: 1883)
     -t, --topic TOPIC       設置要訂閱的主題 (可多次使用, 默認: 多個關鍵主題)
+    --geofence PATH         電子圍欄/平面圖JSON (或 default)，啟用位置處理和進出事件
+    --fast                  高吞吐模式: 不逐條輸出，定期輸出接收速率摘要
+    --summary-interval SEC  高吞吐模式的摘要間隔 (默認: 5秒)
+    --show-recent           退出時顯示最近消息的完整內容
+    --store PATH            把位置、健康、尿布和體溫數據保存到SQLite時間序列數據庫
+    --capture-dir DIR       按content類型把數據捕獲為Parquet文件 (每小時一個文件，需要pyarrow)
+    --record PATH           把原始流量 (時間、主題、QoS、retain、負載) 記錄到文件，可重放
+    --latency               統計發送端探針 (模擬器 --probe) 的端到端延遲、丟失和重複
+    --spec PATH             UWB規格JSON，用於生成消息解碼表 (默認: 同目錄的UWB_JSON_20250225.json)
+    --workers N             接收隊列的工作者數量 (默認: 1, 0表示在網絡線程中直接處理)
+    --worker-mode MODE      工作者類型: thread 或 process (默認: thread)
+    --queue-size N          接收隊列容量，滿時丟棄新消息 (默認: 10000)
     
 按 Ctrl+C 退出程序
     """)
 
 # 主函數
 def main():
-    global MQTT_BROKER, MQTT_PORT, MQTT_CLIENT_ID
+    global MQTT_BROKER, MQTT_PORT, MQTT_CLIENT_ID, location_ingest, fast_mode, summary, receive_queue, registry
+    global telemetry_store, parquet_capture, capture_writer, latency_tracker
     
     # 解析命令行參數
     parser = argparse.ArgumentParser(description="MQTT接收器 (Python版本)")
@@ -148,9 +304,56 @@ def main():
     parser.add_argument("-p", "--port", type=int, help="MQTT伺服器端口", default=MQTT_PORT)
     parser.add_argument("-t", "--topic", action="append", help="要訂閱的主題 (可多次使用)")
     parser.add_argument("--client-id", help="客戶端ID", default=MQTT_CLIENT_ID)
+    parser.add_argument("--geofence", help="電子圍欄配置JSON，或 default 使用默認平面圖的房間；"
+                                           "指定後處理location消息並輸出Tag進出圍欄的事件")
+    
+    parser.add_argument("--fast", action="store_true",
+                        help="高吞吐模式: 每條消息只解析一次並計數，不逐條輸出，定期輸出接收速率摘要")
+    parser.add_argument("--summary-interval", type=float, default=5.0, help="高吞吐模式的摘要間隔 (秒)")
+    parser.add_argument("--show-recent", action="store_true", help="退出時顯示最近消息的完整內容")
+    parser.add_argument("--store", help="SQLite數據庫路徑，保存位置、健康、尿布和體溫數據 (批量寫入，"
+                                        "可用 telemetry_store.py 按設備、指標和時間範圍查詢)")
+    parser.add_argument("--capture-dir", help="Parquet捕獲目錄，location/300B/尿布/體溫/心跳消息各一個表，"
+                                              "每小時一個文件 (需要pyarrow，可用 parquet_capture.py 查詢)")
+    parser.add_argument("--record", help="記錄原始流量的文件 (.mqcap)，可用 mqtt_capture.py replay 按原始間隔重放")
+    parser.add_argument("--latency", action="store_true",
+                        help="統計發送端探針 (模擬器 --probe) 的端到端延遲 (p50/p95/p99/max)、丟失、重複和亂序")
+    parser.add_argument("--spec", default=DEFAULT_SPEC_PATH, help="UWB規格JSON，用於生成按content分派的消息解碼表")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="接收隊列的工作者數量，on_message只入隊 (0表示在網絡線程中直接處理)")
+    parser.add_argument("--worker-mode", choices=WORKER_MODES, default="thread",
+                        help="工作者類型: process時消息解析在工作進程中並行進行")
+    parser.add_argument("--queue-size", type=int, default=10000, help="接收隊列容量，滿時丟棄新消息並計數")
     
     args = parser.parse_args()
     
+    registry = load_registry(args.spec)
+    print(f"已載入 {len(registry.contents)} 種消息的解碼表")
+    
+    fast_mode = args.fast
+    if fast_mode:
+        summary = ReceiveSummary(args.summary_interval)
+    
+    if args.store:
+        telemetry_store = TelemetryStore(args.store)
+        print(f"數據保存到: {args.store} (已有 {len(telemetry_store.series)} 個序列)")
+    
+    if args.capture_dir:
+        try:
+            from parquet_capture import ParquetCapture
+        except ImportError:
+            print("錯誤: --capture-dir 需要安裝pyarrow (pip install pyarrow)")
+            return 1
+        parquet_capture = ParquetCapture(args.capture_dir)
+        print(f"數據捕獲到: {args.capture_dir}")
+    
+    if args.latency:
+        latency_tracker = LatencyTracker()
+    
+    if args.geofence:
+        location_ingest = LocationIngest(load_geofences(args.geofence))
+        print(f"已載入 {len(location_ingest.fences)} 個電子圍欄")
+    
     # 更新連接參數
     MQTT_BROKER = args.broker
     MQTT_PORT = args.port
@@ -161,7 +364,23 @@ def main():
     
     # 設置回調函數
     client.on_connect = on_connect
-    client.on_message = on_message
+    if args.workers > 0:
+        receive_queue = ReceiveQueue(decode_message, handle_decoded, workers=args.workers,
+                                     maxsize=args.queue_size, mode=args.worker_mode,
+                                     initializer=init_decoder, initargs=(args.spec,)).start()
+        client.on_message = receive_queue.on_message
+        print(f"接收隊列: {args.workers} 個{'線程' if args.worker_mode == 'thread' else '進程'}, 容量 {args.queue_size}")
+    else:
+        client.on_message = on_message
+    if args.record:
+        # 在網絡線程中先記錄 (保留QoS和retain)，再交給接收隊列或直接處理
+        try:
+            capture_writer = CaptureWriter(args.record)
+        except FileExistsError as e:
+            print(f"錯誤: {e}")
+            return 1
+        client.on_message = capture_writer.on_message(client.on_message)
+        print(f"記錄原始流量到: {args.record}")
     
     try:
         # 連接到MQTT伺服器
@@ -181,20 +400,55 @@ def main():
         # 保持程序運行，直到用戶中斷
         try:
             while True:
-                time.sleep(1)
+                time.sleep(min(1.0, args.summary_interval) if fast_mode else 1)
+                if fast_mode:
+                    summary.maybe_report()
+                if telemetry_store:
+                    telemetry_store.maybe_flush()
+                if parquet_capture:
+                    parquet_capture.maybe_flush()
+                if capture_writer:
+                    capture_writer.flush()
         except KeyboardInterrupt:
             print("\n用戶中斷，停止接收器...")
         finally:
             client.loop_stop()
             client.disconnect()
+            if receive_queue:
+                receive_queue.stop()
             
             # 顯示接收摘要
             print(f"\n接收摘要:")
             print(f"共接收到 {message_count} 條消息")
+            if receive_queue:
+                print(receive_queue.format_stats())
+            if telemetry_store:
+                telemetry_store.close()
+                stats = telemetry_store.summary()
+                print(f"已保存: {stats['messages']} 條消息, {stats['samples']} 個樣本, {stats['series']} 個序列")
+            if capture_writer:
+                capture_writer.close()
+                print(f"已記錄: {capture_writer.count} 條消息到 {args.record}")
+            if parquet_capture:
+                parquet_capture.close()
+                for content, (rows, files) in parquet_capture.summary().items():
+                    print(f"已捕獲 {content}: {rows} 行, {files} 個文件")
+            if latency_tracker:
+                for line in latency_tracker.report_lines():
+                    print(line)
+            if location_ingest:
+                stats = location_ingest.summary()
+                print(f"位置處理: {stats['messages']} 條定位, {stats['tags']} 個Tag, {stats['events']} 個圍欄事件")
+                for name, count in location_ingest.occupancy().items():
+                    print(f"  {name}: {count} 個Tag")
             if recent_messages:
                 print(f"最近 {len(recent_messages)} 條消息:")
-                for i, msg in enumerate(recent_messages):
-                    print(f"{i+1}. [{msg['timestamp']}] 主題: {msg['topic']}")
+                for i, info in enumerate(list(recent_messages)):
+                    if args.show_recent:
+                        print(f"{i+1}. {format_message_info(info)}")
+                    else:
+                        timestamp = datetime.fromtimestamp(info[0]).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+                        print(f"{i+1}. [{timestamp}] 主題: {info[1]}")
             
             print("接收器已停止")
     
@@ -7,8 +7,16 @@ import time
 import random
 import sys
 import os
+import copy
 from datetime import datetime
 
+from uwb_catalog import load_catalog
+from load_control import TokenBucket, RateReporter
+from mqtt_shard import run_sharded
+from mqtt_capture import CaptureReader
+from latency_probe import ProbeStamper
+from health_model import HealthModel
+
 # 設定MQTT連接參數
 MQTT_BROKER = "localhost"  # 默認是本地broker，可以修改為實際伺服器地址
 MQTT_PORT = 1883
@@ -18,28 +26,30 @@ MQTT_KEEPALIVE = 60
 # 默認主題前綴 (可修改為實際的Gateway ID)
 TOPIC_PREFIX = "GW17F5"
 
-# 載入JSON數據
-def load_json_data(json_file_path):
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"錯誤: 無法讀取JSON文件: {e}")
-        return None
+# 延遲探針的時鐘 ("mono"/"wall")，None表示不加探針；開啟後負載測試和艦隊模擬的每條消息
+# 都帶有發送時間和序號，由 mqtt_receiver_python.py --latency 統計延遲、丟失和重複
+PROBE_CLOCK = None
 
-# 從字符串中提取JSON對象
-def extract_json_from_string(json_str):
-    try:
-        # 尋找JSON開始和結束的位置
-        start = json_str.find('{')
-        end = json_str.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_content = json_str[start:end]
-            return json.loads(json_content)
-        else:
-            return None
-    except json.JSONDecodeError:
-        return None
+# 艦隊模擬設置: 每個模擬Gateway使用 GW{編號}_Loca/_Health/_Message/_Ack 主題
+FLEET_TOPIC_SUFFIXES = ("_Loca", "_Health", "_Message", "_Ack")
+FLEET_BASE_PREFIX = 0x17F5       # 第一個Gateway的編號 (GW17F5)，其餘依次遞增
+FLEET_BASE_GATEWAY_ID = 137205   # 第一個Gateway的gateway id
+FLEET_BASE_TAG_ID = 23349        # 第一個Tag的id
+# 每個Tag發送的消息類型 (content)，以及每個Gateway自身發送的消息類型
+FLEET_TAG_CONTENTS = ("location", "300B", "diaper DV1")
+FLEET_GATEWAY_CONTENTS = ("heartbeat",)
+
+# 300B生理模型的推進間隔 (秒): 同一設備的心率、血壓、血氧等按模型連續變化，而不是每條消息獨立隨機
+HEALTH_STEP_INTERVAL = 1.0
+# 單條消息發送和負載測試中每個設備 (按MAC) 自己的生理模型 (第一次使用時建立)
+_health_models = {}
+
+def health_model_for(mac):
+    """返回MAC對應設備的單設備生理模型，不同設備的生理狀態互相獨立"""
+    model = _health_models.get(mac)
+    if model is None:
+        model = _health_models[mac] = HealthModel(1)
+    return model
 
 # 連接MQTT伺服器
 def connect_mqtt():
@@ -53,51 +63,52 @@ def connect_mqtt():
         return None
 
 # 發送MQTT消息
-def publish_message(client, topic, message, qos=0):
+def publish_message(client, topic, message, qos=0, verbose=True, retain=False):
     try:
-        result = client.publish(topic, message, qos=qos)
+        result = client.publish(topic, message, qos=qos, retain=retain)
         status = result[0]
         if status == 0:
-            print(f"消息發送成功 - 主題: {topic}")
+            if verbose:
+                print(f"消息發送成功 - 主題: {topic}")
             return True
         else:
-            print(f"無法發送消息到主題: {topic}, 錯誤碼: {status}")
+            if verbose:
+                print(f"無法發送消息到主題: {topic}, 錯誤碼: {status}")
             return False
     except Exception as e:
         print(f"發送消息時出錯: {e}")
         return False
 
-# 從JSON數據中提取消息
-def extract_messages_by_type(data, message_type):
-    messages = []
+# 解析消息的實際主題
+def resolve_topic(topic, prefix=None):
+    # 如果主題包含通配符，替換為實際主題
+    # 前綴本身已包含"GW" (例如GW17F5)，因此 GWxxxx_Loca -> GW17F5_Loca
+    if topic and "xxxx" in topic:
+        prefix = prefix or TOPIC_PREFIX
+        if prefix.startswith("GW") and "GWxxxx" in topic:
+            return topic.replace("GWxxxx", prefix)
+        return topic.replace("xxxx", prefix)
+    return topic
+
+# 從消息目錄中提取消息
+def extract_messages_by_type(catalog, message_type):
+    # sheet名稱完全匹配時直接查索引
+    if message_type in catalog.by_sheet:
+        entries = catalog.messages(message_type)
+    else:
+        entries = [
+            entry
+            for sheet_name in catalog.sheet_names
+            if message_type.lower() in sheet_name.lower()
+            for entry in catalog.messages(sheet_name)
+        ]
     
-    # 遍歷所有sheet
-    for sheet_name, sheet_data in data.items():
-        # 尋找與消息類型匹配的sheet
-        if message_type.lower() in sheet_name.lower():
-            for row in sheet_data:
-                if "Unnamed: 1" in row and row["Unnamed: 1"]:
-                    json_obj = extract_json_from_string(row["Unnamed: 1"])
-                    if json_obj:
-                        # 提取主題信息
-                        topic = None
-                        if "Unnamed: 1" in row and isinstance(row["Unnamed: 1"], str) and "Topic:" in row["Unnamed: 1"]:
-                            topic = row["Unnamed: 1"].split("Topic: ")[1].strip()
-                        
-                        # 查找更上面的行是否有主題信息
-                        if topic is None and "Unnamed: 0" in row and row["Unnamed: 0"] is not None:
-                            # 向上查找前幾行
-                            idx = sheet_data.index(row)
-                            for i in range(max(0, idx-5), idx):
-                                if "Unnamed: 1" in sheet_data[i] and isinstance(sheet_data[i]["Unnamed: 1"], str) and "Topic:" in sheet_data[i]["Unnamed: 1"]:
-                                    topic = sheet_data[i]["Unnamed: 1"].split("Topic: ")[1].strip()
-                                    break
-                        
-                        messages.append({
-                            "json": json_obj,
-                            "topic": topic,
-                            "sheet": sheet_name
-                        })
+    # 複製JSON內容，避免update_dynamic_fields修改目錄中的原始數據
+    messages = []
+    for entry in entries:
+        msg = entry.to_dict()
+        msg["json"] = copy.deepcopy(entry.payload)
+        messages.append(msg)
     
     return messages
 
@@ -127,22 +138,11 @@ def update_dynamic_fields(message):
             if "quality" in message["position"]:
                 message["position"]["quality"] = random.randint(60, 100)
         
-        # 如果是健康數據，隨機化一些值
+        # 如果是健康數據，由生理模型填寫心率、血氧、血壓、體溫、步數、睡眠和電量
         if "content" in message and message["content"] == "300B":
-            if "hr" in message:  # 心率
-                message["hr"] = random.randint(65, 100)
-            if "SpO2" in message:  # 血氧
-                message["SpO2"] = random.randint(93, 100)
-            if "bp syst" in message:  # 收縮壓
-                message["bp syst"] = random.randint(110, 140)
-            if "bp diast" in message:  # 舒張壓
-                message["bp diast"] = random.randint(70, 90)
-            if "skin temp" in message:  # 皮膚溫度
-                message["skin temp"] = round(random.uniform(33.0, 35.0), 1)
-            if "room temp" in message:  # 室溫
-                message["room temp"] = round(random.uniform(22.0, 26.0), 1)
-            if "battery level" in message:  # 電池電量
-                message["battery level"] = random.randint(50, 100)
+            health = health_model_for(message.get("MAC"))
+            health.step_if_due(HEALTH_STEP_INTERVAL)
+            health.apply(message, 0)
         
         # 如果是尿布數據，隨機化一些值
         if "content" in message and "diaper" in message["content"]:
@@ -155,6 +155,313 @@ def update_dynamic_fields(message):
     
     return message
 
+# 按目標速率發送由 next_message() 產生的消息
+def _paced_publish(client, next_message, rate, duration=0, max_messages=0, qos=0,
+                   report_interval=1.0, label="負載測試", probe=None):
+    """
+    以令牌桶控制的目標速率發送消息，網絡循環在後台線程運行，控制台只定期輸出速率摘要
+    
+    參數:
+        next_message (callable): 每次調用返回下一條要發送的 (主題, 消息字符串)
+        probe (ProbeStamper, optional): 延遲探針，在發送前最後一步加入發送時間和序號
+    """
+    bucket = TokenBucket(rate)
+    reporter = RateReporter(rate, report_interval, label=label)
+    deadline = time.monotonic() + duration if duration > 0 else None
+    publish = client.publish
+    
+    client.loop_start()
+    try:
+        while True:
+            if max_messages and reporter.sent + reporter.failed >= max_messages:
+                break
+            if deadline and time.monotonic() >= deadline:
+                break
+            
+            bucket.acquire()
+            topic, payload = next_message()
+            if probe is not None:
+                payload = probe.stamp(topic, payload)
+            
+            try:
+                ok = publish(topic, payload, qos=qos).rc == mqtt.MQTT_ERR_SUCCESS
+            except Exception:
+                ok = False
+            reporter.record(ok)
+    except KeyboardInterrupt:
+        print(f"\n已停止{label}")
+    finally:
+        client.loop_stop()
+    
+    reporter.print_summary()
+    return reporter.summary()
+
+# 負載測試模式: 按目標速率循環發送消息
+def run_load_test(client, messages, rate, duration=0, max_messages=0, dynamic=True,
+                  qos=0, report_interval=1.0, probe=None):
+    """
+    以目標速率循環發送同一類型的所有消息
+    
+    參數:
+        client: 已連接的MQTT客戶端
+        messages (list): extract_messages_by_type 返回的消息列表
+        rate (float): 目標速率 (msg/s)，<=0 表示以最快速度發送
+        duration (float): 持續時間 (秒)，0表示不限
+        max_messages (int): 最多發送的消息數，0表示不限
+        dynamic (bool): 是否每條消息都更新動態字段；否則只序列化一次，重複發送相同內容
+        qos (int): QoS級別
+        report_interval (float): 速率摘要的輸出間隔 (秒)
+        probe (ProbeStamper, optional): 延遲探針 (非動態模式下也在每條消息中蓋時間戳)
+    
+    返回:
+        dict: RateReporter.summary() 的統計結果
+    """
+    targets = [(resolve_topic(msg["topic"]), msg) for msg in messages if msg["topic"]]
+    if not targets:
+        print("沒有可發送的消息 (找不到主題)")
+        return None
+    
+    # 非動態模式下預先序列化，發送循環中不再調用json.dumps
+    encoded = None if dynamic else [json.dumps(msg["json"]) for _, msg in targets]
+    position = [0]
+    
+    def next_message():
+        index = position[0]
+        position[0] = (index + 1) % len(targets)
+        topic, msg = targets[index]
+        if encoded is None:
+            return topic, json.dumps(update_dynamic_fields(msg["json"]))
+        return topic, encoded[index]
+    
+    return _paced_publish(client, next_message, rate, duration=duration, max_messages=max_messages,
+                          qos=qos, report_interval=report_interval, probe=probe)
+
+class SimulatedGateway:
+    """艦隊模擬中的一個Gateway: 有自己的主題前綴、gateway id、Tag列表和序列號"""
+    __slots__ = ("prefix", "gateway_id", "tag_ids", "serial")
+    
+    def __init__(self, prefix, gateway_id, tag_ids):
+        self.prefix = prefix
+        self.gateway_id = gateway_id
+        self.tag_ids = tag_ids
+        self.serial = random.randint(0, 65535)
+    
+    def next_serial(self):
+        # serial no = 0 ~ 65535，循環遞增
+        self.serial = (self.serial + 1) & 0xFFFF
+        return self.serial
+    
+    def topic(self, template):
+        return resolve_topic(template, self.prefix)
+
+# 建立 N 個Gateway × 每個M個Tag 的模擬艦隊
+def build_fleet(gateway_count, tags_per_gateway, first_gateway=0):
+    """
+    參數:
+        gateway_count (int): Gateway數量
+        tags_per_gateway (int): 每個Gateway下的Tag數量
+        first_gateway (int): 第一個Gateway的序號 (分片運行時用於錯開編號)
+    """
+    gateways = []
+    for i in range(first_gateway, first_gateway + gateway_count):
+        first_tag = FLEET_BASE_TAG_ID + i * tags_per_gateway
+        gateways.append(SimulatedGateway(
+            f"GW{FLEET_BASE_PREFIX + i:04X}",
+            FLEET_BASE_GATEWAY_ID + i,
+            list(range(first_tag, first_tag + tags_per_gateway))
+        ))
+    return gateways
+
+def _device_mac(tag_id):
+    # 由Tag id生成穿戴設備 (300B/尿布) 的MAC地址
+    return "E0:0E:" + ":".join(f"{(tag_id >> shift) & 0xFF:02X}" for shift in (24, 16, 8, 0))
+
+def _fleet_template(catalog, content):
+    for entry in catalog.by_content.get(content, []):
+        if entry.topic and entry.topic.startswith("GWxxxx") and entry.topic.endswith(FLEET_TOPIC_SUFFIXES):
+            return entry
+    return None
+
+# 由消息目錄為艦隊中的每個設備建立消息
+def build_fleet_devices(catalog, gateways, tag_contents=FLEET_TAG_CONTENTS,
+                        gateway_contents=FLEET_GATEWAY_CONTENTS):
+    """
+    返回設備列表 [(gateway, 主題, 消息字典)]，每個設備有獨立的消息字典，
+    發送時只更新動態字段，不需要再從目錄複製
+    """
+    devices = []
+    for content in tuple(gateway_contents) + tuple(tag_contents):
+        entry = _fleet_template(catalog, content)
+        if entry is None:
+            print(f"警告: 消息目錄中找不到content為'{content}'的GW主題消息，已跳過")
+            continue
+        
+        per_tag = content in tag_contents
+        for gateway in gateways:
+            topic = gateway.topic(entry.topic)
+            for tag_id in (gateway.tag_ids if per_tag else (None,)):
+                payload = copy.deepcopy(entry.payload)
+                payload["gateway id"] = gateway.gateway_id
+                if tag_id is None:
+                    if "name" in payload:
+                        payload["name"] = gateway.prefix
+                elif "MAC" in payload:
+                    mac = _device_mac(tag_id)
+                    payload["MAC"] = mac
+                    if "name" in payload:
+                        payload["name"] = "DV1_" + mac.replace(":", "")[-6:]
+                else:
+                    payload["id"] = tag_id
+                devices.append((gateway, topic, payload))
+    return devices
+
+# 艦隊模擬: 多個Gateway × 多個Tag同時發送
+def run_fleet_simulation(client, catalog, gateway_count, tags_per_gateway, rate,
+                         duration=0, qos=0, report_interval=1.0, first_gateway=0, probe=None):
+    """
+    模擬 N 個Gateway × M 個Tag 的消息匯入，所有設備共用同一份已解析的消息目錄
+    
+    參數:
+        rate (float): 總目標速率 (msg/s)，<=0 表示以最快速度發送
+        probe (ProbeStamper, optional): 延遲探針
+    """
+    gateways = build_fleet(gateway_count, tags_per_gateway, first_gateway)
+    devices = build_fleet_devices(catalog, gateways)
+    if not devices:
+        print("沒有可發送的艦隊消息")
+        return None
+    
+    print(f"艦隊: {len(gateways)} 個Gateway ({gateways[0].prefix} ~ {gateways[-1].prefix}), "
+          f"每個 {tags_per_gateway} 個Tag, 共 {len(devices)} 個消息源")
+    
+    return _paced_publish(client, _fleet_message_source(devices), rate, duration=duration, qos=qos,
+                          report_interval=report_interval, label="艦隊模擬", probe=probe)
+
+def _fleet_message_source(devices, seed=None):
+    # 依次輪流取出設備，更新動態字段和Gateway序列號後返回 (主題, JSON字符串)
+    # 所有300B設備共用一個向量化的生理模型，每 HEALTH_STEP_INTERVAL 秒一次批量推進全部設備
+    position = [0]
+    health_rows = [None] * len(devices)
+    health_count = 0
+    for index, (_, _, payload) in enumerate(devices):
+        if payload.get("content") == "300B":
+            health_rows[index] = health_count
+            health_count += 1
+    health = HealthModel(health_count, seed=seed) if health_count else None
+    
+    def next_message():
+        index = position[0]
+        position[0] = (index + 1) % len(devices)
+        gateway, topic, payload = devices[index]
+        row = health_rows[index]
+        if row is None:
+            update_dynamic_fields(payload)
+        else:
+            health.step_if_due(HEALTH_STEP_INTERVAL)
+            health.apply(payload, row)
+        if "serial no" in payload:
+            payload["serial no"] = gateway.next_serial()
+        return topic, json.dumps(payload)
+    
+    return next_message
+
+# 艦隊模擬的分片工作進程 (由 mqtt_shard.run_sharded 在子進程中調用)
+def fleet_shard_worker(ctx, gateway_indices, options):
+    """
+    只模擬分配給本分片的Gateway，速率為總目標速率按Gateway數量分攤的份額
+    每個子進程自己載入消息目錄 (命中二進制緩存時只需反序列化)
+    """
+    if not gateway_indices:
+        return
+    catalog = load_catalog(options["json_file"])
+    if not catalog:
+        return
+    
+    gateways = build_fleet(len(gateway_indices), options["tags_per_gateway"], gateway_indices[0])
+    devices = build_fleet_devices(catalog, gateways)
+    if not devices:
+        return
+    
+    next_message = _fleet_message_source(devices)
+    rate = options["rate"] * len(gateway_indices) / options["gateway_count"] if options["rate"] > 0 else 0
+    bucket = TokenBucket(rate)
+    qos = options.get("qos", 0)
+    
+    while not ctx.stopped():
+        if not bucket.try_acquire():
+            if ctx.sleep(bucket.delay()):
+                break
+            continue
+        topic, payload = next_message()
+        ctx.publish(topic, payload, qos=qos)
+
+# 以多個進程運行艦隊模擬，每個進程負責一部分Gateway並使用自己的MQTT連接
+# probe 為延遲探針的時鐘 ("mono"/"wall")，每個分片使用自己的發送端ID
+def run_sharded_fleet_simulation(json_file, gateway_count, tags_per_gateway, rate, shards,
+                                 duration=0, qos=0, probe=None):
+    options = {
+        "broker": MQTT_BROKER,
+        "port": MQTT_PORT,
+        "client_id_prefix": MQTT_CLIENT_ID,
+        "json_file": json_file,
+        "gateway_count": gateway_count,
+        "tags_per_gateway": tags_per_gateway,
+        "rate": rate,
+        "qos": qos,
+        "probe": probe
+    }
+    return run_sharded(fleet_shard_worker, list(range(gateway_count)), shards, options,
+                       duration=duration)
+
+# 重放記錄文件 (mqtt_capture.py 或 mqtt_receiver_python.py --record 產生)
+def replay_capture(client, path, speed=1.0, start=None, end=None, qos=None, keep_retain=True,
+                   report_interval=1.0):
+    """
+    按記錄的時間間隔重新發送記錄文件中的消息
+    
+    參數:
+        speed (float): 重放倍速，1為原速，N表示間隔縮短為1/N，<=0表示不等待、以最快速度發送
+        start, end (float, optional): 只重放 [start, end) 時間範圍內的消息 (Unix時間戳)
+        qos (int, optional): 覆蓋記錄中的QoS，None表示使用記錄的QoS
+        keep_retain (bool): 是否保留記錄中的retain標記
+    
+    返回:
+        dict: RateReporter.summary() 的統計結果，另含 max_lag (最大落後時間，秒)
+    """
+    reader = CaptureReader(path)
+    label = f"重放 {speed:g}x" if speed > 0 else "重放 (最快)"
+    reporter = RateReporter(0, report_interval, label=label)
+    first_ts = None
+    wall_start = None
+    max_lag = 0.0
+    
+    client.loop_start()
+    try:
+        for ts, topic, msg_qos, retain, payload in reader.read(start, end):
+            if speed > 0:
+                # 每條消息的發送時刻由記錄時間決定，落後時立即發送並追趕，不累積誤差
+                if first_ts is None:
+                    first_ts, wall_start = ts, time.monotonic()
+                delay = wall_start + (ts - first_ts) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif -delay > max_lag:
+                    max_lag = -delay
+            ok = publish_message(client, topic, payload, qos=msg_qos if qos is None else qos,
+                                 verbose=False, retain=retain and keep_retain)
+            reporter.record(ok)
+    except KeyboardInterrupt:
+        print(f"\n已停止{label}")
+    finally:
+        client.loop_stop()
+    
+    reporter.print_summary()
+    if speed > 0:
+        print(f"[{label}] 最大落後: {max_lag * 1000:.1f} ms")
+    result = reporter.summary()
+    result["max_lag"] = max_lag
+    return result
+
 # 顯示主菜單
 def show_menu(message_types):
     print("\n===== MQTT消息發送器 =====")
@@ -164,31 +471,38 @@ def show_menu(message_types):
         print(f"{i}. {msg_type}")
     
     print(f"{len(message_types) + 1}. 設置")
+    print(f"{len(message_types) + 2}. 艦隊模擬 (多Gateway × 多Tag)")
+    print(f"{len(message_types) + 3}. 重放記錄文件")
     print("0. 退出程序")
     
     while True:
         try:
-            choice = int(input("\n請選擇要發送的消息類型 (0-{0}): ".format(len(message_types) + 1)))
-            if 0 <= choice <= len(message_types) + 1:
+            choice = int(input("\n請選擇要發送的消息類型 (0-{0}): ".format(len(message_types) + 3)))
+            if 0 <= choice <= len(message_types) + 3:
                 return choice
             else:
-                print(f"請輸入0到{len(message_types) + 1}之間的數字")
+                print(f"請輸入0到{len(message_types) + 3}之間的數字")
         except ValueError:
             print("請輸入數字")
 
+# 按設置建立延遲探針 (未開啟時返回None)
+def make_probe():
+    return ProbeStamper(MQTT_CLIENT_ID, PROBE_CLOCK) if PROBE_CLOCK else None
+
 # 顯示MQTT連接設置菜單
 def show_settings_menu():
-    global MQTT_BROKER, MQTT_PORT, TOPIC_PREFIX
+    global MQTT_BROKER, MQTT_PORT, TOPIC_PREFIX, PROBE_CLOCK
     
     print("\n===== MQTT連接設置 =====")
     print(f"1. MQTT伺服器地址: {MQTT_BROKER}")
     print(f"2. MQTT伺服器端口: {MQTT_PORT}")
     print(f"3. 主題前綴: {TOPIC_PREFIX}")
-    print("4. 返回主菜單")
+    print(f"4. 延遲探針: {PROBE_CLOCK or '關閉'}")
+    print("5. 返回主菜單")
     
     while True:
         try:
-            choice = int(input("\n請選擇要修改的設置 (1-4): "))
+            choice = int(input("\n請選擇要修改的設置 (1-5): "))
             if choice == 1:
                 MQTT_BROKER = input("輸入新的MQTT伺服器地址: ")
                 return True
@@ -199,9 +513,17 @@ def show_settings_menu():
                 TOPIC_PREFIX = input("輸入新的主題前綴: ")
                 return True
             elif choice == 4:
+                clock = input("輸入探針時鐘 (mono: 同一台機器, wall: 跨機器需要NTP, 留空關閉): ").strip()
+                if clock and clock not in ("mono", "wall"):
+                    print("請輸入 mono、wall 或留空")
+                    continue
+                PROBE_CLOCK = clock or None
+                # 探針不影響連接，無需重新連接
+                return False
+            elif choice == 5:
                 return False
             else:
-                print("請輸入1到4之間的數字")
+                print("請輸入1到5之間的數字")
         except ValueError:
             print("請輸入數字")
 
@@ -219,13 +541,13 @@ def main():
             print("文件不存在，請先運行excel_to_json.py轉換Excel文件。")
             sys.exit(1)
     
-    # 載入JSON數據
-    data = load_json_data(json_file)
-    if not data:
+    # 載入已編譯的消息目錄 (優先使用二進制緩存)
+    catalog = load_catalog(json_file)
+    if not catalog:
         sys.exit(1)
     
     # 獲取可用的消息類型
-    message_types = list(data.keys())
+    message_types = catalog.sheet_names
     
     # 連接MQTT伺服器
     client = None
@@ -255,11 +577,36 @@ def main():
                 print("無法連接到MQTT伺服器，請檢查設置")
                 continue
         
+        # 特殊選項：艦隊模擬
+        if choice == len(message_types) + 2:
+            gateway_count = int(input("請輸入Gateway數量: "))
+            tags_per_gateway = int(input("請輸入每個Gateway的Tag數量: "))
+            rate = float(input("請輸入總目標速率 (消息/秒, 0表示不限速): "))
+            duration = float(input("請輸入模擬時長 (秒, 0表示直到Ctrl+C): "))
+            shards = int(input("請輸入工作進程數 (1表示單進程): ") or 1)
+            if shards > 1:
+                run_sharded_fleet_simulation(json_file, gateway_count, tags_per_gateway, rate, shards,
+                                             duration=duration, probe=PROBE_CLOCK)
+            else:
+                run_fleet_simulation(client, catalog, gateway_count, tags_per_gateway, rate, duration=duration,
+                                     probe=make_probe())
+            continue
+        
+        # 特殊選項：重放記錄文件
+        if choice == len(message_types) + 3:
+            path = input("請輸入記錄文件路徑 (.mqcap): ")
+            if not os.path.exists(path):
+                print(f"文件不存在: {path}")
+                continue
+            speed = float(input("請輸入重放倍速 (1為原速, 0表示最快速度): ") or 1)
+            replay_capture(client, path, speed=speed)
+            continue
+        
         # 獲取選定的消息類型
         selected_type = message_types[choice - 1]
         
         # 提取該類型的消息
-        messages = extract_messages_by_type(data, selected_type)
+        messages = extract_messages_by_type(catalog, selected_type)
         
         if not messages:
             print(f"在'{selected_type}'中找不到有效的消息")
@@ -272,19 +619,16 @@ def main():
             content_preview = str(msg["json"])[:50] + "..." if len(str(msg["json"])) > 50 else str(msg["json"])
             print(f"{i}. 主題: {topic}, 內容: {content_preview}")
         
-        # 添加循環發送選項
+        # 添加循環發送和負載測試選項
         print(f"{len(messages) + 1}. 循環發送所有消息")
+        print(f"{len(messages) + 2}. 負載測試模式 (按目標速率發送)")
         
-        msg_choice = int(input(f"\n請選擇要發送的消息 (1-{len(messages) + 1}): "))
+        msg_choice = int(input(f"\n請選擇要發送的消息 (1-{len(messages) + 2}): "))
         
         if 1 <= msg_choice <= len(messages):
             # 發送單條消息
             selected_msg = messages[msg_choice - 1]
-            topic = selected_msg["topic"]
-            
-            # 如果主題包含通配符，替換為實際主題
-            if topic and "xxxx" in topic:
-                topic = topic.replace("xxxx", TOPIC_PREFIX)
+            topic = resolve_topic(selected_msg["topic"])
             
             # 更新動態字段
             json_msg = update_dynamic_fields(selected_msg["json"])
@@ -304,11 +648,7 @@ def main():
             try:
                 while loop_count == 0 or count < loop_count:
                     for msg in messages:
-                        topic = msg["topic"]
-                        
-                        # 如果主題包含通配符，替換為實際主題
-                        if topic and "xxxx" in topic:
-                            topic = topic.replace("xxxx", TOPIC_PREFIX)
+                        topic = resolve_topic(msg["topic"])
                         
                         # 更新動態字段
                         json_msg = update_dynamic_fields(msg["json"])
@@ -327,6 +667,13 @@ def main():
             except KeyboardInterrupt:
                 print("\n已停止循環發送")
         
+        elif msg_choice == len(messages) + 2:
+            # 負載測試模式
+            rate = float(input("請輸入目標速率 (消息/秒, 0表示不限速): "))
+            duration = float(input("請輸入測試時長 (秒, 0表示直到Ctrl+C): "))
+            dynamic = input("是否每條消息都更新動態字段? (y/n): ").lower() == 'y'
+            run_load_test(client, messages, rate, duration=duration, dynamic=dynamic, probe=make_probe())
+        
         else:
             print("無效的選擇")
         
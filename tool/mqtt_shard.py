@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多進程分片發送
+將模擬的用戶/Tag分配到多個工作進程，每個進程有自己的MQTT連接，
+協調進程匯總各分片的吞吐量和延遲統計
+
+工作函數必須是模組頂層函數 (spawn啟動方式下需要可以被pickle)，簽名為:
+    worker(ctx, items, options)
+其中 ctx 為 ShardContext，提供 publish()、sleep()、stopped() 等方法
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from latency_probe import ProbeStamper
+
+# 每個統計周期最多保留的延遲樣本數 (用於計算百分位數)
+MAX_LATENCY_SAMPLES = 10000
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class ShardContext:
+    """
+    工作進程中的發送上下文: 管理該分片自己的MQTT連接，並統計發送結果
+    - QoS 1/2: 確認延遲為 publish() 到收到 PUBACK/PUBCOMP 的時間 (latency_* 統計)
+    - QoS 0: 沒有確認，只單獨統計 publish() 調用的耗時 (call_* 統計)，不計入確認延遲
+    """
+
+    def __init__(self, shard_id, stats_queue, stop_event, broker, port,
+                 client_id_prefix="shard", report_interval=1.0, keepalive=60, probe=None):
+        self.shard_id = shard_id
+        self.stats_queue = stats_queue
+        self.stop_event = stop_event
+        self.broker = broker
+        self.port = port
+        self.keepalive = keepalive
+        self.report_interval = report_interval
+        # 延遲探針 (latency_probe.ProbeStamper)，設置時每條消息發送前蓋上時間戳和序號
+        self.probe = probe
+
+        self.client = mqtt.Client(client_id=f"{client_id_prefix}-shard{shard_id}-{os.getpid()}")
+        self.client.on_publish = self._on_publish
+
+        self._lock = threading.Lock()
+        self._pending = {}      # mid -> 發送時間
+        self._early_acks = {}   # 在記錄發送時間之前就收到確認的 mid -> 確認時間
+        self._qos0_mids = set() # 已發出但on_publish回調還沒到的QoS 0消息 (回調直接丟棄)
+        self._reset_window()
+        self._next_report = time.monotonic() + report_interval
+
+    def _reset_window(self):
+        self.sent = 0
+        self.failed = 0
+        self.latencies = []
+        self.call_count = 0
+        self.call_sum = 0.0
+        self.call_max = 0.0
+        self.window_start = time.monotonic()
+
+    def connect(self):
+        self.client.connect(self.broker, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _record_latency(self, seconds):
+        if len(self.latencies) < MAX_LATENCY_SAMPLES:
+            self.latencies.append(seconds)
+
+    def _on_publish(self, client, userdata, mid):
+        now = time.perf_counter()
+        # 注意: 不能在持有本鎖時調用client.publish，否則可能與網絡線程互相等待
+        with self._lock:
+            if mid in self._qos0_mids:
+                self._qos0_mids.discard(mid)
+                return
+            sent_at = self._pending.pop(mid, None)
+            if sent_at is None:
+                # 可能是QoS 0消息在publish()返回前就觸發的回調，由publish()清除
+                self._early_acks[mid] = now
+                return
+            self._record_latency(now - sent_at)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """發送消息並記錄統計，返回是否成功"""
+        if self.probe:
+            payload = self.probe.stamp(topic, payload)
+        start = time.perf_counter()
+        try:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain)
+            ok = info.rc == mqtt.MQTT_ERR_SUCCESS
+        except Exception:
+            ok = False
+
+        with self._lock:
+            if not ok:
+                self.failed += 1
+            else:
+                self.sent += 1
+                acked_at = self._early_acks.pop(info.mid, None)
+                if qos == 0:
+                    elapsed = time.perf_counter() - start
+                    self.call_count += 1
+                    self.call_sum += elapsed
+                    if elapsed > self.call_max:
+                        self.call_max = elapsed
+                    # QoS 0沒有確認: 回調已經到達時丟棄，否則記下mid以便回調到達時丟棄
+                    if acked_at is None:
+                        self._qos0_mids.add(info.mid)
+                elif acked_at is not None and acked_at >= start:
+                    self._record_latency(acked_at - start)
+                else:
+                    # 早於本次發送的確認屬於重用同一mid的舊消息，不計入延遲
+                    self._pending[info.mid] = start
+
+        if time.monotonic() >= self._next_report:
+            self.flush()
+        return ok
+
+    def flush(self, final=False):
+        """將本周期的統計發送給協調進程"""
+        now = time.monotonic()
+        with self._lock:
+            latencies = sorted(self.latencies)
+            report = {
+                "shard": self.shard_id,
+                "elapsed": now - self.window_start,
+                "sent": self.sent,
+                "failed": self.failed,
+                "pending": len(self._pending),
+                "latency_count": len(latencies),
+                "latency_sum": sum(latencies),
+                "latency_p50": _percentile(latencies, 0.50),
+                "latency_p95": _percentile(latencies, 0.95),
+                "latency_max": latencies[-1] if latencies else 0.0,
+                "call_count": self.call_count,
+                "call_sum": self.call_sum,
+                "call_max": self.call_max,
+                "final": final
+            }
+            self._reset_window()
+        self._next_report = now + self.report_interval
+        self.stats_queue.put(report)
+
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    def sleep(self, seconds):
+        """可被停止事件中斷的休眠，返回True表示應該停止"""
+        if seconds > 0 and self.stop_event.wait(seconds):
+            return True
+        if time.monotonic() >= self._next_report:
+            self.flush()
+        return self.stop_event.is_set()
+
+
+def _shard_main(worker, shard_id, items, options, stats_queue, stop_event):
+    # Ctrl+C 由協調進程處理，工作進程通過stop_event停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # options["probe"] 為探針時鐘 ("mono"/"wall")，None表示不加探針
+    probe = None
+    if options.get("probe"):
+        probe = ProbeStamper(f"{options.get('client_id_prefix', 'shard')}-shard{shard_id}-{os.getpid()}",
+                             clock=options["probe"])
+    ctx = ShardContext(
+        shard_id, stats_queue, stop_event,
+        options.get("broker", "localhost"), options.get("port", 1883),
+        options.get("client_id_prefix", "shard"), options.get("report_interval", 1.0),
+        probe=probe
+    )
+    try:
+        ctx.connect()
+    except Exception as e:
+        print(f"分片 {shard_id} 連接MQTT伺服器失敗: {e}")
+        stats_queue.put({"shard": shard_id, "error": str(e), "final": True})
+        return
+
+    try:
+        worker(ctx, items, options)
+    except Exception as e:
+        print(f"分片 {shard_id} 運行時出錯: {e}")
+    finally:
+        ctx.flush(final=True)
+        ctx.close()
+
+
+def split_items(items, shards):
+    """將列表按連續區間平均分配到各分片"""
+    items = list(items)
+    shards = max(1, min(shards, len(items))) if items else 1
+    size, extra = divmod(len(items), shards)
+    chunks = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+class ShardAggregator:
+    """協調進程中匯總各分片的統計結果"""
+
+    def __init__(self, shard_count):
+        self.shard_count = shard_count
+        self.latest = {}
+        self.total_sent = 0
+        self.total_failed = 0
+        self.max_latency = 0.0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.call_sum = 0.0
+        self.call_count = 0
+        self.max_call = 0.0
+        self.finished = set()
+        self.start = time.monotonic()
+
+    def add(self, report):
+        shard = report["shard"]
+        if report.get("final"):
+            self.finished.add(shard)
+        if "error" in report:
+            return
+        self.latest[shard] = report
+        self.total_sent += report["sent"]
+        self.total_failed += report["failed"]
+        self.latency_sum += report["latency_sum"]
+        self.latency_count += report["latency_count"]
+        self.max_latency = max(self.max_latency, report["latency_max"])
+        self.call_sum += report["call_sum"]
+        self.call_count += report["call_count"]
+        self.max_call = max(self.max_call, report["call_max"])
+
+    def all_finished(self):
+        return len(self.finished) >= self.shard_count
+
+    def print_report(self):
+        current = sum(r["sent"] / r["elapsed"] for r in self.latest.values() if r["elapsed"] > 0)
+        print(f"\n[分片統計] {len(self.latest)}/{self.shard_count} 個分片, 當前總速率 {current:.0f} msg/s, "
+              f"已發送 {self.total_sent}, 失敗 {self.total_failed}")
+        for shard in sorted(self.latest):
+            r = self.latest[shard]
+            rate = r["sent"] / r["elapsed"] if r["elapsed"] > 0 else 0.0
+            parts = [f"{rate:.0f} msg/s"]
+            if r["latency_count"]:
+                parts.append(f"確認延遲 p50 {r['latency_p50'] * 1000:.2f}ms p95 {r['latency_p95'] * 1000:.2f}ms "
+                             f"max {r['latency_max'] * 1000:.2f}ms")
+            if r["call_count"]:
+                parts.append(f"QoS 0 發送耗時 平均 {r['call_sum'] / r['call_count'] * 1000:.3f}ms "
+                             f"max {r['call_max'] * 1000:.3f}ms")
+            parts.append(f"未確認 {r['pending']}")
+            print(f"  分片{shard}: " + ", ".join(parts))
+
+    def summary(self):
+        elapsed = time.monotonic() - self.start
+        return {
+            "shards": self.shard_count,
+            "elapsed": elapsed,
+            "sent": self.total_sent,
+            "failed": self.total_failed,
+            "achieved_rate": self.total_sent / elapsed if elapsed > 0 else 0.0,
+            "latency_mean": self.latency_sum / self.latency_count if self.latency_count else 0.0,
+            "latency_max": self.max_latency,
+            "latency_count": self.latency_count,
+            "call_mean": self.call_sum / self.call_count if self.call_count else 0.0,
+            "call_max": self.max_call,
+            "call_count": self.call_count
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        print("\n===== 分片發送結果 =====")
+        print(f"分片數: {s['shards']}, 持續時間: {s['elapsed']:.2f} 秒")
+        print(f"成功發送: {s['sent']} 條, 失敗: {s['failed']} 條")
+        print(f"總速率: {s['achieved_rate']:.1f} msg/s")
+        if s["latency_count"]:
+            print(f"平均確認延遲 (QoS 1/2): {s['latency_mean'] * 1000:.2f}ms, "
+                  f"最大確認延遲: {s['latency_max'] * 1000:.2f}ms")
+        if s["call_count"]:
+            print(f"QoS 0 發送調用耗時: 平均 {s['call_mean'] * 1000:.3f}ms, 最大 {s['call_max'] * 1000:.3f}ms")
+
+
+def run_sharded(worker, items, shards, options, duration=0, report_interval=5.0):
+    """
+    將 items 分配到 shards 個工作進程運行 worker，並在當前進程匯總統計
+
+    參數:
+        worker (callable): 模組頂層的工作函數 worker(ctx, items, options)
+        items (list): 要分配的用戶/Tag/Gateway列表
+        shards (int): 工作進程數
+        options (dict): 傳給工作函數的設置，其中 broker、port、client_id_prefix、
+            report_interval 同時用於建立每個分片的MQTT連接
+        duration (float): 運行時長 (秒)，0表示直到Ctrl+C或所有分片結束
+        report_interval (float): 協調進程輸出匯總統計的間隔 (秒)
+
+    返回:
+        dict: ShardAggregator.summary() 的匯總結果
+    """
+    chunks = split_items(items, shards)
+    stats_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    aggregator = ShardAggregator(len(chunks))
+
+    processes = []
+    for shard_id, chunk in enumerate(chunks):
+        p = multiprocessing.Process(
+            target=_shard_main,
+            args=(worker, shard_id, chunk, options, stats_queue, stop_event),
+            daemon=True
+        )
+        p.start()
+        processes.append(p)
+
+    print(f"已啟動 {len(processes)} 個分片進程 (每個分片約 {len(chunks[0])} 個項目)")
+
+    deadline = time.monotonic() + duration if duration > 0 else None
+    next_report = time.monotonic() + report_interval
+    try:
+        while not aggregator.all_finished():
+            if deadline and time.monotonic() >= deadline:
+                break
+            try:
+                aggregator.add(stats_queue.get(timeout=0.2))
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes):
+                    break
+            if time.monotonic() >= next_report:
+                aggregator.print_report()
+                next_report = time.monotonic() + report_interval
+    except KeyboardInterrupt:
+        print("\n用戶中止，正在停止所有分片...")
+
+    stop_event.set()
+    # 收集各分片最後的統計
+    end_wait = time.monotonic() + 5.0
+    while not aggregator.all_finished() and time.monotonic() < end_wait:
+        try:
+            aggregator.add(stats_queue.get(timeout=0.2))
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
+                break
+    for p in processes:
+        p.join(timeout=1.0)
+
+    aggregator.print_summary()
+    return aggregator.summary()
@@ -5,6 +5,10 @@ import paho.mqtt.client as mqtt
 import json
 import time
 import sys
+import argparse
+
+from receive_queue import ReceiveQueue
+from payload_decoders import PayloadRecord, as_dict, content_of, load_registry
 
 # 設定MQTT連接參數
 MQTT_BROKER = "localhost"
@@ -14,6 +18,9 @@ MQTT_CLIENT_ID = "mqtt-simple-receiver"
 # 接收到的消息計數
 message_count = 0
 
+# 接收隊列 (--workers > 0 時使用)
+receive_queue = None
+
 # 當連接到MQTT代理成功時的回調函數
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
@@ -25,51 +32,93 @@ def on_connect(client, userdata, flags, rc):
     else:
         print(f"連接失敗，返回碼: {rc}")
 
-# 當接收到消息時的回調函數
-def on_message(client, userdata, msg):
-    global message_count
-    message_count += 1
-    
-    print(f"\n收到消息 #{message_count}:")
-    print(f"主題: {msg.topic}")
+def _location_text(data):
+    # position可能不是對象 (列表、字符串等)，這時按缺少位置顯示
+    position = data.get("position")
+    if not isinstance(position, (PayloadRecord, dict)):
+        position = {}
+    return f"位置數據: X={position.get('x')}, Y={position.get('y')}, Z={position.get('z')}"
+
+def _diaper_text(data):
+    return f"尿布數據: 溫度={data.get('temp')}°C, 濕度={data.get('humi')}%"
+
+# 按content顯示關鍵信息的分派表 (記錄由 payload_decoders 按UWB規格生成，未知content的字典同樣適用)
+DETAIL_FORMATTERS = {
+    "location": _location_text,
+    "300B": lambda data: f"健康數據: 心率={data.get('hr')}bpm, 血氧={data.get('SpO2')}%, "
+                         f"血壓={data.get('bp syst')}/{data.get('bp diast')}mmHg, 體溫={data.get('skin temp')}°C",
+    "diaper DV1": _diaper_text
+}
+
+def detail_formatter(content):
+    """按content查找關鍵信息的格式化函數，其他尿布型號按content中的 "diaper" 匹配"""
+    formatter = DETAIL_FORMATTERS.get(content)
+    if formatter is None and "diaper" in content:
+        formatter = _diaper_text
+    return formatter
+
+def format_message(topic, payload, received_at=None):
+    """把一條消息格式化為顯示文本 (不含序號)，可在工作線程中執行"""
+    lines = [f"主題: {topic}"]
     
     # 嘗試解析JSON
     try:
-        payload = msg.payload.decode("utf-8")
-        json_data = json.loads(payload)
-        print(f"JSON數據: {json.dumps(json_data, indent=2, ensure_ascii=False)}")
+        data = load_registry().decode(topic, json.loads(payload.decode("utf-8")))
+    except ValueError:
+        lines.append(f"原始数据 (非JSON): {payload}")
+    else:
+        lines.append(f"JSON數據: {json.dumps(as_dict(data), indent=2, ensure_ascii=False)}")
         
         # 提取並顯示特定數據類型的關鍵信息
-        if "content" in json_data:
-            content_type = json_data["content"]
-            
-            if content_type == "location":
-                position = json_data.get("position", {})
-                print(f"位置數據: X={position.get('x')}, Y={position.get('y')}, Z={position.get('z')}")
-            
-            elif content_type == "300B":
-                print(f"健康數據: 心率={json_data.get('hr')}bpm, 血氧={json_data.get('SpO2')}%, "
-                      f"血壓={json_data.get('bp syst')}/{json_data.get('bp diast')}mmHg, "
-                      f"體溫={json_data.get('skin temp')}°C")
-            
-            elif "diaper" in content_type:
-                print(f"尿布數據: 溫度={json_data.get('temp')}°C, 濕度={json_data.get('humi')}%")
-            
-            else:
-                print(f"消息類型: {content_type}")
-    except:
-        print(f"原始数据 (非JSON): {msg.payload}")
+        content = content_of(data)
+        if content is not None:
+            formatter = detail_formatter(content)
+            try:
+                lines.append(formatter(data) if formatter else f"消息類型: {content}")
+            except Exception:
+                # 字段格式與規格不符時不影響接收，和解析失敗一樣顯示原始負載
+                lines.append(f"原始数据 (非JSON): {payload}")
+        elif isinstance(data, dict) and "content" in data:
+            lines.append(f"消息類型: {data['content']}")
     
-    print("-" * 50)
+    lines.append("-" * 50)
+    return "\n".join(lines)
+
+def show_message(text):
+    """輸出一條已格式化的消息 (串行執行，序號和輸出順序一致)"""
+    global message_count
+    message_count += 1
+    print(f"\n收到消息 #{message_count}:\n{text}")
+
+# 當接收到消息時的回調函數 (不使用接收隊列時)
+def on_message(client, userdata, msg):
+    show_message(format_message(msg.topic, msg.payload))
 
 # 主函數
 def main():
+    global MQTT_BROKER, MQTT_PORT, receive_queue
+    
+    parser = argparse.ArgumentParser(description="MQTT簡易接收器")
+    parser.add_argument("--broker", default=MQTT_BROKER, help="MQTT伺服器地址")
+    parser.add_argument("--port", type=int, default=MQTT_PORT, help="MQTT伺服器端口")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="接收隊列的工作線程數，on_message只入隊 (0表示在網絡線程中直接處理)")
+    parser.add_argument("--queue-size", type=int, default=10000, help="接收隊列容量，滿時丟棄新消息並計數")
+    args = parser.parse_args()
+    MQTT_BROKER = args.broker
+    MQTT_PORT = args.port
+    
     # 創建客戶端實例
     client = mqtt.Client(client_id=MQTT_CLIENT_ID)
     
     # 設置回調函數
     client.on_connect = on_connect
-    client.on_message = on_message
+    if args.workers > 0:
+        receive_queue = ReceiveQueue(format_message, show_message, workers=args.workers,
+                                     maxsize=args.queue_size).start()
+        client.on_message = receive_queue.on_message
+    else:
+        client.on_message = on_message
     
     try:
         # 連接到MQTT伺服器
@@ -89,7 +138,11 @@ def main():
         finally:
             client.loop_stop()
             client.disconnect()
+            if receive_queue:
+                receive_queue.stop()
             print(f"\n總共接收到 {message_count} 條消息")
+            if receive_queue:
+                print(receive_queue.format_stats())
             print("接收器已停止")
     
     except Exception as e:
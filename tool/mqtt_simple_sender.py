@@ -7,6 +7,8 @@ import time
 import random
 from datetime import datetime
 
+from health_model import HealthModel
+
 # 設定MQTT連接參數
 MQTT_BROKER = "localhost"  # 默認是本地broker
 MQTT_PORT = 1883
@@ -16,6 +18,9 @@ TOPIC_LOCATION = "GW17F5_Loca"
 TOPIC_HEALTH = "GW17F5_Health"
 TOPIC_MESSAGE = "GW17F5_Message"
 
+# 單個300B手環的生理模型，連續發送時數值隨時間連續變化
+health_model = HealthModel(1)
+
 # 示例位置數據
 def generate_location_data():
     # 生成一個隨機的位置數據
@@ -43,30 +48,32 @@ def generate_location_data():
 
 # 示例健康數據
 def generate_health_data():
-    # 生成一個隨機的健康數據
+    # 由生理模型生成健康數據 (每次調用推進一步)
+    health_model.step()
     data = {
         "content": "300B",
         "gateway id": 137205,
         "MAC": "E0:0E:08:36:93:F8",
         "SOS": 0,
-        "hr": random.randint(65, 100),
-        "SpO2": random.randint(93, 100),
-        "bp syst": random.randint(110, 140),
-        "bp diast": random.randint(70, 90),
-        "skin temp": round(random.uniform(33.0, 35.0), 1),
-        "room temp": round(random.uniform(22.0, 26.0), 1),
-        "steps": random.randint(1000, 5000),
-        "sleep time": "22:46",
-        "wake time": "7:13",
-        "light sleep (min)": 297,
-        "deep sleep (min)": 38,
-        "move": 26,
+        # 以下字段由 health_model.apply() 填寫
+        "hr": 0,
+        "SpO2": 0,
+        "bp syst": 0,
+        "bp diast": 0,
+        "skin temp": 0.0,
+        "room temp": 0.0,
+        "steps": 0,
+        "sleep time": "",
+        "wake time": "",
+        "light sleep (min)": 0,
+        "deep sleep (min)": 0,
+        "move": 0,
         "wear": 1,
-        "battery level": random.randint(50, 100),
+        "battery level": 0,
         "serial no": random.randint(0, 65535)
     }
     
-    return data
+    return health_model.apply(data, 0)
 
 # 示例尿布數據
 def generate_diaper_data():
@@ -7,8 +7,18 @@ import time
 import random
 import math
 import threading
+import argparse
+import zlib
 from datetime import datetime, timedelta
 
+import numpy as np
+
+from mqtt_shard import run_sharded
+from latency_probe import CLOCKS, ProbeStamper
+from mqtt_async_engine import AsyncMqttEngine, DeviceModel, run_engine
+from ring_history import HistoryStore, RingHistory, format_ms, to_ms
+from running_stats import StatsRegistry
+
 # MQTT設置
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
@@ -38,8 +48,12 @@ TEMP_INTERVAL = LOCATION_INTERVAL  # 體溫數據發送間隔（秒），設置
 # 全局變量
 running = True
 client = None
-temperature_history = {}  # 用於存儲每個用戶的體溫歷史記錄
 max_history_records = 1000  # 增加記錄數以存儲三天的數據
+# 每個用戶的體溫歷史記錄: 按列存儲的環形緩衝 (ts為Unix毫秒)，時間字符串只在發送時格式化
+temperature_history = HistoryStore(max_history_records, temperature="f8", room_temp="f8")
+# 每個用戶已發送體溫的增量統計 (含 ID -> 用戶名 索引)，統計線程只讀快照
+temperature_stats = StatsRegistry(window=10)
+temperature_stats.register_users(USERS)
 
 # 時間設置
 DAYS_OF_HISTORY = 2  # 過去兩天的數據
@@ -49,6 +63,29 @@ SIMULATION_INTERVAL_SECONDS = 0.5  # 模擬器發送頻率到0.5秒一次，加
 # 日期格式
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"  # 標準年-月-日格式
 
+# 歷史數據的隨機種子: 每個 (用戶, 日期) 使用由 (種子, 用戶ID的CRC32, 日期序數) 派生的獨立隨機流，
+# 同一天的數據不受生成範圍和其他用戶影響，也不依賴 PYTHONHASHSEED
+HISTORY_SEED = 20250519
+# 默認生成的歷史數據範圍 (均衡數據: 5月18日~5月20日)
+HISTORY_START = datetime(2025, 5, 18)
+HISTORY_DAYS = 3
+
+# 各用戶的體溫模式: (基準體溫, 日周期幅度, 正常波動, 特殊模式)
+# 特殊模式為 (機率, 最低值, 範圍)，先於一般異常判斷，例如張三的發熱、王五的低溫
+TEMPERATURE_PROFILES = {
+    "E001": (37.0, 0.3, 0.2, (0.2, 37.8, 0.7)),   # 張三 - 有輕微發燒趨勢
+    "E002": (36.6, 0.2, 0.1, None),               # 李四 - 體溫較穩定
+    "E003": (36.4, 0.25, 0.2, (0.15, 35.7, 0.4))  # 王五 - 偶爾低溫
+}
+DEFAULT_TEMPERATURE_PROFILE = (36.5, 0.3, 0.2, None)  # 其他用戶 - 標準模式
+
+# 異常體溫的分布: (累計機率上限, 子區間 [(累計機率上限, 最低值, 最高值)])
+# 7% 低溫 (其中30%為34-35°C)，13% 高溫 (60%輕微、30%中度、10%高熱)，其餘為正常體溫
+ABNORMAL_TEMPERATURE_BANDS = (
+    (0.07, ((0.3, MIN_TEMP, MIN_TEMP + 1.0), (1.0, MIN_TEMP + 1.0, NORMAL_TEMP_MIN - 0.1))),
+    (0.20, ((0.6, NORMAL_TEMP_MAX + 0.1, 38.5), (0.9, 38.5, 40.0), (1.0, 40.0, MAX_TEMP)))
+)
+
 def setup_mqtt():
     """設置MQTT客戶端"""
     global client
@@ -77,16 +114,17 @@ def generate_temperature(user_id, timestamp=None):
     day_seed = timestamp.year * 10000 + timestamp.month * 100 + timestamp.day
     # 將所有值轉換為字符串再相加
     seed_str = str(day_seed) + user_id + str(hour_of_day)
-    # 使用字符串的雙埝hash生成整數種子
-    random.seed(hash(seed_str))
+    # 使用穩定的CRC32作為本次取樣的獨立隨機數生成器的種子
+    # (hash()隨PYTHONHASHSEED變化，重設全局random也會影響室溫和序列號等其他隨機值)
+    rng = random.Random(zlib.crc32(seed_str.encode("utf-8")))
     
     # 確定溫度基準值和波動範圍
     if user_id == "E001":  # 張三 - 有輕微發燒趨勢
         base_temp = 37.0 + day_cycle * 0.3
         variation = 0.2
         # 有20%機率產生發熱
-        if random.random() < 0.2:
-            return round(37.8 + random.random() * 0.7, 1)
+        if rng.random() < 0.2:
+            return round(37.8 + rng.random() * 0.7, 1)
     elif user_id == "E002":  # 李四 - 體溫較穩定
         base_temp = 36.6 + day_cycle * 0.2
         variation = 0.1
@@ -94,31 +132,108 @@ def generate_temperature(user_id, timestamp=None):
         base_temp = 36.4 + day_cycle * 0.25
         variation = 0.2
         # 有15%機率產生低溫
-        if random.random() < 0.15:
-            return round(35.7 + random.random() * 0.4, 1)
+        if rng.random() < 0.15:
+            return round(35.7 + rng.random() * 0.4, 1)
     else:  # 其他用戶 - 標準模式
         base_temp = 36.5 + day_cycle * 0.3
         variation = 0.2
         
     # 隨機決定是否產生異常溫度
-    r = random.random()
+    r = rng.random()
     if r < 0.07:  # 7% 機率產生低溫
         # 加大低溫範圍，分為兩個區域，增加多樣性
-        if random.random() < 0.3:  # 30% 機率生成非常低的溫度
-            return round(random.uniform(MIN_TEMP, MIN_TEMP + 1.0), 1)  # 34-35°C
+        if rng.random() < 0.3:  # 30% 機率生成非常低的溫度
+            return round(rng.uniform(MIN_TEMP, MIN_TEMP + 1.0), 1)  # 34-35°C
         else:
-            return round(random.uniform(MIN_TEMP + 1.0, NORMAL_TEMP_MIN - 0.1), 1)  # 35-36.2°C
+            return round(rng.uniform(MIN_TEMP + 1.0, NORMAL_TEMP_MIN - 0.1), 1)  # 35-36.2°C
     elif r < 0.20:  # 13% 機率產生高溫
         # 加大高溫範圍，分為三個區域，增加多樣性
-        sub_range = random.random()
+        sub_range = rng.random()
         if sub_range < 0.6:  # 60% 機率生成較輕微發熱
-            return round(random.uniform(NORMAL_TEMP_MAX + 0.1, 38.5), 1)  # 37.3-38.5°C
+            return round(rng.uniform(NORMAL_TEMP_MAX + 0.1, 38.5), 1)  # 37.3-38.5°C
         elif sub_range < 0.9:  # 30% 機率生成中度發熱
-            return round(random.uniform(38.5, 40.0), 1)  # 38.5-40°C
+            return round(rng.uniform(38.5, 40.0), 1)  # 38.5-40°C
         else:  # 10% 機率生成高熱
-            return round(random.uniform(40.0, MAX_TEMP), 1)  # 40-44°C
+            return round(rng.uniform(40.0, MAX_TEMP), 1)  # 40-44°C
     else:  # 80% 機率產生正常溫度
-        return round(base_temp + random.uniform(-variation, variation), 1)
+        return round(base_temp + rng.uniform(-variation, variation), 1)
+
+def _day_rng(user_id, day, seed=HISTORY_SEED):
+    """(用戶, 日期) 的獨立隨機流，與生成順序和範圍無關"""
+    return np.random.default_rng([seed, zlib.crc32(user_id.encode("utf-8")), day.toordinal()])
+
+def generate_day_temperatures(user_id, day, interval_minutes=DATA_INTERVAL_MINUTES, seed=HISTORY_SEED):
+    """
+    一次生成一個用戶一整天的體溫和室溫 (向量化，分布與 generate_temperature 相同)
+
+    參數:
+        user_id (str): 用戶ID，決定體溫模式 (見 TEMPERATURE_PROFILES)
+        day (date/datetime): 日期
+        interval_minutes (int): 取樣間隔 (分鐘)
+        seed (int): 歷史數據種子
+
+    返回:
+        tuple: (當天的分鐘數, 體溫, 室溫)，均為numpy數組，溫度保留一位小數
+    """
+    minutes = np.arange(0, 24 * 60, interval_minutes)
+    n = len(minutes)
+    rng = _day_rng(user_id, day, seed)
+    # 每個取樣點固定使用4個均勻隨機數: 特殊模式、異常判斷、子區間、取值
+    special_draw, band_draw, sub_draw, value_draw = rng.random((4, n))
+    room_temp = np.round(rng.uniform(22.0, 26.0, n), 1)
+
+    base, amplitude, variation, special = TEMPERATURE_PROFILES.get(user_id, DEFAULT_TEMPERATURE_PROFILE)
+    day_cycle = np.sin(minutes / 60.0 * np.pi / 12)  # 24小時一個週期
+    # 正常體溫: 基準值 ± 波動
+    temperature = base + day_cycle * amplitude + (value_draw * 2 - 1) * variation
+
+    # 異常體溫: 按累計機率選擇區間，在區間內均勻取值 (從後往前覆蓋，低溫優先)
+    for upper, sub_bands in reversed(ABNORMAL_TEMPERATURE_BANDS):
+        in_band = band_draw < upper
+        for sub_upper, low, high in reversed(sub_bands):
+            chosen = in_band & (sub_draw < sub_upper)
+            temperature = np.where(chosen, low + value_draw * (high - low), temperature)
+
+    if special is not None:
+        probability, low, span = special
+        temperature = np.where(special_draw < probability, low + value_draw * span, temperature)
+
+    return minutes, np.round(temperature, 1), room_temp
+
+def format_record_time(ts):
+    """歷史記錄的時間 (Unix毫秒) 格式化為消息中的時間字符串"""
+    return format_ms(ts, DATE_FORMAT)[:-4]
+
+def generate_temperature_history(users, start=HISTORY_START, days=HISTORY_DAYS,
+                                 interval_minutes=DATA_INTERVAL_MINUTES, seed=HISTORY_SEED):
+    """
+    為多個用戶生成連續多天的歷史體溫，相同參數的結果在任何運行中都相同
+
+    參數:
+        users (list): 用戶列表
+        start (datetime): 第一天 (只使用日期)
+        days (int): 天數
+        interval_minutes (int): 取樣間隔 (分鐘)
+        seed (int): 歷史數據種子
+
+    返回:
+        dict: {用戶ID: RingHistory}，容量至少為 max_history_records，足以保存全部生成的記錄
+    """
+    histories = {}
+    for user in users:
+        times, temperatures, room_temps = [], [], []
+        for offset in range(days):
+            day = start.date() + timedelta(days=offset)
+            minutes, temperature, room_temp = generate_day_temperatures(user["id"], day, interval_minutes, seed)
+            # 當天0點 (本地時間) 的Unix毫秒加上分鐘偏移
+            times.append(to_ms(datetime(day.year, day.month, day.day)) + minutes.astype(np.int64) * 60000)
+            temperatures.append(temperature)
+            room_temps.append(room_temp)
+        count = sum(len(t) for t in times)
+        histories[user["id"]] = RingHistory.from_columns(
+            np.concatenate(times), capacity=max(count, max_history_records),
+            temperature=np.concatenate(temperatures), room_temp=np.concatenate(room_temps))
+    return histories
 
 # 模擬器的當前時間計數，從5月19日開始到現在
 SIMULATION_START_TIME = datetime(2025, 5, 19, 0, 0, 0)  # 以5月19日開始
@@ -136,6 +251,30 @@ def check_and_reset_time():
         next_day = simulation_current_time + timedelta(days=1)
         simulation_current_time = datetime(next_day.year, next_day.month, next_day.day, 0, 0, 0)
 
+def is_abnormal_temperature(skin_temp):
+    """體溫是否異常 (低於36.0°C或高於37.5°C)"""
+    return skin_temp > 37.5 or skin_temp < 36.0
+
+def build_temperature_message(user, skin_temp, record_time, room_temp=None):
+    """建立體溫MQTT消息"""
+    if room_temp is None:
+        room_temp = round(random.uniform(22.0, 26.0), 1)  # 隨機室溫
+    return {
+        "content": "temperature",  # 區分這是體溫數據
+        "gateway id": user["gateway_id"],
+        "node": "TAG",
+        "id": user["id"],
+        "name": user["name"],
+        "temperature": {
+            "value": skin_temp,
+            "unit": "celsius",
+            "is_abnormal": is_abnormal_temperature(skin_temp),
+            "room_temp": room_temp
+        },
+        "time": record_time,
+        "serial no": random.randint(0, 65535)
+    }
+
 def send_temperature_data(user, timestamp=None, send_mqtt=True):
     """為單個用戶發送特定時間點的體溫數據"""
     global simulation_current_time
@@ -159,42 +298,16 @@ def send_temperature_data(user, timestamp=None, send_mqtt=True):
     skin_temp = generate_temperature(user_id, timestamp)
     room_temp = round(random.uniform(22.0, 26.0), 1)  # 室溫
     
-    # 保存到歷史記錄
-    if user_id not in temperature_history:
-        temperature_history[user_id] = []
-    
-    # 添加新記錄
-    new_record = {
-        "temperature": skin_temp,
-        "timestamp": current_time,  # 字符串格式的時間戳
-        "datetime": timestamp  # 原始的datetime對象
-    }
-    temperature_history[user_id].append(new_record)
-    
-    # 限制歷史記錄數量
-    if len(temperature_history[user_id]) > max_history_records:
-        temperature_history[user_id].pop(0)  # 移除最舊的記錄
+    # 保存到歷史記錄 (環形緩衝滿時自動覆蓋最舊的記錄)
+    temperature_history.append(user_id, to_ms(timestamp), temperature=skin_temp, room_temp=room_temp)
     
     # 創建MQTT消息 - 只有當需要時才發送
     if send_mqtt:
-        data = {
-            "content": "temperature",  # 區分這是體溫數據
-            "gateway id": gateway_id,
-            "node": "TAG",
-            "id": user_id,
-            "name": user_name,
-            "temperature": {
-                "value": skin_temp,
-                "unit": "celsius",
-                "is_abnormal": skin_temp > 37.5 or skin_temp < 36.0,
-                "room_temp": room_temp
-            },
-            "time": current_time,
-            "serial no": random.randint(0, 65535)
-        }
+        data = build_temperature_message(user, skin_temp, current_time, room_temp)
         
         message = json.dumps(data)
         client.publish(TOPIC_HEALTH, message, qos=1, retain=True)
+        temperature_stats.add(user_id, skin_temp, is_abnormal_temperature(skin_temp))
         
         print(f"用戶: {user_name} (ID: {user_id})")
         print(f"體溫: {skin_temp}°C, 室溫: {room_temp}°C")
@@ -212,74 +325,42 @@ def send_temperature_data(user, timestamp=None, send_mqtt=True):
 
 def generate_historical_data():
     """生成從5月19日到5月21日的歷史數據，每5分鐘一筆"""
-    print("\n正在生成從2025-05-19到2025-05-21的歷史溫度數據...")
-    
-    # 計算開始和結束時間
-    # 使用5月19日到5月21日的完整時間範圍
-    current_date = datetime.now()
-    end_time = datetime(2025, 5, 21, 23, 59, 59)  # 固定結束日期為5月21日
-    start_time = datetime(2025, 5, 19, 0, 0, 0)  # 固定開始日期為5月19日
-    
-    # 計算需要生成的時間點總數
+    start_time = datetime(2025, 5, 19)  # 固定開始日期為5月19日
+    days = 3                            # 到5月21日
     data_points_per_day = 24 * 60 // DATA_INTERVAL_MINUTES  # 每天的數據點數
-    days_diff = (end_time - start_time).days + 1  # 計算實際天數
-    total_points = data_points_per_day * days_diff
-    
-    print(f"將為每個用戶生成約{total_points}筆歷史數據（從{start_time.strftime('%Y-%m-%d')}到{end_time.strftime('%Y-%m-%d')}，每{DATA_INTERVAL_MINUTES}分鐘一筆）")
-    
-    # 生成每個時間點的數據
-    current_time = start_time
-    while current_time <= end_time:
-        for user in USERS:
-            # 生成數據但不發送MQTT消息
-            send_temperature_data(user, current_time, send_mqtt=False)
-        
-        # 向前推進10分鐘
-        current_time += timedelta(minutes=DATA_INTERVAL_MINUTES)
+    print(f"\n正在生成從{start_time.strftime('%Y-%m-%d')}開始{days}天的歷史溫度數據...")
+    print(f"將為每個用戶生成{data_points_per_day * days}筆歷史數據（每{DATA_INTERVAL_MINUTES}分鐘一筆）")
     
+    for user_id, history in generate_temperature_history(USERS, start_time, days).items():
+        temperature_history[user_id] = history
     print(f"歷史數據生成完成。總共為每個用戶生成了{len(temperature_history[USERS[0]['id']])}筆數據")
 
-def generate_balanced_data():
-    """為三天生成均衡的數據，確保以下日期都有數據：前天(5月18日)、昨天(5月19日)、今天(5月20日)"""
-    print("\n正在為三天生成均衡分布的溫度數據...")
-    
-    # 三天的時間點
-    days = [
-        datetime(2025, 5, 18, 0, 0, 0),  # 前天
-        datetime(2025, 5, 19, 0, 0, 0),  # 昨天
-        datetime(2025, 5, 20, 0, 0, 0)   # 今天
-    ]
+def generate_balanced_data(users=None, start=HISTORY_START, days=HISTORY_DAYS, seed=HISTORY_SEED):
+    """
+    為連續多天生成均衡的數據 (默認: 前天5月18日、昨天5月19日、今天5月20日)
+    每個用戶每天的數據一次向量化生成，相同的種子在任何運行中都得到相同的歷史
+    """
+    if users is None:
+        users = USERS
+    print(f"\n正在為{days}天生成均衡分布的溫度數據...")
     
-    # 為每一天生成多個時間點
     time_points_per_day = 24 * 60 // DATA_INTERVAL_MINUTES  # 每天的數據點數
+    print(f"將為每個用戶生成{time_points_per_day * days}筆數據（每天{time_points_per_day}筆）")
     
-    # 清空歷史數據
-    for user in USERS:
-        temperature_history[user["id"]] = []
+    # 替換這些用戶的歷史數據
+    for user_id, history in generate_temperature_history(users, start, days, seed=seed).items():
+        temperature_history[user_id] = history
     
-    print(f"將為每個用戶生成約{time_points_per_day * 3}筆數據（每天約{time_points_per_day}筆）")
-    
-    # 為每一天生成數據
-    for day in days:
-        # 為一整天生成數據
-        for hour in range(24):
-            for minute in range(0, 60, DATA_INTERVAL_MINUTES):
-                current_time = day.replace(hour=hour, minute=minute)
-                
-                # 為每個用戶生成這個時間點的數據
-                for user in USERS:
-                    send_temperature_data(user, current_time, send_mqtt=False)
-    
-    total_data_points = sum(len(history) for history in temperature_history.values())
-    print(f"數據生成完成，總共生成了{total_data_points}筆數據 ({total_data_points//len(USERS)} 筆/用戶)")
+    total_data_points = sum(len(temperature_history[user["id"]]) for user in users)
+    print(f"數據生成完成，總共生成了{total_data_points}筆數據 ({total_data_points//len(users)} 筆/用戶)")
 
-def temperature_simulation_loop():
+def temperature_simulation_loop(history_start=HISTORY_START, history_days=HISTORY_DAYS, seed=HISTORY_SEED):
     """定期從歷史數據中發送體溫數據的主循環"""
     global running
     iteration = 1
     
     # 改用均衡的數據生成方式
-    generate_balanced_data()
+    generate_balanced_data(USERS, history_start, history_days, seed)
     
     # 為每個用戶建立一個指向其歷史數據的索引
     user_indices = {user["id"]: 0 for user in USERS}
@@ -293,7 +374,6 @@ def temperature_simulation_loop():
             for user in USERS:
                 user_id = user["id"]
                 user_name = user["name"]
-                gateway_id = user["gateway_id"]
                 
                 # 獲取用戶的歷史數據
                 if user_id in temperature_history and len(temperature_history[user_id]) > 0:
@@ -307,28 +387,15 @@ def temperature_simulation_loop():
                     # 獲取歷史記錄
                     record = temperature_history[user_id][index]
                     skin_temp = record["temperature"]
-                    record_time = record["timestamp"]
+                    record_time = format_record_time(record["ts"])
                     
                     # 生成MQTT消息
-                    room_temp = round(random.uniform(22.0, 26.0), 1)  # 隨機室溫
-                    data = {
-                        "content": "temperature",
-                        "gateway id": gateway_id,
-                        "node": "TAG",
-                        "id": user_id,
-                        "name": user_name,
-                        "temperature": {
-                            "value": skin_temp,
-                            "unit": "celsius",
-                            "is_abnormal": skin_temp > 37.5 or skin_temp < 36.0,
-                            "room_temp": room_temp
-                        },
-                        "time": record_time,
-                        "serial no": random.randint(0, 65535)
-                    }
+                    data = build_temperature_message(user, skin_temp, record_time, record["room_temp"])
+                    room_temp = data["temperature"]["room_temp"]
                     
                     message = json.dumps(data)
                     client.publish(TOPIC_HEALTH, message, qos=1, retain=True)
+                    temperature_stats.add(user_id, skin_temp, is_abnormal_temperature(skin_temp))
                     
                     print(f"用戶: {user_name} (ID: {user_id})")
                     print(f"體溫: {skin_temp}°C, 室溫: {room_temp}°C")
@@ -355,6 +422,93 @@ def temperature_simulation_loop():
         client.disconnect()
         print("體溫模擬結束。")
 
+def make_users(count):
+    """返回count個用戶: 前幾個為USERS中的固定用戶，其餘自動生成 (用於大規模模擬)"""
+    users = [dict(u) for u in USERS[:count]]
+    for n in range(len(users) + 1, count + 1):
+        users.append({"id": f"E{n:03d}", "name": f"模擬用戶{n}", "gateway_id": 137205})
+    return users
+
+def temperature_shard_worker(ctx, users, options):
+    """分片工作進程: 為本分片的用戶生成歷史數據，之後每輪為每個用戶發送一筆，用戶之間不停頓"""
+    # 每個 (用戶, 日期) 的隨機流獨立，分片方式不影響生成的歷史
+    generate_balanced_data(users, options.get("history_start", HISTORY_START),
+                           options.get("history_days", HISTORY_DAYS), options.get("seed", HISTORY_SEED))
+    user_indices = {user["id"]: 0 for user in users}
+    interval = options.get("interval", SIMULATION_INTERVAL_SECONDS)
+    next_tick = time.monotonic()
+    
+    while not ctx.stopped():
+        for user in users:
+            history = temperature_history.get(user["id"])
+            if not history:
+                continue
+            index = user_indices[user["id"]]
+            if index >= len(history):
+                index = 0
+            record = history[index]
+            user_indices[user["id"]] = index + 1
+            data = build_temperature_message(user, record["temperature"], format_record_time(record["ts"]),
+                                             record["room_temp"])
+            ctx.publish(TOPIC_HEALTH, json.dumps(data), qos=1, retain=True)
+        next_tick += interval
+        if ctx.sleep(next_tick - time.monotonic()):
+            break
+
+class TemperatureDevice(DeviceModel):
+    """asyncio引擎中的一個體溫Tag: 依次重放該用戶生成的歷史數據"""
+    qos = 1
+    retain = True
+    
+    def __init__(self, user, interval=SIMULATION_INTERVAL_SECONDS):
+        self.user = user
+        self.name = user["name"]
+        self.interval = interval
+        self.index = 0
+    
+    def tick(self):
+        history = temperature_history.get(self.user["id"])
+        if not history:
+            return []
+        if self.index >= len(history):
+            self.index = 0
+        record = history[self.index]
+        self.index += 1
+        return [(TOPIC_HEALTH, build_temperature_message(self.user, record["temperature"],
+                                                         format_record_time(record["ts"]), record["room_temp"]))]
+
+def run_async_simulation(users, interval=SIMULATION_INTERVAL_SECONDS, duration=0, probe=None,
+                         history_start=HISTORY_START, history_days=HISTORY_DAYS, seed=HISTORY_SEED):
+    """以asyncio引擎運行: 所有用戶共用一個連接，各自按間隔發送，周期不隨用戶數增長 (probe為探針時鐘或None)"""
+    generate_balanced_data(users, history_start, history_days, seed)
+    engine = AsyncMqttEngine(MQTT_BROKER, MQTT_PORT, MQTT_CLIENT_ID, label="體溫模擬",
+                             probe=ProbeStamper(MQTT_CLIENT_ID, probe) if probe else None)
+    engine.add_devices(TemperatureDevice(user, interval) for user in users)
+    return run_engine(engine, duration)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MQTT體溫模擬器")
+    parser.add_argument("-b", "--broker", default=MQTT_BROKER, help="MQTT伺服器地址")
+    parser.add_argument("-p", "--port", type=int, default=MQTT_PORT, help="MQTT伺服器端口")
+    parser.add_argument("--users", type=int, default=len(USERS), help="模擬的用戶數量")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="分片工作進程數，每個進程有自己的MQTT連接 (0表示單進程模式)")
+    parser.add_argument("--engine", choices=("loop", "async"), default="loop",
+                        help="單進程模式的發送方式: loop為原來的逐個用戶循環，async為共用的asyncio引擎")
+    parser.add_argument("--interval", type=float, default=SIMULATION_INTERVAL_SECONDS,
+                        help="分片/async模式下每個用戶的發送間隔 (秒)")
+    parser.add_argument("--probe", nargs="?", const="mono", choices=CLOCKS, default=None,
+                        help="分片/async模式下在每條消息中加入延遲探針 (發送時間和序號)，"
+                             "可指定時鐘: mono (同一台機器, 默認) 或 wall (跨機器, 需要NTP)")
+    parser.add_argument("--history-start", type=lambda text: datetime.strptime(text, "%Y-%m-%d"),
+                        default=HISTORY_START, help="歷史數據的第一天 (YYYY-mm-dd，默認: 2025-05-18)")
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS, help="生成的歷史數據天數 (默認: 3)")
+    parser.add_argument("--seed", type=int, default=HISTORY_SEED,
+                        help="歷史數據的隨機種子，相同的種子、用戶和日期總是生成相同的數據")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="分片/async模式的運行時長 (秒, 0表示直到Ctrl+C)")
+    return parser.parse_args()
+
 def print_statistics():
     """每分鐘打印一次統計信息"""
     global running
@@ -364,38 +518,58 @@ def print_statistics():
             if not running:
                 break
                 
-            print("\n======== 體溫歷史統計 ========")
-            for user_id, history in temperature_history.items():
-                if history:
-                    # 篩選出異常溫度
-                    abnormal_temps = [h["temperature"] for h in history 
-                                     if h["temperature"] > 37.5 or h["temperature"] < 36.0]
-                    
-                    user_name = next((u["name"] for u in USERS if u["id"] == user_id), "未知")
-                    avg_temp = sum(h["temperature"] for h in history) / len(history)
-                    
-                    print(f"用戶: {user_name} (ID: {user_id})")
-                    print(f"  歷史記錄數: {len(history)} 筆")
-                    print(f"  平均體溫: {avg_temp:.1f}°C")
-                    print(f"  異常體溫次數: {len(abnormal_temps)} 次")
-                    if abnormal_temps:
-                        print(f"  異常值: {', '.join(f'{t:.1f}°C' for t in abnormal_temps[:5])}{'...' if len(abnormal_temps) > 5 else ''}")
-                    print("----------------------------")
+            print("\n======== 體溫統計 (已發送數據) ========")
+            # 只讀取增量統計的快照，不掃描歷史記錄
+            for user_id, user_name, stats in temperature_stats.snapshot():
+                recent_abnormal = stats["recent_abnormal"]
+                print(f"用戶: {user_name} (ID: {user_id})")
+                print(f"  已發送: {stats['count']} 筆")
+                print(f"  平均體溫: {stats['mean']:.1f}°C (最近{temperature_stats.window}筆: {stats['window_mean']:.1f}°C)")
+                print(f"  最低/最高: {stats['min']:.1f}°C / {stats['max']:.1f}°C")
+                print(f"  異常體溫次數: {stats['abnormal']} 次")
+                if recent_abnormal:
+                    print(f"  最近異常值: {', '.join(f'{t:.1f}°C' for t in recent_abnormal)}")
+                print("----------------------------")
     except Exception as e:
         print(f"統計信息線程發生錯誤: {e}")
 
 if __name__ == "__main__":
-    print(f"開始體溫模擬器 - 從{SIMULATION_START_TIME.strftime('%Y-%m-%d')}開始，生成過去三天的數據（每10分鐘一筆），每秒發送一次")
-    print("按Ctrl+C停止")
-    print("---------------------------------")
+    args = parse_args()
+    MQTT_BROKER = args.broker
+    MQTT_PORT = args.port
     
-    # 設置MQTT
-    setup_mqtt()
-    
-    # 啟動統計信息線程
-    stats_thread = threading.Thread(target=print_statistics)
-    stats_thread.daemon = True
-    stats_thread.start()
-    
-    # 開始模擬
-    temperature_simulation_loop()
+    if args.shards > 0:
+        print(f"開始體溫模擬器 - {args.users}個用戶, {args.shards}個分片進程")
+        options = {
+            "broker": args.broker,
+            "port": args.port,
+            "client_id_prefix": MQTT_CLIENT_ID,
+            "interval": args.interval,
+            "probe": args.probe,
+            "history_start": args.history_start,
+            "history_days": args.history_days,
+            "seed": args.seed
+        }
+        run_sharded(temperature_shard_worker, make_users(args.users), args.shards, options,
+                    duration=args.duration)
+    elif args.engine == "async":
+        print(f"開始體溫模擬器 - {args.users}個用戶, asyncio引擎")
+        run_async_simulation(make_users(args.users), args.interval, args.duration, args.probe,
+                             args.history_start, args.history_days, args.seed)
+    else:
+        USERS = make_users(args.users)
+        temperature_stats.register_users(USERS)
+        print(f"開始體溫模擬器 - 從{SIMULATION_START_TIME.strftime('%Y-%m-%d')}開始，生成過去三天的數據（每10分鐘一筆），每秒發送一次")
+        print("按Ctrl+C停止")
+        print("---------------------------------")
+        
+        # 設置MQTT
+        setup_mqtt()
+        
+        # 啟動統計信息線程
+        stats_thread = threading.Thread(target=print_statistics)
+        stats_thread.daemon = True
+        stats_thread.start()
+        
+        # 開始模擬
+        temperature_simulation_loop(args.history_start, args.history_days, args.seed)
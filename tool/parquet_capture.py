@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+把接收到的MQTT數據按 content 類型寫入列式Parquet文件 (需要pyarrow)
+每種類型一個目錄，每小時一個文件:
+
+    <目錄>/location/20250301_08.parquet
+    <目錄>/300B/20250301_08.parquet
+    ...
+
+行先按列緩衝，達到 batch_rows 行或超過 flush_interval 秒時轉換為Arrow記錄批寫入
+(每批是一個row group，按設備ID和時間排序，min/max統計可用於按Tag和時間過濾)
+
+查詢:
+    python parquet_capture.py capture/ --content location --device E001 --start "2025-03-01 08:00"
+"""
+
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from telemetry_store import parse_time
+
+# 默認批量行數和最長緩衝時間 (秒)
+DEFAULT_BATCH_ROWS = 50000
+DEFAULT_FLUSH_INTERVAL = 10.0
+COMPRESSION = "zstd"
+
+
+def _to_int(value):
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str(value):
+    return None if value is None else str(value)
+
+
+def _to_bool(value):
+    return None if value is None else bool(value)
+
+
+# Arrow類型 -> Python值轉換 (格式不符的值寫為null，不中斷寫入)
+_CONVERTERS = {
+    pa.int32(): _to_int,
+    pa.int64(): _to_int,
+    pa.float64(): _to_float,
+    pa.string(): _to_str,
+    pa.bool_(): _to_bool
+}
+
+# 每種content的列: (列名, 鍵 或 (鍵, 子鍵), Arrow類型)
+# 每個表還有 ts (接收時間) 和 topic 兩列；第一個設備列用於排序
+CAPTURE_SCHEMAS = {
+    "location": ("tag", [
+        ("gateway_id", "gateway id", pa.int64()),
+        ("tag", "id", pa.string()),
+        ("node", "node", pa.string()),
+        ("x", ("position", "x"), pa.float64()),
+        ("y", ("position", "y"), pa.float64()),
+        ("z", ("position", "z"), pa.float64()),
+        ("quality", ("position", "quality"), pa.int32()),
+        ("serial_no", "serial no", pa.int32())
+    ]),
+    "300B": ("mac", [
+        ("gateway_id", "gateway id", pa.int64()),
+        ("mac", "MAC", pa.string()),
+        ("sos", "SOS", pa.int32()),
+        ("hr", "hr", pa.int32()),
+        ("spo2", "SpO2", pa.int32()),
+        ("bp_syst", "bp syst", pa.int32()),
+        ("bp_diast", "bp diast", pa.int32()),
+        ("skin_temp", "skin temp", pa.float64()),
+        ("room_temp", "room temp", pa.float64()),
+        ("steps", "steps", pa.int64()),
+        ("sleep_time", "sleep time", pa.string()),
+        ("wake_time", "wake time", pa.string()),
+        ("light_sleep_min", "light sleep (min)", pa.int32()),
+        ("deep_sleep_min", "deep sleep (min)", pa.int32()),
+        ("move", "move", pa.int32()),
+        ("wear", "wear", pa.int32()),
+        ("battery_level", "battery level", pa.int32()),
+        ("serial_no", "serial no", pa.int32())
+    ]),
+    "diaper DV1": ("mac", [
+        ("gateway_id", "gateway id", pa.int64()),
+        ("mac", "MAC", pa.string()),
+        ("name", "name", pa.string()),
+        ("fw_ver", "fw ver", pa.string()),
+        ("temp", "temp", pa.float64()),
+        ("humi", "humi", pa.float64()),
+        ("button", "button", pa.int32()),
+        ("mssg_idx", "mssg idx", pa.int32()),
+        ("ack", "ack", pa.int32()),
+        ("battery_level", "battery level", pa.int32()),
+        ("serial_no", "serial no", pa.int32())
+    ]),
+    "temperature": ("tag", [
+        ("gateway_id", "gateway id", pa.int64()),
+        ("tag", "id", pa.string()),
+        ("name", "name", pa.string()),
+        ("skin_temp", ("temperature", "value"), pa.float64()),
+        ("room_temp", ("temperature", "room_temp"), pa.float64()),
+        ("is_abnormal", ("temperature", "is_abnormal"), pa.bool_()),
+        ("time", "time", pa.string()),
+        ("serial_no", "serial no", pa.int32())
+    ]),
+    "heartbeat": ("name", [
+        ("gateway_id", "gateway id", pa.int64()),
+        ("node", "node", pa.string()),
+        ("name", "name", pa.string()),
+        ("id", "id", pa.string()),
+        ("fw_ver", "fw ver", pa.string()),
+        ("fw_serial", "fw serial", pa.int64()),
+        ("uwb_hw_com_ok", "UWB HW Com OK", pa.string()),
+        ("uwb_joined", "UWB Joined", pa.string()),
+        ("uwb_network_id", "UWB Network ID", pa.int64()),
+        ("connected_ap", "connected AP", pa.string()),
+        ("anchor_cfg_stack", "anchor cfg stack", pa.int64())
+    ])
+}
+
+
+def _getter(path):
+    """返回從消息 (字典或payload_decoders的記錄) 中取值的函數"""
+    if isinstance(path, tuple):
+        key, sub_key = path
+
+        def get_nested(message):
+            parent = message.get(key)
+            return parent.get(sub_key) if parent is not None and hasattr(parent, "get") else None
+        return get_nested
+    return lambda message: message.get(path)
+
+
+def content_directory(content):
+    """content對應的目錄名 (空格替換為下劃線)"""
+    return content.replace(" ", "_")
+
+
+class _TableBuffer:
+    """一種content的列緩衝和當前小時的Parquet寫入器"""
+
+    def __init__(self, directory, content, sort_column, columns):
+        self.directory = os.path.join(directory, content_directory(content))
+        self.sort_column = sort_column
+        self.names = ["ts", "topic"] + [name for name, _, _ in columns]
+        self.schema = pa.schema([("ts", pa.timestamp("ms")), ("topic", pa.string())] +
+                                [(name, arrow_type) for name, _, arrow_type in columns])
+        self.extractors = [(_getter(path), _CONVERTERS[arrow_type]) for _, path, arrow_type in columns]
+        self.columns = [[] for _ in self.names]
+        self.hour = None
+        self.writer = None
+        self.files = []
+        self.rows = 0
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def append(self, message, received_at, topic):
+        columns = self.columns
+        columns[0].append(int(received_at * 1000))
+        columns[1].append(topic)
+        for column, (get, convert) in zip(columns[2:], self.extractors):
+            column.append(convert(get(message)))
+
+    def _open_writer(self, hour):
+        os.makedirs(self.directory, exist_ok=True)
+        stem = datetime.fromtimestamp(hour * 3600).strftime("%Y%m%d_%H")
+        path = os.path.join(self.directory, f"{stem}.parquet")
+        # 同一小時內重新啟動時不覆蓋已有文件
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{stem}_{suffix}.parquet")
+            suffix += 1
+        self.writer = pq.ParquetWriter(path, self.schema, compression=COMPRESSION)
+        self.files.append(path)
+        self.hour = hour
+
+    def flush(self):
+        """把緩衝的行作為一個記錄批寫入"""
+        if not len(self):
+            return
+        arrays = [pa.array(values, type=field.type) for values, field in zip(self.columns, self.schema)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        # 按設備和時間排序，每個row group內同一設備的行相鄰，統計信息更有選擇性
+        batch = batch.take(pc.sort_indices(batch, sort_keys=[(self.sort_column, "ascending"),
+                                                               ("ts", "ascending")]))
+        if self.writer is None:
+            self._open_writer(self.hour)
+        self.writer.write_batch(batch)
+        self.rows += len(batch)
+        self.columns = [[] for _ in self.names]
+
+    def roll(self, hour):
+        """進入新的小時: 寫入舊緩衝並關閉舊文件，下一批寫入新文件"""
+        self.flush()
+        self.close()
+        self.hour = hour
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class ParquetCapture:
+    """
+    按content類型的列式數據捕獲
+
+    參數:
+        directory (str): 輸出目錄
+        batch_rows (int): 每種類型緩衝的行數達到此值時寫入
+        flush_interval (float): 緩衝超過此時間 (秒) 時寫入，由 add 或 maybe_flush 觸發
+    """
+
+    def __init__(self, directory, batch_rows=DEFAULT_BATCH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.directory = directory
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        # add 在接收工作線程中調用，maybe_flush/close 在主線程中調用
+        self.lock = threading.Lock()
+        self.tables = {content: _TableBuffer(directory, content, sort_column, columns)
+                       for content, (sort_column, columns) in CAPTURE_SCHEMAS.items()}
+        self.last_flush = time.monotonic()
+        self.messages = 0
+
+    def add(self, message, received_at=None, topic=None):
+        """
+        緩衝一條消息，返回是否捕獲 (不支持的content返回False)
+        """
+        if message is None or not hasattr(message, "get"):
+            return False
+        content = message.get("content")
+        table = self.tables.get(content) if isinstance(content, str) else None
+        if table is None:
+            return False
+        ts = time.time() if received_at is None else received_at
+        hour = int(ts // 3600)
+        with self.lock:
+            if hour != table.hour:
+                table.roll(hour)
+            table.append(message, ts, topic)
+            self.messages += 1
+            if len(table) >= self.batch_rows:
+                table.flush()
+        return True
+
+    def flush(self):
+        with self.lock:
+            for table in self.tables.values():
+                table.flush()
+            self.last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """緩衝時間超過 flush_interval 時寫入 (由主循環定期調用)"""
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def close(self):
+        with self.lock:
+            for table in self.tables.values():
+                table.flush()
+                table.close()
+
+    def summary(self):
+        """返回 {content: (已寫入行數, 文件數)}，只包含有數據的類型"""
+        return {content: (table.rows + len(table), len(table.files))
+                for content, table in self.tables.items() if table.rows or len(table)}
+
+
+def scan(directory, content, device=None, start=None, end=None, columns=None):
+    """
+    讀取一種content的捕獲數據，設備和時間條件下推到Parquet掃描 (按row group統計跳過不相關的數據)
+
+    返回:
+        pyarrow.Table
+    """
+    sort_column = CAPTURE_SCHEMAS[content][0]
+    dataset = ds.dataset(os.path.join(directory, content_directory(content)), format="parquet")
+    condition = None
+
+    def combine(expression):
+        return expression if condition is None else condition & expression
+
+    if device is not None:
+        condition = combine(ds.field(sort_column) == str(device))
+    if start is not None:
+        condition = combine(ds.field("ts") >= pa.scalar(int(start * 1000), pa.timestamp("ms")))
+    if end is not None:
+        condition = combine(ds.field("ts") < pa.scalar(int(end * 1000), pa.timestamp("ms")))
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢 mqtt_receiver_python.py --capture-dir 捕獲的Parquet數據")
+    parser.add_argument("directory", help="捕獲目錄")
+    parser.add_argument("--content", default="location", choices=list(CAPTURE_SCHEMAS), help="消息類型")
+    parser.add_argument("-d", "--device", help="設備ID (location/temperature為Tag ID，300B/尿布為MAC)")
+    parser.add_argument("--start", help="開始時間 (Unix時間戳或 YYYY-mm-dd HH:MM[:SS])")
+    parser.add_argument("--end", help="結束時間 (不含)")
+    parser.add_argument("--limit", type=int, default=20, help="最多顯示的行數")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    table = scan(args.directory, args.content, args.device, parse_time(args.start), parse_time(args.end))
+    elapsed = time.perf_counter() - started
+    print(f"{args.content}: {table.num_rows} 行 ({elapsed:.3f} 秒)")
+    if table.num_rows:
+        print(table.slice(0, args.limit).to_pandas().to_string())
+
+
+if __name__ == "__main__":
+    main()
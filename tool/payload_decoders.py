@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UWB消息的類型化解碼
+由UWB規格目錄 (uwb_catalog) 中每種 content 的示例消息生成對應的記錄類型:
+每個字段是一個 __slots__ 屬性，字段名由規格中的鍵轉換而來
+("bp syst" -> bp_syst, "skin temp" -> skin_temp, "gateway id" -> gateway_id)
+
+    registry = load_registry()
+    record = registry.decode("GW17F5_Health", json.loads(payload))
+    record.hr, record.bp_syst, record.to_dict()
+
+按 (主題模板, content) 查找解碼器是一次字典查找；記錄不保存每條消息的鍵，
+比通用字典小很多，適合在接收器中保存大量歷史消息。
+規格中沒有的鍵保存在 extra 字典中 (沒有時為None)，消息中缺少的規格鍵記在 absent 中
+(全部都有時為None)，to_dict() 可還原原始消息 (包括值為null的鍵)
+"""
+
+import json
+import os
+import re
+
+from uwb_catalog import load_catalog
+
+# 默認規格文件 (與本腳本同目錄)
+DEFAULT_SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "UWB_JSON_20250225.json")
+
+# Gateway主題: GW + Gateway編號 + _ + 類型，可能帶有前綴 (例如 UWB/GW16B8_Loca)
+_GATEWAY_TOPIC = re.compile(r"^(?:.*/)?GW[0-9A-Za-z]+_(\w+)$")
+
+# 已生成的記錄類型: (類名, 鍵) -> 類，同一結構只生成一次 (進程間傳遞時按此重建)
+_RECORD_CLASSES = {}
+
+
+def field_name(key):
+    """把規格中的鍵轉換為Python屬性名，例如 "bp syst" -> "bp_syst", "5V plugged" -> "f_5v_plugged" """
+    name = re.sub(r"[^0-9A-Za-z]+", "_", key).strip("_").lower()
+    if not name or name[0].isdigit():
+        name = "f_" + name
+    return name
+
+
+def class_name(content):
+    """由content生成記錄類名，例如 "diaper DV1" -> "DiaperDv1", "300B" -> "Msg300B" """
+    name = "".join(part[:1].upper() + part[1:].lower() if not part[:1].isdigit() else part
+                   for part in re.split(r"[^0-9A-Za-z]+", content) if part)
+    if not name or name[0].isdigit():
+        name = "Msg" + name
+    return name
+
+
+def topic_template(topic):
+    """把實際主題轉換為規格中的模板，例如 GW17F5_Loca -> GWxxxx_Loca，其他主題保持不變"""
+    match = _GATEWAY_TOPIC.match(topic)
+    if match:
+        return f"GWxxxx_{match.group(1)}"
+    return topic
+
+
+class PayloadRecord:
+    """
+    類型化消息記錄的基類
+    子類由 record_class 生成，類屬性 keys 為原始鍵，fields 為對應的屬性名
+    """
+    __slots__ = ("extra", "absent")
+    content = None
+    keys = ()
+    fields = ()
+
+    def get(self, key, default=None):
+        """按原始鍵取值 (與字典的get相同)，鍵不存在或值為None時返回default"""
+        try:
+            value = getattr(self, self._field_by_key[key])
+        except KeyError:
+            if key == "content":
+                value = self.content
+            else:
+                value = self.extra.get(key) if self.extra else None
+        return default if value is None else value
+
+    def to_dict(self):
+        """還原為消息字典 (只包含原始消息中有的鍵，值為null的鍵同樣保留)"""
+        data = {} if self.content is None else {"content": self.content}
+        absent = self.absent
+        for key, field in zip(self.keys, self.fields):
+            if absent is not None and key in absent:
+                continue
+            value = getattr(self, field)
+            data[key] = value.to_dict() if isinstance(value, PayloadRecord) else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.fields
+                           if getattr(self, field) is not None)
+        return f"{type(self).__name__}({values})"
+
+    def __reduce__(self):
+        # 動態生成的類不能按名稱導入，序列化時帶上結構以便在其他進程中重建
+        values = tuple(getattr(self, field) for field in self.fields)
+        return (_restore_record, (type(self).__name__, self.content, self.keys, values, self.extra, self.absent))
+
+
+def record_class(name, content, keys):
+    """返回 (必要時生成) 指定結構的記錄類型"""
+    keys = tuple(keys)
+    cls = _RECORD_CLASSES.get((name, keys))
+    if cls is not None:
+        return cls
+
+    fields = []
+    for key in keys:
+        field = field_name(key)
+        while field in fields or field in ("extra", "absent", "content", "keys", "fields", "get", "to_dict"):
+            field += "_"
+        fields.append(field)
+
+    # 為每個類型生成直接賦值的 __init__ (比逐個setattr快，字段名已轉換為合法標識符)
+    source = (f"def __init__(self, {''.join(f + '=None, ' for f in fields)}extra=None, absent=None):\n"
+              + "".join(f"    self.{f} = {f}\n" for f in fields)
+              + "    self.extra = extra\n"
+              + "    self.absent = absent\n")
+    namespace = {}
+    exec(source, namespace)
+
+    cls = type(name, (PayloadRecord,), {
+        "__slots__": tuple(fields),
+        "__init__": namespace["__init__"],
+        "content": content,
+        "keys": keys,
+        "fields": tuple(fields),
+        "_field_by_key": dict(zip(keys, fields))
+    })
+    _RECORD_CLASSES[(name, keys)] = cls
+    return cls
+
+
+def _restore_record(name, content, keys, values, extra, absent=None):
+    return record_class(name, content, keys)(*values, extra=extra, absent=absent)
+
+
+def _absent_keys(keys, data):
+    """消息中缺少的規格鍵 (frozenset)，全部都有時返回None"""
+    return frozenset(key for key in keys if key not in data) or None
+
+
+def _merge_samples(samples):
+    """合併同一種消息的多個示例: 鍵按第一次出現的順序取並集，嵌套的固定結構字典同樣合併"""
+    keys = []
+    nested = {}
+    for sample in samples:
+        for key, value in sample.items():
+            if key not in keys:
+                keys.append(key)
+            # 只有值全是標量的字典才視為固定結構 (例如position)；
+            # 以設備ID為鍵的字典 (例如ble scanned node的ANCHOR) 保持為普通字典
+            if isinstance(value, dict) and value and not any(isinstance(v, (dict, list)) for v in value.values()):
+                nested.setdefault(key, []).append(value)
+    return keys, nested
+
+
+def build_decoder(name, content, samples):
+    """
+    由示例消息生成解碼函數 decoder(data) -> 記錄
+    鍵的取值使用 map(data.get, keys)，只有消息中出現規格以外的鍵時才建立extra字典，
+    只有消息的鍵與規格不完全一致時才計算缺少的鍵 (absent)
+    """
+    keys, nested = _merge_samples(samples)
+    keys = [key for key in keys if key != "content"]
+    cls = record_class(name, content, keys)
+    key_set = frozenset(keys) | {"content"}
+    full = len(key_set)
+    get_extra = lambda data: {k: v for k, v in data.items() if k not in key_set} or None
+
+    if not nested:
+        def decoder(data):
+            if key_set.issuperset(data):
+                if len(data) == full:
+                    return cls(*map(data.get, keys))
+                return cls(*map(data.get, keys), absent=_absent_keys(keys, data))
+            return cls(*map(data.get, keys), extra=get_extra(data), absent=_absent_keys(keys, data))
+        return decoder
+
+    # 嵌套字段: 在位置上替換為子記錄的解碼結果
+    sub_decoders = {}
+    for key, sub_samples in nested.items():
+        sub_keys, _ = _merge_samples(sub_samples)
+        sub_cls = record_class(f"{name}{class_name(key)}", None, sub_keys)
+        sub_set = frozenset(sub_keys)
+
+        def sub_decoder(value, sub_cls=sub_cls, sub_keys=sub_keys, sub_set=sub_set):
+            if not isinstance(value, dict):
+                return value
+            if sub_set.issuperset(value):
+                if len(value) == len(sub_set):
+                    return sub_cls(*map(value.get, sub_keys))
+                return sub_cls(*map(value.get, sub_keys), absent=_absent_keys(sub_keys, value))
+            return sub_cls(*map(value.get, sub_keys),
+                           extra={k: v for k, v in value.items() if k not in sub_set},
+                           absent=_absent_keys(sub_keys, value))
+        sub_decoders[keys.index(key)] = sub_decoder
+    nested_positions = tuple(sub_decoders.items())
+
+    def decoder(data):
+        values = list(map(data.get, keys))
+        for position, sub_decoder in nested_positions:
+            if values[position] is not None:
+                values[position] = sub_decoder(values[position])
+        if key_set.issuperset(data):
+            if len(data) == full:
+                return cls(*values)
+            return cls(*values, absent=_absent_keys(keys, data))
+        return cls(*values, extra=get_extra(data), absent=_absent_keys(keys, data))
+    return decoder
+
+
+class DecoderRegistry:
+    """
+    content -> 解碼器 的分派表
+
+    參數:
+        catalog (MessageCatalog): 規格目錄，每種 (主題模板, content) 生成一個記錄類型，
+            None表示沒有規格 (所有消息原樣返回)
+    """
+
+    def __init__(self, catalog):
+        samples = {}
+        for entry in (catalog.entries if catalog is not None else ()):
+            if isinstance(entry.content, str):
+                samples.setdefault((entry.topic, entry.content), []).append(entry.payload)
+
+        self.decoders = {}
+        self.by_content = {}
+        for (template, content), payloads in samples.items():
+            decoder = build_decoder(class_name(content), content, payloads)
+            self.decoders[(template, content)] = decoder
+            self.by_content.setdefault(content, decoder)
+        self._templates = {}
+
+    @property
+    def contents(self):
+        return list(self.by_content)
+
+    def template(self, topic):
+        """主題 -> 模板 (結果按主題緩存)"""
+        template = self._templates.get(topic)
+        if template is None:
+            template = self._templates[topic] = topic_template(topic)
+        return template
+
+    def decoder_for(self, topic, content):
+        """返回解碼器，主題模板不符時按content查找，未知的content返回None"""
+        decoder = self.decoders.get((self.template(topic), content))
+        if decoder is None:
+            decoder = self.by_content.get(content)
+        return decoder
+
+    def decode(self, topic, data):
+        """
+        把已解析的JSON轉換為記錄
+
+        返回:
+            PayloadRecord: 已知content的消息；其他消息 (未知content、content不是字符串、非字典) 原樣返回
+        """
+        if not isinstance(data, dict):
+            return data
+        content = data.get("content")
+        if not isinstance(content, str):
+            return data
+        decoder = self.decoder_for(topic, content)
+        if decoder is None:
+            return data
+        return decoder(data)
+
+    def decode_bytes(self, topic, payload):
+        """解析JSON並解碼，非JSON負載返回None"""
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return None
+        return self.decode(topic, data)
+
+
+def content_of(data):
+    """返回消息的content (記錄或字典)，非字典消息或content不是字符串時返回None"""
+    if isinstance(data, PayloadRecord):
+        return data.content
+    if isinstance(data, dict):
+        content = data.get("content")
+        return content if isinstance(content, str) else None
+    return None
+
+
+def as_dict(data):
+    """記錄轉換為字典，其他值原樣返回 (用於JSON輸出)"""
+    return data.to_dict() if isinstance(data, PayloadRecord) else data
+
+
+_default_registry = None
+
+
+def load_registry(spec_path=None, use_cache=True):
+    """
+    載入規格目錄並建立解碼分派表，同一進程中默認規格只載入一次
+    規格無法讀取時 (load_catalog 已打印錯誤) 返回空的分派表，所有消息原樣返回不解碼
+
+    參數:
+        spec_path (str, optional): 規格JSON路徑，默認為 DEFAULT_SPEC_PATH
+    """
+    global _default_registry
+    if spec_path is None or spec_path == DEFAULT_SPEC_PATH:
+        if _default_registry is None:
+            _default_registry = _build_registry(DEFAULT_SPEC_PATH, use_cache)
+        return _default_registry
+    return _build_registry(spec_path, use_cache)
+
+
+def _build_registry(spec_path, use_cache):
+    catalog = load_catalog(spec_path, use_cache)
+    if catalog is None:
+        print(f"警告: 規格 {spec_path} 不可用，消息將不解碼，按原始JSON處理")
+        return DecoderRegistry(None)
+    return DecoderRegistry(catalog)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MQTT接收隊列和工作池
+paho的 on_message 在網絡線程中執行，處理太慢會拖延PINGRESP和QoS 1確認，
+導致keepalive超時被伺服器斷開。ReceiveQueue 的 on_message 只把
+(主題, 負載, 接收時間) 放入有界隊列，解碼、路由和輸出都在工作線程/進程中完成
+
+    handler(topic, payload, received_at)  在工作線程/進程中執行，返回值不為None時交給 on_result
+                                          (with_qos=True 時為 handler(topic, payload, received_at, qos))
+    on_result(result)                     在當前進程中串行執行 (同一時間只有一個調用)
+
+進程模式下 handler 必須是模組頂層函數；on_result 總是在主進程中執行，
+適合放需要共享狀態的步驟 (統計、電子圍欄、寫入數據庫等)
+工作進程不能依賴主進程的全局變量 (spawn/forkserver啟動時不會繼承)，
+需要的狀態由 initializer(*initargs) 在每個工作進程啟動時建立
+
+隊列滿時丟棄新消息並計數，網絡線程永遠不會阻塞
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+
+# 工作進程向主進程報告統計的間隔 (秒)
+PROCESS_STATS_INTERVAL = 0.5
+WORKER_MODES = ("thread", "process")
+
+_STOP = None
+
+
+class _WorkerStats:
+    """單個工作者的處理統計 (只由該工作者寫入，讀取時匯總)"""
+    __slots__ = ("processed", "errors", "lag_sum", "lag_max")
+
+    def __init__(self):
+        self.processed = 0
+        self.errors = 0
+        self.lag_sum = 0.0
+        self.lag_max = 0.0
+
+    def record(self, lag, ok=True):
+        self.processed += 1
+        if not ok:
+            self.errors += 1
+        self.lag_sum += lag
+        if lag > self.lag_max:
+            self.lag_max = lag
+
+
+def _process_worker(handler, work_queue, result_queue, initializer=None, initargs=()):
+    # 工作進程: 執行handler，把結果和統計送回主進程
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer(*initargs)
+
+    stats = _WorkerStats()
+    next_report = time.monotonic() + PROCESS_STATS_INTERVAL
+    while True:
+        try:
+            item = work_queue.get(timeout=PROCESS_STATS_INTERVAL)
+        except queue.Empty:
+            item = False
+        if item is _STOP:
+            break
+        if item:
+            received_at = item[2]
+            ok = True
+            try:
+                result = handler(*item)
+                if result is not None:
+                    result_queue.put(("result", result))
+            except Exception as e:
+                ok = False
+                print(f"接收工作進程處理消息時出錯: {e}")
+            stats.record(time.time() - received_at, ok)
+
+        if time.monotonic() >= next_report and stats.processed:
+            result_queue.put(("stats", stats.processed, stats.errors, stats.lag_sum, stats.lag_max))
+            stats = _WorkerStats()
+            next_report = time.monotonic() + PROCESS_STATS_INTERVAL
+
+    result_queue.put(("stats", stats.processed, stats.errors, stats.lag_sum, stats.lag_max))
+    result_queue.put(("done",))
+
+
+class ReceiveQueue:
+    """
+    有界接收隊列和工作池
+
+    參數:
+        handler (callable): handler(topic, payload, received_at)，在工作者中執行
+        on_result (callable, optional): 處理handler的返回值，串行執行
+        workers (int): 工作線程/進程數
+        maxsize (int): 隊列容量，滿時丟棄新消息
+        mode (str): "thread" 或 "process"
+        initializer (callable, optional): 進程模式下每個工作進程啟動時調用 initializer(*initargs)，
+            必須是模組頂層函數
+        initargs (tuple): initializer的參數
+        with_qos (bool): 是否把消息的QoS作為handler的第四個參數
+    """
+
+    def __init__(self, handler, on_result=None, workers=1, maxsize=10000, mode="thread",
+                 initializer=None, initargs=(), with_qos=False):
+        if mode not in WORKER_MODES:
+            raise ValueError(f"未知的工作模式: {mode}")
+        self.handler = handler
+        self.on_result = on_result
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.mode = mode
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self.with_qos = with_qos
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._result_lock = threading.Lock()
+        self._threads = []
+        self._processes = []
+        self._thread_stats = []
+        # 進程模式下由收集線程累計的統計
+        self._process_stats = _WorkerStats()
+        self._collector = None
+        self._done = 0
+
+        if mode == "thread":
+            self._queue = queue.Queue(maxsize)
+        else:
+            self._queue = multiprocessing.Queue(maxsize)
+            self._results = multiprocessing.Queue()
+
+    # ---------- 網絡線程 ----------
+
+    def on_message(self, client, userdata, msg):
+        """作為paho的on_message回調: 只入隊，不解析"""
+        self.put(msg.topic, msg.payload, qos=msg.qos)
+
+    def put(self, topic, payload, received_at=None, qos=0):
+        item = (topic, payload, time.time() if received_at is None else received_at)
+        if self.with_qos:
+            item += (qos,)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        if self.mode == "thread":
+            depth = self._queue.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    # ---------- 工作者 ----------
+
+    def _deliver(self, result):
+        if result is not None and self.on_result:
+            with self._result_lock:
+                self.on_result(result)
+
+    def _thread_worker(self, stats):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            received_at = item[2]
+            ok = True
+            try:
+                self._deliver(self.handler(*item))
+            except Exception as e:
+                ok = False
+                print(f"接收工作線程處理消息時出錯: {e}")
+            stats.record(time.time() - received_at, ok)
+
+    def _collect_results(self):
+        # 進程模式: 在主進程中接收工作進程的結果和統計
+        while self._done < len(self._processes):
+            message = self._results.get()
+            kind = message[0]
+            if kind == "result":
+                try:
+                    self._deliver(message[1])
+                except Exception as e:
+                    print(f"處理接收結果時出錯: {e}")
+            elif kind == "stats":
+                _, processed, errors, lag_sum, lag_max = message
+                s = self._process_stats
+                s.processed += processed
+                s.errors += errors
+                s.lag_sum += lag_sum
+                s.lag_max = max(s.lag_max, lag_max)
+            elif kind == "done":
+                self._done += 1
+
+    def start(self):
+        if self.mode == "thread":
+            for i in range(self.workers):
+                stats = _WorkerStats()
+                self._thread_stats.append(stats)
+                t = threading.Thread(target=self._thread_worker, args=(stats,),
+                                     name=f"receive-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        else:
+            for i in range(self.workers):
+                p = multiprocessing.Process(target=_process_worker,
+                                            args=(self.handler, self._queue, self._results,
+                                                  self.initializer, self.initargs), daemon=True)
+                p.start()
+                self._processes.append(p)
+            self._collector = threading.Thread(target=self._collect_results, name="receive-collector", daemon=True)
+            self._collector.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """停止工作者: 先處理完隊列中已有的消息 (最多等待timeout秒)"""
+        deadline = time.monotonic() + timeout
+        for _ in range(self.workers):
+            try:
+                self._queue.put(_STOP, timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.1, deadline - time.monotonic()))
+        for p in self._processes:
+            p.join(max(0.1, deadline - time.monotonic()))
+        if self._collector:
+            self._collector.join(max(0.1, deadline - time.monotonic()))
+        for p in self._processes:
+            if p.is_alive():
+                p.terminate()
+
+    # ---------- 統計 ----------
+
+    def stats(self):
+        """返回背壓統計: 隊列深度、丟棄數、已處理數、處理延遲 (接收到處理完成)"""
+        if self.mode == "thread":
+            parts = self._thread_stats
+        else:
+            parts = [self._process_stats]
+        processed = sum(s.processed for s in parts)
+        lag_sum = sum(s.lag_sum for s in parts)
+        if self.mode == "thread":
+            depth = self._queue.qsize()
+        else:
+            # 進程模式以入隊數減已處理數估算 (macOS上的multiprocessing.Queue不支持qsize)
+            depth = max(0, self.enqueued - processed)
+            self.max_depth = max(self.max_depth, depth)
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "processed": processed,
+            "errors": sum(s.errors for s in parts),
+            "lag_avg": lag_sum / processed if processed else 0.0,
+            "lag_max": max((s.lag_max for s in parts), default=0.0)
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"[隊列] 深度 {s['depth']}/{s['capacity']} (最高 {s['max_depth']}), "
+                f"已處理 {s['processed']}, 丟棄 {s['dropped']}, 錯誤 {s['errors']}, "
+                f"延遲 平均 {s['lag_avg'] * 1000:.1f}ms 最大 {s['lag_max'] * 1000:.1f}ms")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模擬器的按用戶歷史記錄: 固定容量的環形緩衝，按列存儲在NumPy數組中
+
+每條記錄是 ts (int64, Unix毫秒) 加上若干數值列，追加和淘汰最舊記錄都是O(1)，
+不為每條記錄建立字典、datetime或格式化字符串 (只在發送時格式化)
+
+    store = HistoryStore(1000, temperature="f8", room_temp="f8")
+    store.append("E001", now_ms(), temperature=36.6, room_temp=24.1)
+    store["E001"].column("temperature")     # 按時間順序的體溫數組
+    store["E001"][-1]                       # 最新一條: {"ts": ..., "temperature": ..., "room_temp": ...}
+"""
+
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+def now_ms():
+    """當前時間 (Unix毫秒)"""
+    return time.time_ns() // 1_000_000
+
+
+def to_ms(when):
+    """datetime (本地時間) 轉為Unix毫秒"""
+    return int(when.timestamp() * 1000)
+
+
+def format_ms(ts, fmt="%Y-%m-%d %H:%M:%S"):
+    """Unix毫秒格式化為本地時間字符串"""
+    return datetime.fromtimestamp(ts / 1000).strftime(fmt)
+
+
+class RingHistory:
+    """
+    一個序列的環形緩衝，容量滿後新記錄覆蓋最舊的記錄
+
+    參數:
+        capacity (int): 最多保存的記錄數
+        columns (dict): 列名 -> NumPy dtype (ts列自動添加)
+    """
+
+    __slots__ = ("capacity", "names", "arrays", "_start", "_size")
+
+    def __init__(self, capacity, columns):
+        if capacity <= 0:
+            raise ValueError("容量必須大於0")
+        self.capacity = capacity
+        self.names = ("ts",) + tuple(columns)
+        self.arrays = {"ts": np.zeros(capacity, dtype=np.int64)}
+        for name, dtype in columns.items():
+            self.arrays[name] = np.zeros(capacity, dtype=dtype)
+        self._start = 0
+        self._size = 0
+
+    @classmethod
+    def from_columns(cls, ts, capacity=None, **columns):
+        """由按時間排序的列批量建立 (capacity默認為記錄數，超出容量時只保留最新的記錄)"""
+        ts = np.asarray(ts, dtype=np.int64)
+        ring = cls(capacity or max(len(ts), 1),
+                   {name: np.asarray(values).dtype for name, values in columns.items()})
+        ring.extend(ts, **columns)
+        return ring
+
+    def __len__(self):
+        return self._size
+
+    def _physical(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("歷史記錄索引超出範圍")
+        return (self._start + index) % self.capacity
+
+    def __getitem__(self, index):
+        """按時間順序取一條記錄 (0為最舊，-1為最新)，返回 {列名: Python值}"""
+        slot = self._physical(index)
+        return {name: self.arrays[name][slot].item() for name in self.names}
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield self[index]
+
+    def append(self, ts, **values):
+        """追加一條記錄，未指定的列寫0"""
+        capacity = self.capacity
+        if self._size < capacity:
+            slot = (self._start + self._size) % capacity
+            self._size += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % capacity
+        arrays = self.arrays
+        arrays["ts"][slot] = ts
+        for name in self.names[1:]:
+            arrays[name][slot] = values.get(name, 0)
+
+    def extend(self, ts, **columns):
+        """批量追加按時間排序的記錄 (數組)，超出容量的舊記錄被淘汰"""
+        ts = np.asarray(ts, dtype=np.int64)
+        n = len(ts)
+        if n == 0:
+            return
+        capacity = self.capacity
+        if n >= capacity:
+            # 只保留最後capacity條，重新從位置0開始
+            for name in self.names:
+                source = ts if name == "ts" else columns.get(name, 0)
+                self.arrays[name][:] = np.broadcast_to(source, (n,))[n - capacity:]
+            self._start = 0
+            self._size = capacity
+            return
+        end = (self._start + self._size) % capacity
+        first = min(n, capacity - end)
+        for name in self.names:
+            source = np.broadcast_to(ts if name == "ts" else columns.get(name, 0), (n,))
+            array = self.arrays[name]
+            array[end:end + first] = source[:first]
+            array[:n - first] = source[first:]
+        overflow = max(0, self._size + n - capacity)
+        self._start = (self._start + overflow) % capacity
+        self._size = min(capacity, self._size + n)
+
+    def column(self, name):
+        """按時間順序返回一列 (沒有繞回時為視圖，否則為拷貝)"""
+        array = self.arrays[name]
+        end = self._start + self._size
+        if end <= self.capacity:
+            return array[self._start:end]
+        return np.concatenate((array[self._start:], array[:end - self.capacity]))
+
+    def last(self, n):
+        """最新的n條記錄的各列 {列名: 數組}"""
+        n = min(n, self._size)
+        return {name: self.column(name)[self._size - n:] for name in self.names}
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+
+class HistoryStore:
+    """
+    按用戶 (或設備) 的歷史記錄集合，第一次追加時建立該用戶的環形緩衝
+
+    參數:
+        capacity (int): 每個用戶的默認容量
+        columns: 列名=dtype，例如 temperature="f8"
+    """
+
+    def __init__(self, capacity, **columns):
+        self.capacity = capacity
+        self.columns = columns
+        self.series = {}
+
+    def history(self, key):
+        """返回用戶的環形緩衝，不存在時建立"""
+        ring = self.series.get(key)
+        if ring is None:
+            ring = self.series[key] = RingHistory(self.capacity, self.columns)
+        return ring
+
+    def append(self, key, ts, **values):
+        self.history(key).append(ts, **values)
+
+    def get(self, key, default=None):
+        return self.series.get(key, default)
+
+    def __getitem__(self, key):
+        return self.series[key]
+
+    def __setitem__(self, key, ring):
+        """替換為另一個環形緩衝 (例如批量生成的歷史，容量可以大於默認值)"""
+        self.series[key] = ring
+
+    def __contains__(self, key):
+        return key in self.series
+
+    def __len__(self):
+        return len(self.series)
+
+    def items(self):
+        return self.series.items()
+
+    def clear(self):
+        self.series.clear()
+
+    @property
+    def nbytes(self):
+        return sum(ring.nbytes for ring in self.series.values())
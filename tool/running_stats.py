@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模擬器統計線程用的按用戶增量統計
+每個樣本在產生時O(1)更新 (樣本數、平均、最低/最高、異常次數、最近N個樣本的平均)，
+統計線程只讀取快照，不再每分鐘重新掃描全部歷史
+"""
+
+import threading
+from collections import deque
+
+# 默認的滑動窗口大小 (樣本數) 和保留的最近異常值數量
+DEFAULT_WINDOW = 10
+DEFAULT_RECENT_ABNORMAL = 5
+# 每隔多少個樣本重新計算一次窗口和，避免浮點誤差累積
+_RESUM_INTERVAL = 4096
+
+
+class RunningStats:
+    """
+    一個序列的增量統計
+
+    參數:
+        window (int): 滑動平均的樣本數
+        recent_abnormal (int): 保留的最近異常值數量
+    """
+
+    __slots__ = ("count", "total", "min", "max", "last", "abnormal", "window", "window_sum", "recent_abnormal")
+
+    def __init__(self, window=DEFAULT_WINDOW, recent_abnormal=DEFAULT_RECENT_ABNORMAL):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.abnormal = 0
+        self.window = deque(maxlen=window)
+        self.window_sum = 0.0
+        self.recent_abnormal = deque(maxlen=recent_abnormal)
+
+    def add(self, value, abnormal=False):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        window = self.window
+        if len(window) == window.maxlen:
+            self.window_sum -= window[0]
+        window.append(value)
+        self.window_sum += value
+        if self.count % _RESUM_INTERVAL == 0:
+            self.window_sum = sum(window)
+        if abnormal:
+            self.abnormal += 1
+            self.recent_abnormal.append(value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def window_mean(self):
+        return self.window_sum / len(self.window) if self.window else 0.0
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "last": self.last,
+            "abnormal": self.abnormal,
+            "window_mean": self.window_mean,
+            "recent_abnormal": list(self.recent_abnormal)
+        }
+
+
+class StatsRegistry:
+    """
+    按用戶ID的增量統計和 ID -> 用戶名 索引 (線程安全: 發送線程更新，統計線程讀快照)
+
+    參數:
+        window (int): 滑動平均的樣本數
+        recent_abnormal (int): 每個用戶保留的最近異常值數量
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, recent_abnormal=DEFAULT_RECENT_ABNORMAL):
+        self.window = window
+        self.recent_abnormal = recent_abnormal
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.names = {}
+
+    def register_users(self, users, id_key="id", name_key="name"):
+        """建立 ID -> 用戶名 索引"""
+        with self.lock:
+            for user in users:
+                self.names[user[id_key]] = user.get(name_key, user[id_key])
+
+    def add(self, key, value, abnormal=False):
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = RunningStats(self.window, self.recent_abnormal)
+            stats.add(value, abnormal)
+
+    def name(self, key, default=None):
+        return self.names.get(key, key if default is None else default)
+
+    def snapshot(self):
+        """返回 [(ID, 用戶名, 統計字典)]，按第一次出現的順序"""
+        with self.lock:
+            return [(key, self.names.get(key, key), stats.snapshot()) for key, stats in self.stats.items()]
+
+    def clear(self):
+        with self.lock:
+            self.stats.clear()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+接收數據的本地時間序列存儲 (SQLite, WAL模式)
+location、300B健康、尿布和體溫消息拆分為 (設備, 指標, 時間, 數值) 樣本，
+先在內存中緩衝，每批在一個事務中寫入，避免逐條插入跟不上接收速度
+
+表結構:
+    series  (id, device, metric)   每個設備的每個指標一行，(device, metric) 唯一
+    samples (series, ts, value)    按 (series, ts) 建立索引，時間範圍查詢只掃描對應的序列
+
+查詢:
+    python telemetry_store.py telemetry.db                       列出所有序列
+    python telemetry_store.py telemetry.db -d E001 -m x --start "2025-03-01 08:00" --end "2025-03-01 09:00"
+"""
+
+import argparse
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# 各類消息的設備ID字段和要保存的指標: 指標名 -> 鍵 或 (鍵, 子鍵)
+CONTENT_METRICS = {
+    "location": ("id", {
+        "x": ("position", "x"),
+        "y": ("position", "y"),
+        "z": ("position", "z"),
+        "quality": ("position", "quality")
+    }),
+    "300B": ("MAC", {
+        "hr": "hr",
+        "spo2": "SpO2",
+        "bp_syst": "bp syst",
+        "bp_diast": "bp diast",
+        "skin_temp": "skin temp",
+        "room_temp": "room temp",
+        "steps": "steps",
+        "battery_level": "battery level"
+    }),
+    "diaper DV1": ("MAC", {
+        "temp": "temp",
+        "humi": "humi",
+        "button": "button",
+        "battery_level": "battery level"
+    }),
+    "temperature": ("id", {
+        "skin_temp": ("temperature", "value"),
+        "room_temp": ("temperature", "room_temp")
+    })
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    content TEXT,
+    UNIQUE (device, metric)
+);
+CREATE INDEX IF NOT EXISTS series_metric ON series (metric);
+CREATE TABLE IF NOT EXISTS samples (
+    series INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS samples_series_ts ON samples (series, ts);
+"""
+
+# 默認批量大小和最長緩衝時間 (秒)
+DEFAULT_BATCH_SIZE = 20000
+DEFAULT_FLUSH_INTERVAL = 1.0
+# SQLite頁緩存大小 (KB)
+CACHE_SIZE_KB = 65536
+
+
+def _number(value):
+    """轉換為數值，布爾值轉為0/1，無法轉換時返回None"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_samples(message):
+    """
+    從消息 (字典或payload_decoders的記錄) 中取出樣本
+
+    返回:
+        tuple: (content, 設備ID, [(指標, 數值), ...])，不保存的消息返回None
+    """
+    if message is None or not hasattr(message, "get"):
+        return None
+    content = message.get("content")
+    spec = CONTENT_METRICS.get(content) if isinstance(content, str) else None
+    if spec is None:
+        return None
+    device_key, metrics = spec
+    device = message.get(device_key)
+    if device is None:
+        return None
+
+    samples = []
+    for metric, path in metrics.items():
+        if isinstance(path, tuple):
+            parent = message.get(path[0])
+            value = parent.get(path[1]) if parent is not None and hasattr(parent, "get") else None
+        else:
+            value = message.get(path)
+        value = _number(value)
+        if value is not None:
+            samples.append((metric, value))
+    return message.get("content"), str(device), samples
+
+
+def parse_time(text):
+    """解析查詢時間: Unix時間戳或 "YYYY-mm-dd[ HH:MM[:SS]]" 格式的本地時間"""
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"無法解析時間: {text}")
+
+
+class TelemetryStore:
+    """
+    批量寫入的時間序列存儲
+
+    參數:
+        path (str): SQLite數據庫路徑
+        batch_size (int): 緩衝的樣本數達到此值時寫入
+        flush_interval (float): 緩衝超過此時間 (秒) 時寫入，由 add 或 maybe_flush 觸發
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # add 在接收工作線程中調用，maybe_flush/close 在主線程中調用
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # 索引頁保持在緩存中，批量提交時不必反覆讀寫 (默認只有2MB)
+        self.conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+        self.series = {(device, metric): series_id for series_id, device, metric
+                       in self.conn.execute("SELECT id, device, metric FROM series")}
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.messages = 0
+        self.written = 0
+        self.batches = 0
+
+    def _series_id(self, device, metric, content):
+        key = (device, metric)
+        series_id = self.series.get(key)
+        if series_id is None:
+            cursor = self.conn.execute("INSERT INTO series (device, metric, content) VALUES (?, ?, ?)",
+                                       (device, metric, content))
+            series_id = self.series[key] = cursor.lastrowid
+        return series_id
+
+    def add(self, message, received_at=None):
+        """
+        緩衝一條消息的樣本，返回是否保存 (不支持的消息類型返回False)
+        """
+        extracted = extract_samples(message)
+        if extracted is None:
+            return False
+        content, device, samples = extracted
+        ts = time.time() if received_at is None else received_at
+        with self.lock:
+            for metric, value in samples:
+                self.pending.append((self._series_id(device, metric, content), ts, value))
+            self.messages += 1
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+        return True
+
+    def _flush(self):
+        if self.pending:
+            # 按序列排序後插入，(series, ts) 索引的寫入集中在相鄰的頁
+            self.pending.sort()
+            with self.conn:
+                self.conn.executemany("INSERT INTO samples (series, ts, value) VALUES (?, ?, ?)", self.pending)
+            self.written += len(self.pending)
+            self.batches += 1
+            self.pending = []
+        else:
+            # 新建的序列也需要提交
+            self.conn.commit()
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        """立即寫入所有緩衝的樣本"""
+        with self.lock:
+            self._flush()
+
+    def maybe_flush(self):
+        """緩衝時間超過 flush_interval 時寫入 (由主循環定期調用，低流量時數據也能及時落盤)"""
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.conn.close()
+
+    # ---------- 查詢 ----------
+
+    def list_series(self, device=None, metric=None):
+        """返回 [(device, metric, content, 樣本數, 最早時間, 最晚時間)]"""
+        sql = ("SELECT s.device, s.metric, s.content, COUNT(*), MIN(d.ts), MAX(d.ts) "
+               "FROM series s JOIN samples d ON d.series = s.id")
+        clauses, params = [], []
+        if device is not None:
+            clauses.append("s.device = ?")
+            params.append(device)
+        if metric is not None:
+            clauses.append("s.metric = ?")
+            params.append(metric)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " GROUP BY s.id ORDER BY s.device, s.metric"
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def query(self, device, metric, start=None, end=None):
+        """
+        查詢一個序列在 [start, end) 時間範圍內的樣本
+
+        返回:
+            list: [(ts, value), ...]，按時間排序
+        """
+        with self.lock:
+            self._flush()
+            series_id = self.series.get((device, metric))
+            if series_id is None:
+                return []
+            return self.conn.execute(
+                "SELECT ts, value FROM samples WHERE series = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (series_id, float("-inf") if start is None else start, float("inf") if end is None else end)
+            ).fetchall()
+
+    def query_metric(self, metric, start=None, end=None):
+        """查詢所有設備的同一指標，返回 [(device, ts, value), ...]"""
+        with self.lock:
+            self._flush()
+            return self.conn.execute(
+                "SELECT s.device, d.ts, d.value FROM series s JOIN samples d ON d.series = s.id "
+                "WHERE s.metric = ? AND d.ts >= ? AND d.ts < ? ORDER BY d.ts",
+                (metric, float("-inf") if start is None else start, float("inf") if end is None else end)
+            ).fetchall()
+
+    def summary(self):
+        return {
+            "messages": self.messages,
+            "samples": self.written + len(self.pending),
+            "series": len(self.series),
+            "batches": self.batches
+        }
+
+
+def _time_argument(text):
+    # argparse的type: 格式錯誤時報告為用法錯誤，而不是在打開數據庫之後拋出異常
+    try:
+        return parse_time(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢接收器保存的時間序列數據")
+    parser.add_argument("database", help="SQLite數據庫路徑 (mqtt_receiver_python.py --store)")
+    parser.add_argument("-d", "--device", help="設備ID (Tag ID或MAC)")
+    parser.add_argument("-m", "--metric", help="指標名稱，例如 x、hr、skin_temp")
+    parser.add_argument("--start", type=_time_argument, help="開始時間 (Unix時間戳或 YYYY-mm-dd HH:MM[:SS])")
+    parser.add_argument("--end", type=_time_argument, help="結束時間 (不含)")
+    parser.add_argument("--limit", type=int, default=50, help="最多顯示的樣本數 (0表示全部)")
+    args = parser.parse_args()
+
+    store = TelemetryStore(args.database)
+    try:
+        if args.device and args.metric:
+            rows = store.query(args.device, args.metric, args.start, args.end)
+            print(f"{args.device} {args.metric}: {len(rows)} 個樣本")
+            for ts, value in rows[:args.limit] if args.limit else rows:
+                print(f"  {datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}  {value:g}")
+        else:
+            for device, metric, content, count, first, last in store.list_series(args.device, args.metric):
+                print(f"{device:<20} {metric:<14} {content or '':<12} {count:>10} 個樣本  "
+                      f"{datetime.fromtimestamp(first).strftime('%Y-%m-%d %H:%M:%S')} ~ "
+                      f"{datetime.fromtimestamp(last).strftime('%Y-%m-%d %H:%M:%S')}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UWB協議消息目錄
+將 excel_to_json.py 產生的 UWB_JSON 規格文件一次性編譯成索引，
+之後按 sheet、消息標題、content 或主題模板查詢都是字典查找，不需要重新解析
+
+編譯結果會緩存到JSON旁邊的二進制文件 (<json>.cache)，
+以源文件的大小、修改時間和SHA-256為鍵，規格更新後自動重建
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+# 規格文件中的欄位名稱 (由pandas為無標題的列自動命名)
+TITLE_COLUMN = "Unnamed: 0"
+BODY_COLUMN = "Unnamed: 1"
+TOPIC_MARKER = "Topic:"
+
+# 緩存格式版本，修改目錄結構時需要遞增
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".cache"
+
+
+# 從字符串中提取JSON對象
+def extract_json_from_string(json_str):
+    try:
+        # 尋找JSON開始和結束的位置
+        start = json_str.find('{')
+        end = json_str.rfind('}') + 1
+        if start >= 0 and end > start:
+            json_content = json_str[start:end]
+            return json.loads(json_content)
+        else:
+            return None
+    except json.JSONDecodeError:
+        return None
+
+
+class CatalogEntry:
+    """規格文件中的一條示例消息 (JSON已解析)"""
+    __slots__ = ("sheet", "title", "content", "topic", "payload", "row")
+
+    def __init__(self, sheet, title, content, topic, payload, row):
+        self.sheet = sheet
+        self.title = title
+        self.content = content
+        self.topic = topic
+        self.payload = payload
+        self.row = row
+
+    def to_dict(self):
+        """轉換為 mqtt_sender 使用的消息字典格式"""
+        return {
+            "json": self.payload,
+            "topic": self.topic,
+            "sheet": self.sheet,
+            "title": self.title
+        }
+
+
+class MessageCatalog:
+    """
+    已編譯的消息目錄
+    - by_sheet: sheet名稱 -> 消息列表
+    - by_title: 消息標題 ("Unnamed: 0") -> 消息列表
+    - by_content: content字段 -> 消息列表
+    - by_topic: 主題模板 (例如 GWxxxx_Loca) -> 消息列表
+    """
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.entries = []
+        self.by_sheet = {}
+        self.by_title = {}
+        self.by_content = {}
+        self.by_topic = {}
+
+        for sheet_name, rows in sheets.items():
+            self.by_sheet[sheet_name] = []
+            self._compile_sheet(sheet_name, rows)
+
+    def _compile_sheet(self, sheet_name, rows):
+        # 單次遍歷: 記住最近出現的主題和標題，供後面的JSON行使用
+        current_topic = None
+        current_title = None
+
+        for row_index, row in enumerate(rows):
+            title = row.get(TITLE_COLUMN)
+            body = row.get(BODY_COLUMN)
+
+            if isinstance(title, str) and title.strip():
+                current_title = title.strip()
+
+            if not isinstance(body, str) or not body:
+                continue
+
+            if body.startswith(TOPIC_MARKER):
+                current_topic = body[len(TOPIC_MARKER):].strip()
+                continue
+
+            payload = extract_json_from_string(body)
+            if not isinstance(payload, dict):
+                continue
+
+            entry = CatalogEntry(
+                sheet_name,
+                current_title,
+                payload.get("content"),
+                current_topic,
+                payload,
+                row_index
+            )
+            self._add(entry)
+
+    def _add(self, entry):
+        self.entries.append(entry)
+        self.by_sheet[entry.sheet].append(entry)
+        if entry.title is not None:
+            self.by_title.setdefault(entry.title, []).append(entry)
+        if entry.content is not None:
+            self.by_content.setdefault(entry.content, []).append(entry)
+        if entry.topic is not None:
+            self.by_topic.setdefault(entry.topic, []).append(entry)
+
+    @property
+    def sheet_names(self):
+        return list(self.sheets.keys())
+
+    def messages(self, sheet_name):
+        """返回指定sheet中的所有消息"""
+        return self.by_sheet.get(sheet_name, [])
+
+    def find(self, content=None, topic=None, title=None, sheet=None):
+        """
+        按條件查找消息，使用最具選擇性的索引作為候選集，其餘條件再做過濾
+        """
+        if content is not None:
+            candidates = self.by_content.get(content, [])
+        elif title is not None:
+            candidates = self.by_title.get(title, [])
+        elif topic is not None:
+            candidates = self.by_topic.get(topic, [])
+        elif sheet is not None:
+            candidates = self.by_sheet.get(sheet, [])
+        else:
+            candidates = self.entries
+
+        return [
+            e for e in candidates
+            if (content is None or e.content == content)
+            and (topic is None or e.topic == topic)
+            and (title is None or e.title == title)
+            and (sheet is None or e.sheet == sheet)
+        ]
+
+    def first(self, content=None, topic=None, title=None, sheet=None):
+        """返回第一條符合條件的消息，找不到則返回None"""
+        found = self.find(content=content, topic=topic, title=title, sheet=sheet)
+        return found[0] if found else None
+
+
+def build_catalog(data):
+    """由已載入的規格JSON (sheet -> 行列表) 建立消息目錄"""
+    return MessageCatalog(data)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_key(path, with_hash=True):
+    st = os.stat(path)
+    return {
+        "version": CACHE_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": _file_sha256(path) if with_hash else None
+    }
+
+
+def cache_path_for(json_file_path):
+    return json_file_path + CACHE_SUFFIX
+
+
+def _read_cache(cache_path, json_file_path):
+    """
+    讀取緩存，返回 (catalog, header)；緩存不存在或已過期時返回 (None, None)
+    緩存文件由兩個連續的pickle組成: 先是小的header，再是目錄本身，
+    這樣只需讀header就能判斷是否有效
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict) or header.get("version") != CACHE_VERSION:
+                return None, None
+
+            key = _source_key(json_file_path, with_hash=False)
+            if header["size"] != key["size"]:
+                return None, None
+
+            # 大小和修改時間都相同時直接信任緩存，否則比對內容哈希
+            # (例如文件被touch或重新checkout，但內容沒有變化)
+            if header["mtime_ns"] != key["mtime_ns"]:
+                if header["sha256"] != _file_sha256(json_file_path):
+                    return None, None
+
+            return pickle.load(f), header
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError, AttributeError):
+        return None, None
+
+
+def _write_cache(cache_path, json_file_path, catalog):
+    header = _source_key(json_file_path)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # 原子替換，避免並發啟動時讀到寫了一半的緩存
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"警告: 無法寫入目錄緩存 {cache_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_spec_data(json_file_path):
+    """
+    讀取 excel_to_json.py 輸出的規格數據，返回 sheet -> 行列表
+    支持縮進/緊湊JSON，以及每行一條 {"sheet", "row"} 記錄的JSON Lines (.jsonl)
+    """
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        if not json_file_path.endswith(".jsonl"):
+            return json.load(f)
+
+        data = {}
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            rows = data.setdefault(record["sheet"], [])
+            if record["row"] is not None:
+                rows.append(record["row"])
+        return data
+
+
+def load_catalog(json_file_path, use_cache=True):
+    """
+    載入規格JSON並返回已編譯的消息目錄，優先使用二進制緩存
+    
+    參數:
+        json_file_path (str): UWB_JSON 規格文件路徑 (.json 或 .jsonl)
+        use_cache (bool): 是否讀寫 <json>.cache 緩存文件
+    
+    返回:
+        MessageCatalog: 消息目錄，讀取失敗時返回None
+    """
+    cache_path = cache_path_for(json_file_path)
+
+    if use_cache and os.path.exists(cache_path):
+        catalog, header = _read_cache(cache_path, json_file_path)
+        if catalog is not None:
+            # 內容未變但修改時間變了，刷新header以便下次直接命中
+            if header["mtime_ns"] != os.stat(json_file_path).st_mtime_ns:
+                _write_cache(cache_path, json_file_path, catalog)
+            return catalog
+
+    try:
+        data = load_spec_data(json_file_path)
+    except Exception as e:
+        print(f"錯誤: 無法讀取JSON文件: {e}")
+        return None
+
+    catalog = build_catalog(data)
+    if use_cache:
+        _write_cache(cache_path, json_file_path, catalog)
+    return catalog
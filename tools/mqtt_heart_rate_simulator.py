@@ -4,8 +4,11 @@ MQTT心率模擬器
 模擬多個用戶的心率數據並通過MQTT發送
 """
 
+import argparse
 import json
+import os
 import random
+import sys
 import time
 import threading
 from datetime import datetime, timedelta
@@ -13,6 +16,14 @@ from typing import Dict, List, Optional
 import paho.mqtt.client as mqtt
 import logging
 
+# 共用的發送模組位於 tool/ 目錄
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tool"))
+from mqtt_shard import run_sharded
+from latency_probe import CLOCKS, ProbeStamper
+from mqtt_async_engine import AsyncMqttEngine, DeviceModel, run_engine
+from ring_history import HistoryStore, format_ms, now_ms
+from running_stats import StatsRegistry
+
 # 配置日誌
 logging.basicConfig(
     level=logging.INFO,
@@ -45,10 +56,19 @@ HEART_RATE_RANGES = {
     "critical_high": 150
 }
 
+# 每個用戶保存的心率讀數數量
+HEART_RATE_HISTORY_SIZE = 100
+
 # 全局變量
 running = False
 client = None
-heart_rate_history = {}
+# 每個用戶的基礎心率
+base_heart_rates = {}
+# 每個用戶最近的心率讀數: 按列存儲的環形緩衝 (ts為Unix毫秒)
+heart_rate_history = HistoryStore(HEART_RATE_HISTORY_SIZE, heart_rate="i2", is_abnormal="?")
+# 每個用戶的增量統計 (含 ID -> 用戶名 索引)，統計線程只讀快照
+heart_rate_stats = StatsRegistry(window=10)
+heart_rate_stats.register_users(USERS)
 
 def setup_mqtt_client():
     """設置MQTT客戶端"""
@@ -133,6 +153,43 @@ def generate_heart_rate_data(user_id: str, base_heart_rate: Optional[int] = None
     
     return heart_rate
 
+def build_heart_rate_message(user: Dict[str, str]) -> Dict:
+    """
+    為指定用戶生成一筆心率讀數並構建MQTT消息
+    
+    Args:
+        user: 用戶信息字典
+    
+    Returns:
+        MQTT消息字典
+    """
+    # 獲取或生成基礎心率
+    base_heart_rate = base_heart_rates.get(user["id"])
+    if base_heart_rate is None:
+        base_heart_rate = base_heart_rates[user["id"]] = random.randint(65, 85)
+    
+    # 生成心率數據
+    heart_rate = generate_heart_rate_data(user["id"], base_heart_rate)
+    
+    # 更新歷史記錄 (環形緩衝只保留最近 HEART_RATE_HISTORY_SIZE 條)
+    timestamp = now_ms()
+    is_abnormal = (heart_rate < HEART_RATE_RANGES["low_threshold"] or
+                   heart_rate > HEART_RATE_RANGES["high_threshold"])
+    heart_rate_history.append(user["id"], timestamp, heart_rate=heart_rate, is_abnormal=is_abnormal)
+    heart_rate_stats.add(user["id"], heart_rate, is_abnormal)
+    
+    # 構建MQTT消息
+    return {
+        "type": "health",
+        "id": user["id"],
+        "name": user["name"],
+        "gateway_id": user["gateway_id"],
+        "heart_rate": heart_rate,
+        "temperature": random.uniform(36.0, 37.5),  # 同時發送溫度數據
+        "time": format_ms(timestamp),
+        "timestamp": timestamp
+    }
+
 def send_heart_rate_data(user: Dict[str, str]):
     """
     為指定用戶發送心率數據
@@ -141,46 +198,8 @@ def send_heart_rate_data(user: Dict[str, str]):
         user: 用戶信息字典
     """
     try:
-        # 獲取或生成基礎心率
-        if user["id"] not in heart_rate_history:
-            heart_rate_history[user["id"]] = {
-                "base_heart_rate": random.randint(65, 85),
-                "last_heart_rate": None,
-                "readings": []
-            }
-        
-        user_history = heart_rate_history[user["id"]]
-        
-        # 生成心率數據
-        heart_rate = generate_heart_rate_data(
-            user["id"], 
-            user_history["base_heart_rate"]
-        )
-        
-        # 更新歷史記錄
-        user_history["last_heart_rate"] = heart_rate
-        user_history["readings"].append({
-            "heart_rate": heart_rate,
-            "timestamp": datetime.now().isoformat(),
-            "is_abnormal": heart_rate < HEART_RATE_RANGES["low_threshold"] or 
-                          heart_rate > HEART_RATE_RANGES["high_threshold"]
-        })
-        
-        # 保持最近100條記錄
-        if len(user_history["readings"]) > 100:
-            user_history["readings"] = user_history["readings"][-100:]
-        
-        # 構建MQTT消息
-        message = {
-            "type": "health",
-            "id": user["id"],
-            "name": user["name"],
-            "gateway_id": user["gateway_id"],
-            "heart_rate": heart_rate,
-            "temperature": random.uniform(36.0, 37.5),  # 同時發送溫度數據
-            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "timestamp": int(datetime.now().timestamp() * 1000)
-        }
+        message = build_heart_rate_message(user)
+        heart_rate = message["heart_rate"]
         
         # 發送MQTT消息
         if client and client.is_connected():
@@ -195,20 +214,96 @@ def send_heart_rate_data(user: Dict[str, str]):
     except Exception as e:
         logger.error(f"發送心率數據時出錯: {e}")
 
+def make_users(count: int) -> List[Dict[str, str]]:
+    """
+    返回指定數量的用戶，前幾個為USERS中的固定用戶，其餘自動生成
+    
+    Args:
+        count: 用戶數量
+    
+    Returns:
+        用戶列表
+    """
+    users = [dict(u) for u in USERS[:count]]
+    for n in range(len(users) + 1, count + 1):
+        users.append({"id": f"user{n:03d}", "name": f"模擬用戶{n}", "gateway_id": "gateway001"})
+    return users
+
+def heart_rate_shard_worker(ctx, users: List[Dict[str, str]], options: Dict):
+    """
+    分片工作進程: 每輪為本分片的所有用戶各發送一筆心率數據，用戶之間不停頓
+    
+    Args:
+        ctx: mqtt_shard.ShardContext
+        users: 本分片負責的用戶
+        options: 發送設置 (interval 為每輪間隔秒數)
+    """
+    interval = options.get("interval", 30.0)
+    next_tick = time.monotonic()
+    
+    while not ctx.stopped():
+        for user in users:
+            ctx.publish(MQTT_TOPIC, json.dumps(build_heart_rate_message(user)), qos=MQTT_QOS)
+        next_tick += interval
+        if ctx.sleep(next_tick - time.monotonic()):
+            break
+
+class HeartRateDevice(DeviceModel):
+    """asyncio引擎中的一個心率設備"""
+    qos = MQTT_QOS
+    
+    def __init__(self, user: Dict[str, str], interval: float = 30.0):
+        self.user = user
+        self.name = user["name"]
+        self.interval = interval
+    
+    def tick(self):
+        return [(MQTT_TOPIC, build_heart_rate_message(self.user))]
+
+def run_async_simulation(users: List[Dict[str, str]], interval: float = 30.0, duration: float = 0,
+                         probe: Optional[str] = None):
+    """
+    以asyncio引擎運行: 所有用戶共用一個連接，各自按間隔發送，周期不隨用戶數增長
+    
+    Args:
+        users: 用戶列表
+        interval: 每個用戶的發送間隔 (秒)
+        duration: 運行時長 (秒)，0表示直到Ctrl+C
+        probe: 延遲探針的時鐘 ("mono"/"wall")，None表示不加探針
+    """
+    client_id = f"heart_rate_simulator_{random.randint(1000, 9999)}"
+    engine = AsyncMqttEngine(MQTT_BROKER, MQTT_PORT, client_id, label="心率模擬",
+                             probe=ProbeStamper(client_id, probe) if probe else None)
+    engine.add_devices(HeartRateDevice(user, interval) for user in users)
+    return run_engine(engine, duration)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MQTT心率模擬器")
+    parser.add_argument("-b", "--broker", default=MQTT_BROKER, help="MQTT伺服器地址")
+    parser.add_argument("-p", "--port", type=int, default=MQTT_PORT, help="MQTT伺服器端口")
+    parser.add_argument("--users", type=int, default=len(USERS), help="模擬的用戶數量")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="分片工作進程數，每個進程有自己的MQTT連接 (0表示單進程模式)")
+    parser.add_argument("--engine", choices=("loop", "async"), default="loop",
+                        help="單進程模式的發送方式: loop為原來的逐個用戶循環，async為共用的asyncio引擎")
+    parser.add_argument("--interval", type=float, default=30.0, help="分片/async模式下每個用戶的發送間隔 (秒)")
+    parser.add_argument("--probe", nargs="?", const="mono", choices=CLOCKS, default=None,
+                        help="分片/async模式下在每條消息中加入延遲探針 (發送時間和序號)，"
+                             "可指定時鐘: mono (同一台機器, 默認) 或 wall (跨機器, 需要NTP)")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="分片/async模式的運行時長 (秒, 0表示直到Ctrl+C)")
+    return parser.parse_args()
+
 def print_statistics():
     """打印心率統計信息"""
     while running:
         try:
             logger.info("=== 心率統計 ===")
-            for user_id, history in heart_rate_history.items():
-                if history["readings"]:
-                    recent_readings = [r["heart_rate"] for r in history["readings"][-10:]]
-                    avg_heart_rate = sum(recent_readings) / len(recent_readings)
-                    abnormal_count = sum(1 for r in history["readings"] if r["is_abnormal"])
-                    
-                    user_name = next((u["name"] for u in USERS if u["id"] == user_id), user_id)
-                    logger.info(f"{user_name}: 平均心率 {avg_heart_rate:.1f} bpm, "
-                              f"異常讀數 {abnormal_count}/{len(history['readings'])}")
+            # 只讀取增量統計的快照，不掃描歷史記錄
+            for user_id, user_name, stats in heart_rate_stats.snapshot():
+                logger.info(f"{user_name}: 平均心率 {stats['window_mean']:.1f} bpm "
+                          f"(全部 {stats['mean']:.1f}, {stats['min']}~{stats['max']}), "
+                          f"異常讀數 {stats['abnormal']}/{stats['count']}")
             
             time.sleep(60)  # 每分鐘打印一次統計
         except Exception as e:
@@ -217,8 +312,32 @@ def print_statistics():
 
 def main():
     """主函數"""
-    global running
+    global running, MQTT_BROKER, MQTT_PORT, USERS
+    
+    args = parse_args()
+    MQTT_BROKER = args.broker
+    MQTT_PORT = args.port
+    
+    if args.shards > 0:
+        logger.info(f"啟動MQTT心率模擬器 - {args.users} 個用戶, {args.shards} 個分片進程")
+        options = {
+            "broker": args.broker,
+            "port": args.port,
+            "client_id_prefix": "heart_rate_simulator",
+            "interval": args.interval,
+            "probe": args.probe
+        }
+        run_sharded(heart_rate_shard_worker, make_users(args.users), args.shards, options,
+                    duration=args.duration)
+        return
+    
+    if args.engine == "async":
+        logger.info(f"啟動MQTT心率模擬器 - {args.users} 個用戶, asyncio引擎")
+        run_async_simulation(make_users(args.users), args.interval, args.duration, args.probe)
+        return
     
+    USERS = make_users(args.users)
+    heart_rate_stats.register_users(USERS)
     logger.info("啟動MQTT心率模擬器...")
     
     # 設置MQTT客戶端